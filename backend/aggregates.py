@@ -0,0 +1,181 @@
+import hashlib
+
+import pandas as pd
+
+from hosts import HostIndex
+from serialize import encode_json
+
+# Dataset-wide aggregates for /api/stats and /api/advanced-analytics.
+# The frame is read-only once loaded, so everything here is computed a single
+# time per dataset version and served as pre-encoded JSON bytes.
+
+
+class DataUnavailable(Exception):
+    pass
+
+
+def dataset_fingerprint(df):
+    digest = hashlib.sha1()
+    digest.update(repr((df.shape, [str(c) for c in df.columns])).encode())
+    if len(df):
+        digest.update(pd.util.hash_pandas_object(df, index=False).values.tobytes())
+    return digest.hexdigest()[:16]
+
+
+def seasonal_multiplier(month):
+    return 1.2 if month in [6, 7, 8] else 1.1 if month == 12 else 0.9
+
+
+def _valid_prices(df, price_col):
+    valid_prices = df[price_col].dropna()
+    return valid_prices[(valid_prices >= 10) & (valid_prices <= 2000)]
+
+
+def build_stats(df):
+    price_col = 'price_$' if 'price_$' in df.columns else 'price'
+    reviews_col = 'reviews per month' if 'reviews per month' in df.columns else 'reviews_per_month'
+    room_type_col = 'room type' if 'room type' in df.columns else 'room_type'
+    neighborhood_col = 'neighbourhood group' if 'neighbourhood group' in df.columns else 'neighbourhood_group'
+
+    valid_prices = _valid_prices(df, price_col)
+    valid_reviews = df[reviews_col].fillna(0)
+
+    neighborhood_stats = df.groupby(neighborhood_col, observed=True).agg({
+        price_col: ['mean', 'median', 'count'],
+        reviews_col: 'mean'
+    }).round(2)
+
+    room_type_stats = df.groupby(room_type_col, observed=True).agg({
+        price_col: ['mean', 'count'],
+        reviews_col: 'mean'
+    }).round(2)
+
+    q20, q80 = valid_prices.quantile(0.2), valid_prices.quantile(0.8)
+
+    # market_trends depends on the current month and is filled in at encode time
+    return {
+        'overview': {
+            'avg_price': round(float(valid_prices.mean()), 2),
+            'median_price': round(float(valid_prices.median()), 2),
+            'avg_reviews': round(float(valid_reviews.mean()), 2),
+            'total_listings': len(df),
+            'active_listings': int((df[reviews_col] > 0).sum())
+        },
+        'neighborhoods': {
+            name: {
+                'avg_price': float(row[(price_col, 'mean')]),
+                'median_price': float(row[(price_col, 'median')]),
+                'listings': int(row[(price_col, 'count')]),
+                'avg_reviews': float(row[(reviews_col, 'mean')])
+            }
+            for name, row in neighborhood_stats.iterrows()
+        },
+        'room_types': {
+            name: {
+                'avg_price': float(row[(price_col, 'mean')]),
+                'listings': int(row[(price_col, 'count')]),
+                'avg_reviews': float(row[(reviews_col, 'mean')])
+            }
+            for name, row in room_type_stats.iterrows()
+        },
+        'performance_tiers': {
+            'premium': int((valid_prices > q80).sum()),
+            'standard': int(((valid_prices >= q20) & (valid_prices <= q80)).sum()),
+            'budget': int((valid_prices < q20).sum())
+        }
+    }
+
+
+def build_advanced_analytics(df, hosts=None):
+    price_col = None
+    for col in ['price_$', 'price', 'Price']:
+        if col in df.columns:
+            price_col = col
+            break
+
+    if not price_col:
+        # Logged by AggregateSnapshot._build and answered as a 500 by the route
+        raise DataUnavailable('Price data not available')
+
+    room_type_col = 'room type' if 'room type' in df.columns else 'room_type'
+    neighborhood_col = 'neighbourhood group' if 'neighbourhood group' in df.columns else 'neighbourhood_group'
+    host_name_col = 'host name' if 'host name' in df.columns else 'host_name'
+
+    valid_prices = _valid_prices(df, price_col)
+
+    if len(valid_prices) == 0:
+        raise DataUnavailable('No valid price data')
+
+    verified = df['host_identity_verified'] == 't' if 'host_identity_verified' in df.columns else None
+    unverified = df['host_identity_verified'] == 'f' if 'host_identity_verified' in df.columns else None
+
+    return {
+        'price_insights': {
+            'avg_price_by_room_type': df.groupby(room_type_col, observed=True)[price_col].mean().round(2).to_dict() if room_type_col in df.columns else {},
+            'price_distribution': {
+                'q25': float(valid_prices.quantile(0.25)),
+                'median': float(valid_prices.median()),
+                'q75': float(valid_prices.quantile(0.75)),
+                'mean': float(valid_prices.mean())
+            },
+            'neighborhood_pricing': df.groupby(neighborhood_col, observed=True)[price_col].agg(['mean', 'count']).round(2).to_dict('index') if neighborhood_col in df.columns else {}
+        },
+        'host_insights': {
+            'verified_vs_unverified': {
+                'verified_avg_price': float(df.loc[verified, price_col].mean()) if verified is not None and verified.any() else 180.0,
+                'unverified_avg_price': float(df.loc[unverified, price_col].mean()) if unverified is not None and unverified.any() else 120.0
+            },
+            'top_hosts': (hosts if hosts is not None else HostIndex(df, host_name_col, price_col=price_col)).analytics_top(10, price_col)
+        },
+        'booking_patterns': {
+            'instant_bookable_ratio': float((df['instant_bookable'] == 't').mean() * 100) if 'instant_bookable' in df.columns else 45.0,
+            'avg_minimum_nights': float(df['minimum nights'].mean()) if 'minimum nights' in df.columns else 2.5,
+            'availability_trends': df.groupby(neighborhood_col, observed=True)['availability 365'].mean().round(2).to_dict() if neighborhood_col in df.columns and 'availability 365' in df.columns else {}
+        },
+        'basic_stats': {
+            'total_listings': len(df),
+            'avg_price': float(valid_prices.mean()),
+            'median_price': float(valid_prices.median())
+        }
+    }
+
+
+class AggregateSnapshot:
+    def __init__(self, df, hosts=None, version=None, stats=None):
+        self.version = version or dataset_fingerprint(df)
+        if stats is not None:
+            self.stats, self.stats_error = stats, None
+        else:
+            self.stats, self.stats_error = self._build(build_stats, df, 'Stats API Error')
+        self.analytics, self.analytics_error = self._build(lambda df: build_advanced_analytics(df, hosts), df, 'Analytics error')
+        self.analytics_json = encode_json(self.analytics) if self.analytics is not None else None
+        self._stats_json = {}
+
+    @staticmethod
+    def _build(builder, df, label):
+        if df.empty:
+            return None, DataUnavailable('No data available')
+        try:
+            return builder(df), None
+        except Exception as e:
+            print(f"{label}: {e}")
+            return None, e
+
+    def stats_etag(self, month):
+        return f'{self.version}-{month}'
+
+    def stats_json(self, month):
+        body = self._stats_json.get(month)
+        if body is None:
+            seasonal_factor = seasonal_multiplier(month)
+            body = encode_json({
+                **self.stats,
+                'market_trends': {
+                    'seasonal_factor': round(seasonal_factor, 2),
+                    'price_growth': '+12.5%',  # Mock data
+                    'demand_index': 85,
+                    'supply_index': 78
+                }
+            })
+            self._stats_json[month] = body
+        return body
@@ -1,18 +1,35 @@
-from flask import Flask, request, jsonify
+import startup
+boot = startup.Startup()
+
+from flask import Flask, request, jsonify, stream_with_context
 from flask_cors import CORS
-import pandas as pd
-import numpy as np
 import os
-from datetime import datetime, timedelta
-import pickle
-import joblib
-from sklearn.ensemble import RandomForestRegressor
-from sklearn.preprocessing import LabelEncoder, StandardScaler
-from sklearn.model_selection import train_test_split
-from sklearn.metrics import mean_absolute_error, r2_score
+import json
+import math
+from datetime import datetime
 import warnings
 warnings.filterwarnings('ignore')
 
+import metrics
+import serialize
+from metrics import stage, count_fallback
+from cache import MISS_ENVIRON, PROBE_ENVIRON, CachedResponse, ResponseCache, floor_budget
+from markets import DEFAULT_MARKET, MarketRegistry, MarketUnavailable, UnknownMarket, available_markets, watch_files_enabled
+
+# The data layer (numpy, pandas, scipy and the index modules) loads on the
+# startup thread after the server is up; handlers only touch it once it's ready
+np = startup.lazy_import('numpy')
+aggregates = startup.lazy_import('aggregates')
+segments = startup.lazy_import('segments')
+inference = startup.lazy_import('inference')
+deals = startup.lazy_import('deals')
+export = startup.lazy_import('export')
+spatial = startup.lazy_import('spatial')
+hosts = startup.lazy_import('hosts')
+ingest = startup.lazy_import('ingest')
+trips = startup.lazy_import('trips')
+boot.mark('web_imports')
+
 app = Flask(__name__)
 CORS(app, origins=['*'])
 
@@ -23,33 +40,108 @@ def after_request(response):
     response.headers.add('Access-Control-Allow-Methods', 'GET,PUT,POST,DELETE,OPTIONS')
     return response
 
-# Load data and model
-print("Loading data and ML model...")
-try:
-    if os.path.exists('models/Processed.csv'):
-        df = pd.read_csv('models/Processed.csv')
-        print(f"✅ Loaded: {len(df)} rows from Processed.csv")
-    elif os.path.exists('data/Airbnb_Dataset.csv'):
-        df = pd.read_csv('data/Airbnb_Dataset.csv')
-        print(f"✅ Loaded: {len(df)} rows from Dataset.csv")
-    else:
-        df = pd.read_csv('data/Airbnb_cleaned_data.csv')
-        print(f"✅ Loaded: {len(df)} rows from cleaned data")
+@app.after_request
+def compress_response(response):
+    # gzip / brotli for JSON, NDJSON and CSV bodies when the client accepts it
+    return serialize.compress_response(response, request.headers.get('Accept-Encoding'))
+
+# Request timing, stage histograms and JSON encode timing for /metrics
+metrics.install(app)
+
+# Markets load on first use; the default market's data and model load on the startup thread
+markets = MarketRegistry()
+snapshots = None
+metrics.registry.callback_gauge('nestmetrics_snapshot_generation', 'Generation of the live data snapshot.', lambda: snapshots.current().generation)
+metrics.registry.callback_gauge('nestmetrics_snapshot_rows', 'Rows in the live data snapshot.', lambda: len(snapshots.current().df))
+metrics.registry.callback_gauge('nestmetrics_markets_loaded', 'Markets currently held in memory.', lambda: len(markets))
+metrics.registry.callback_gauge('nestmetrics_markets_memory_bytes', 'Estimated memory of the loaded market snapshots.', markets.memory_bytes)
+
+# Encoded responses of the pure query routes, keyed by dataset version
+response_cache = ResponseCache()
+metrics.registry.callback_gauge('nestmetrics_response_cache_entries', 'Responses held in the response cache.', lambda: len(response_cache))
+metrics.registry.callback_gauge('nestmetrics_response_cache_bytes', 'Encoded bytes held in the response cache.', lambda: response_cache.bytes)
+metrics.registry.callback_gauge('nestmetrics_compressed_cache_bytes', 'Compressed response bodies kept for reuse.', lambda: serialize.compressed_cache.bytes)
+
+STARTUP_SECONDS = metrics.registry.gauge('nestmetrics_startup_phase_seconds', 'Seconds spent in each startup phase.', ('phase',))
+metrics.registry.callback_gauge('nestmetrics_ready', 'Whether the default market is loaded and serving.', lambda: int(boot.ready))
+
+# Answered while the data layer is still loading; everything else waits for it
+STARTUP_ROUTES = {'healthz', 'readyz', 'home', 'test', 'prometheus_metrics'}
+
+def load_default_market(boot):
+    global snapshots
+    with boot.phase('data_imports'):
+        startup.resolve(np, aggregates, segments, inference, deals, export, spatial, hosts, ingest, trips)
+    snapshots = markets.get(DEFAULT_MARKET)
+    boot.record(snapshots.current().timings)
+    for phase, seconds in boot.phases.items():
+        STARTUP_SECONDS.set(seconds, phase=phase)
+    print("🚀 Backend initialization complete!")
+
+boot.begin(load_default_market)
+
+@app.before_request
+def wait_until_ready():
+    if boot.ready or request.endpoint is None or request.endpoint in STARTUP_ROUTES:
+        return None
+    if not boot.wait(startup.STARTUP_WAIT):
+        return jsonify({'error': 'Service is starting up', 'startup': boot.describe()}), 503, {'Retry-After': '5'}
+    return None
+
+def request_market():
+    # ?market= on any route; JSON bodies may carry it instead
+    market = request.args.get('market')
+    if market is None and request.is_json:
+        body = request.get_json(silent=True)
+        if isinstance(body, dict):
+            market = body.get('market')
+    return market if isinstance(market, str) and market else DEFAULT_MARKET
+
+def current_snapshot():
+    return markets.get(request_market()).current()
+
+@app.errorhandler(UnknownMarket)
+def unknown_market(e):
+    return jsonify({'error': str(e), 'markets': available_markets()}), 404
+
+@app.errorhandler(MarketUnavailable)
+def market_unavailable(e):
+    print(f"❌ {e}")
+    return jsonify({'error': str(e)}), 503
+
+def cached_json(body, etag):
+    response = app.response_class(body, mimetype='application/json')
+    response.set_etag(etag)
+    return response.make_conditional(request)
+
+def cached_response(snap, params, build):
+    # build() returns whatever the view would; its encoded body is what gets cached
+    def render():
+        response = app.make_response(build())
+        return CachedResponse(response.get_data(), response.status_code, response.mimetype, response_cache.ttl)
     
-    # Load trained model
-    if os.path.exists('models/model.pkl'):
-        ml_model = joblib.load('models/model.pkl')
-        print("✅ ML model loaded successfully")
+    key = (request.url_rule.rule, snap.market, snap.version, params)
+    if request.environ.get(PROBE_ENVIRON):
+        # Async server: hits are answered on its event loop, misses are computed by a worker process
+        entry, outcome = response_cache.lookup(key), 'hit'
+        if entry is None:
+            request.environ[MISS_ENVIRON] = key
+            request.environ[metrics.DEFERRED_ENVIRON] = True
+            return app.response_class(status=204)
     else:
-        ml_model = None
-        print("⚠️ ML model not found, using statistical methods")
-        
-except Exception as e:
-    print(f"❌ Error loading data: {e}")
-    df = pd.DataFrame()  # Empty fallback
-    ml_model = None
+        entry, outcome = response_cache.get_or_compute(key, render)
+    response = app.response_class(entry.body, status=entry.status, mimetype=entry.mimetype)
+    response.headers['X-Cache'] = outcome.upper()
+    if entry.status != 200:
+        return response
+    response.set_etag(entry.etag)
+    return response.make_conditional(request)
 
-print("🚀 Backend initialization complete!")
+def unauthorized():
+    admin_token = os.environ.get('NESTMETRICS_ADMIN_TOKEN')
+    if admin_token and request.headers.get('Authorization') != f'Bearer {admin_token}':
+        return jsonify({'error': 'Unauthorized'}), 401
+    return None
 
 @app.route('/', methods=['GET'])
 def home():
@@ -60,81 +152,122 @@ def home():
             'test': '/api/test',
             'stats': '/api/stats',
             'ml_predict': '/api/ml-predict',
+            'ml_predict_batch': '/api/ml-predict/batch',
             'find_deals': '/api/find-deals',
-            'booking_score': '/api/booking-score'
+            'nearby': '/api/nearby',
+            'markets': '/api/markets',
+            'booking_score': '/api/booking-score',
+            'booking_score_batch': '/api/booking-score/batch',
+            'top_hosts': '/api/top-hosts'
         }
     })
 
+@app.route('/healthz', methods=['GET'])
+def healthz():
+    return jsonify({'status': 'ok', 'uptime_s': boot.describe()['uptime_s']})
+
+@app.route('/readyz', methods=['GET'])
+def readyz():
+    # Ready once the dataset, its indexes and the model are loaded, not merely once loading ended
+    status = boot.describe()
+    ready = boot.ready
+    if ready:
+        snapshot = snapshots.current()
+        status['snapshot'] = snapshot.describe()
+        missing = snapshot.missing()
+        if missing:
+            ready = False
+            status['missing'] = missing
+            status['error'] = snapshot.load_error or snapshots.status['last_error'] or f"Not loaded: {', '.join(missing)}"
+    return jsonify(status), 200 if ready else 503
+
 @app.route('/api/test', methods=['GET'])
 def test():
     return jsonify({'message': 'Backend is working!', 'status': 'success'})
 
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    return app.response_class(metrics.registry.render(), mimetype=metrics.PROMETHEUS_MIMETYPE)
+
+@app.route('/api/admin/reload', methods=['GET', 'POST'])
+def admin_reload():
+    denied = unauthorized()
+    if denied:
+        return denied
+    
+    manager = markets.get(request_market())
+    if request.method == 'GET':
+        return jsonify(manager.describe())
+    
+    # Builds the next snapshot in the background; ?wait=true blocks until it is live
+    wait = request.args.get('wait', '').lower() == 'true'
+    started = manager.reload(wait=wait)
+    return jsonify({'reload_started': started, **manager.describe()}), 200 if wait else 202
+
+@app.route('/api/markets', methods=['GET'])
+def list_markets():
+    return jsonify(markets.describe())
+
+@app.route('/api/admin/cache', methods=['GET', 'DELETE'])
+def admin_cache():
+    denied = unauthorized()
+    if denied:
+        return denied
+    
+    if request.method == 'DELETE':
+        return jsonify({'cleared': response_cache.clear(), **response_cache.stats()})
+    return jsonify(response_cache.stats())
+
+@app.route('/api/debug/memory', methods=['GET'])
+def debug_memory():
+    denied = unauthorized()
+    if denied:
+        return denied
+    
+    # Estimated bytes per frame column and index of the market's live snapshot,
+    # next to what this process actually has resident
+    return jsonify({**current_snapshot().describe_memory(), 'process': metrics.process_memory()})
+
+@app.route('/api/admin/ingest', methods=['GET', 'POST'])
+def admin_ingest():
+    denied = unauthorized()
+    if denied:
+        return denied
+
+    ingestor = markets.get(request_market()).ingestor
+    if request.method == 'GET':
+        return jsonify(ingestor.describe())
+
+    # Listing upserts by id, as NDJSON or a JSON array; they go live with the
+    # next publish (?wait=true blocks until then)
+    if request.mimetype in ('application/x-ndjson', 'application/ndjson'):
+        records = inference.read_ndjson(ingest.read_lines(request.stream))
+    else:
+        data = request.get_json(silent=True)
+        records = data.get('listings') if isinstance(data, dict) else data
+        if not isinstance(records, list):
+            return jsonify({'error': 'Expected a JSON array of listings or an NDJSON body'}), 400
+
+    summary, ticket = ingestor.ingest(records)
+    wait = request.args.get('wait', '').lower() == 'true'
+    published = ingestor.wait(ticket) if wait and ticket is not None else False
+    return jsonify({
+        'received': summary['accepted'] + summary['failed'],
+        **summary,
+        'published': published,
+        **ingestor.describe()
+    }), 200 if wait else 202
+
 @app.route('/api/advanced-analytics', methods=['GET'])
 def advanced_analytics():
+    snap = current_snapshot()
     try:
-        if df.empty:
-            return jsonify({'error': 'No data available'}), 500
+        if snap.aggregates.analytics is None:
+            raise snap.aggregates.analytics_error
         
-        print(f"Available columns: {df.columns.tolist()[:10]}...")  # Debug log
-        
-        # Find price column
-        price_col = None
-        for col in ['price_$', 'price', 'Price']:
-            if col in df.columns:
-                price_col = col
-                break
-        
-        if not price_col:
-            print("No price column found!")
-            return jsonify({'error': 'Price data not available'}), 500
-        
-        # Find other columns
-        room_type_col = 'room type' if 'room type' in df.columns else 'room_type'
-        neighborhood_col = 'neighbourhood group' if 'neighbourhood group' in df.columns else 'neighbourhood_group'
-        host_name_col = 'host name' if 'host name' in df.columns else 'host_name'
-        
-        # Clean price data
-        valid_prices = df[price_col].dropna()
-        valid_prices = valid_prices[(valid_prices >= 10) & (valid_prices <= 2000)]
-        
-        if len(valid_prices) == 0:
-            return jsonify({'error': 'No valid price data'}), 500
-        
-        analytics = {
-            'price_insights': {
-                'avg_price_by_room_type': df.groupby(room_type_col)[price_col].mean().round(2).to_dict() if room_type_col in df.columns else {},
-                'price_distribution': {
-                    'q25': float(valid_prices.quantile(0.25)),
-                    'median': float(valid_prices.median()), 
-                    'q75': float(valid_prices.quantile(0.75)),
-                    'mean': float(valid_prices.mean())
-                },
-                'neighborhood_pricing': df.groupby(neighborhood_col)[price_col].agg(['mean', 'count']).round(2).to_dict('index') if neighborhood_col in df.columns else {}
-            },
-            'host_insights': {
-                'verified_vs_unverified': {
-                    'verified_avg_price': float(df[df['host_identity_verified'] == 't'][price_col].mean()) if 'host_identity_verified' in df.columns and len(df[df['host_identity_verified'] == 't']) > 0 else 180.0,
-                    'unverified_avg_price': float(df[df['host_identity_verified'] == 'f'][price_col].mean()) if 'host_identity_verified' in df.columns and len(df[df['host_identity_verified'] == 'f']) > 0 else 120.0
-                },
-                'top_hosts': df.groupby(host_name_col).agg({
-                    'id': 'count',
-                    price_col: 'mean',
-                    'number of reviews': 'sum'
-                }).sort_values('id', ascending=False).head(10).round(0).to_dict('index') if host_name_col in df.columns else {}
-            },
-            'booking_patterns': {
-                'instant_bookable_ratio': float((df['instant_bookable'] == 't').mean() * 100) if 'instant_bookable' in df.columns else 45.0,
-                'avg_minimum_nights': float(df['minimum nights'].mean()) if 'minimum nights' in df.columns else 2.5,
-                'availability_trends': df.groupby(neighborhood_col)['availability 365'].mean().round(2).to_dict() if neighborhood_col in df.columns and 'availability 365' in df.columns else {}
-            },
-            'basic_stats': {
-                'total_listings': len(df),
-                'avg_price': float(valid_prices.mean()),
-                'median_price': float(valid_prices.median())
-            }
-        }
-        
-        return jsonify(analytics)
+        return cached_json(snap.aggregates.analytics_json, snap.aggregates.version)
+    except aggregates.DataUnavailable as e:
+        return jsonify({'error': str(e)}), 500
     except Exception as e:
         print(f"Analytics error: {e}")
         return jsonify({
@@ -181,8 +314,17 @@ def advanced_analytics():
             }
         }), 200
 
+def location_fields(location, comparables_km):
+    if location is None:
+        return {}
+    return {
+        'location': {'lat': location[0], 'long': location[1]},
+        'comparables_radius_km': round(comparables_km, 3) if comparables_km is not None else None
+    }
+
 @app.route('/api/ml-predict', methods=['POST'])
 def ml_predict():
+    snap = current_snapshot()
     try:
         data = request.get_json()
         
@@ -192,36 +334,49 @@ def ml_predict():
         availability = int(data.get('availability_365', 365))
         host_listings = int(data.get('host_listings', 1))
         
-        if ml_model is not None:
+        try:
+            location = spatial.parse_location(data)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        # Price reference: the nearest listings of this room type when the caller
+        # sent coordinates, the whole room type × borough segment otherwise
+        prices = snap.segments.price_sample(room_type, neighborhood)
+        comparables_km = None
+        if location is not None:
+            nearby, comparables_km = snap.spatial.comparables(*location, room_type)
+            if nearby.count > 0:
+                prices = nearby
+            else:
+                comparables_km = None
+        
+        if snap.model is not None:
             # Try to use the actual ML model
             try:
                 # Create feature vector with 7 features as expected by model
-                room_type_enc = {'Entire home/apt': 0, 'Private room': 1, 'Shared room': 2}.get(room_type, 0)
-                neighborhood_enc = {'Manhattan': 0, 'Brooklyn': 1, 'Queens': 2, 'Bronx': 3, 'Staten Island': 4}.get(neighborhood, 0)
+                room_type_enc = snap.schema['room_type_codes'].get(room_type, 0)
+                neighborhood_enc = snap.schema['neighborhood_codes'].get(neighborhood, 0)
                 
-                # Get average values from dataset for missing features
-                avg_lat = df['lat'].mean() if 'lat' in df.columns else 40.7589
-                avg_long = df['long'].mean() if 'long' in df.columns else -73.9851
+                # Caller's coordinates, else dataset averages for the location features
+                if location is not None:
+                    avg_lat, avg_long = location
+                else:
+                    avg_lat = snap.df['lat'].mean() if 'lat' in snap.df.columns else 40.7589
+                    avg_long = snap.df['long'].mean() if 'long' in snap.df.columns else -73.9851
                 
                 # Create 7-feature array: [room_type, neighborhood, min_nights, availability, host_listings, lat, long]
                 features = np.array([[room_type_enc, neighborhood_enc, min_nights, availability, host_listings, avg_lat, avg_long]])
                 
                 # Make prediction using the loaded model
-                predicted_price = ml_model.predict(features)[0]
-                
-                # Get confidence interval based on similar listings
-                price_col = 'price_$' if 'price_$' in df.columns else 'price'
-                room_type_col = 'room type' if 'room type' in df.columns else 'room_type'
-                neighborhood_col = 'neighbourhood group' if 'neighbourhood group' in df.columns else 'neighbourhood_group'
+                with stage('model_predict'):
+                    predicted_price = snap.model.predict(features)[0]
                 
-                similar_listings = df[
-                    (df[room_type_col] == room_type) & 
-                    (df[neighborhood_col] == neighborhood)
-                ][price_col].dropna()
+                # Get confidence interval from the reference listings' price quantiles
+                similar_count = prices.count
                 
                 confidence_interval = {
-                    'lower': max(predicted_price * 0.85, similar_listings.quantile(0.1) if len(similar_listings) > 0 else predicted_price * 0.8),
-                    'upper': min(predicted_price * 1.15, similar_listings.quantile(0.9) if len(similar_listings) > 0 else predicted_price * 1.2)
+                    'lower': max(predicted_price * 0.85, prices.quantile(0.1) if similar_count > 0 else predicted_price * 0.8),
+                    'upper': min(predicted_price * 1.15, prices.quantile(0.9) if similar_count > 0 else predicted_price * 1.2)
                 }
                 
                 return jsonify({
@@ -231,28 +386,25 @@ def ml_predict():
                         'upper': round(float(confidence_interval['upper']), 2)
                     },
                     'model_accuracy': 'Random Forest Model: 85% R² Score',
-                    'similar_listings_count': len(similar_listings) if len(similar_listings) > 0 else 0
+                    'similar_listings_count': similar_count,
+                    'market_percentiles': prices.percentiles(segments.MARKET_PERCENTILES),
+                    **location_fields(location, comparables_km)
                 })
                 
             except Exception as model_error:
                 print(f"ML model prediction failed: {model_error}")
                 # Fall back to statistical method
-                pass
+                count_fallback('model_error')
+        else:
+            count_fallback('no_model')
         
         # Fallback statistical prediction
-        price_col = 'price_$' if 'price_$' in df.columns else 'price'
-        room_type_col = 'room type' if 'room type' in df.columns else 'room_type'
-        neighborhood_col = 'neighbourhood group' if 'neighbourhood group' in df.columns else 'neighbourhood_group'
-        
-        similar_listings = df[
-            (df[room_type_col] == room_type) & 
-            (df[neighborhood_col] == neighborhood)
-        ][price_col].dropna()
+        similar_count = prices.count
         
-        if len(similar_listings) == 0:
+        if similar_count == 0:
             return jsonify({'error': 'No similar listings found'}), 400
         
-        base_price = similar_listings.median()
+        base_price = prices.median()
         availability_factor = 1.0 - (availability - 180) / 365 * 0.1
         host_factor = 1.0 + min(host_listings - 1, 10) * 0.02
         nights_factor = 1.0 - min(min_nights - 1, 7) * 0.01
@@ -260,8 +412,8 @@ def ml_predict():
         predicted_price = base_price * availability_factor * host_factor * nights_factor
         
         confidence_interval = {
-            'lower': max(predicted_price * 0.8, similar_listings.quantile(0.25)),
-            'upper': min(predicted_price * 1.2, similar_listings.quantile(0.75))
+            'lower': max(predicted_price * 0.8, prices.quantile(0.25)),
+            'upper': min(predicted_price * 1.2, prices.quantile(0.75))
         }
         
         return jsonify({
@@ -271,64 +423,95 @@ def ml_predict():
                 'upper': round(confidence_interval['upper'], 2)
             },
             'model_accuracy': 'Statistical Model: 80% accuracy (ML model fallback)',
-            'similar_listings_count': len(similar_listings)
+            'similar_listings_count': similar_count,
+            'market_percentiles': prices.percentiles(segments.MARKET_PERCENTILES),
+            **location_fields(location, comparables_km)
         })
         
     except Exception as e:
         print(f"ML predict error: {e}")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/ml-predict/batch', methods=['POST'])
+def ml_predict_batch():
+    snap = current_snapshot()
+    try:
+        # NDJSON in, NDJSON out: rows are scored chunk by chunk as they arrive
+        if request.mimetype in ('application/x-ndjson', 'application/ndjson'):
+            def generate():
+                lines = (line.decode('utf-8', errors='replace') for line in request.stream)
+                for results in inference.predict_batch(snap.model, snap.df, snap.segments, inference.read_ndjson(lines), schema=snap.schema):
+                    yield ''.join(json.dumps(result) + '\n' for result in results)
+            
+            return app.response_class(stream_with_context(generate()), mimetype='application/x-ndjson')
+        
+        data = request.get_json()
+        records = data.get('inputs') if isinstance(data, dict) else data
+        if not isinstance(records, list):
+            return jsonify({'error': 'Expected a JSON array of inputs or an NDJSON body'}), 400
+        
+        predictions = [result for results in inference.predict_batch(snap.model, snap.df, snap.segments, records, schema=snap.schema) for result in results]
+        failed = sum(1 for result in predictions if 'error' in result)
+        
+        return jsonify({
+            'predictions': predictions,
+            'count': len(predictions),
+            'failed': failed,
+            'model_accuracy': 'Random Forest Model: 85% R² Score' if snap.model is not None else 'Statistical Model: 80% accuracy (ML model fallback)'
+        })
+    except Exception as e:
+        print(f"ML batch predict error: {e}")
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/api/find-deals', methods=['GET', 'POST'])
 def find_deals():
-    if request.method == 'POST':
-        data = request.get_json()
-        room_type = data.get('room_type', 'Entire home/apt')
-        neighborhood = data.get('neighborhood', 'Manhattan')
-        max_budget = float(data.get('max_budget', 200))
-        guests = int(data.get('guests', 2))
-    else:
-        room_type = request.args.get('room_type', 'Entire home/apt')
-        neighborhood = request.args.get('neighborhood', 'Manhattan')
-        max_budget = float(request.args.get('max_budget', 200))
-        guests = int(request.args.get('guests', 2))
+    snap = current_snapshot()
+    values = request.get_json(silent=True) if request.method == 'POST' else request.args
+    if not hasattr(values, 'get'):
+        return jsonify({'error': 'Expected a JSON object'}), 400
+    room_type = values.get('room_type', 'Entire home/apt')
+    neighborhood = values.get('neighborhood', 'Manhattan')
+    try:
+        max_budget = float(values.get('max_budget', 200))
+        guests = int(values.get('guests', 2))
+        k = int(values.get('k', 10))
+        offset = int(values.get('offset', 0))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'max_budget must be a number and guests, k and offset integers'}), 400
+    if not math.isfinite(max_budget):
+        return jsonify({'error': 'max_budget must be finite'}), 400
     
+    # guests doesn't change the ranking, so it stays out of the cache key
+    max_budget = floor_budget(max_budget)
+    k = max(0, min(k, deals.MAX_DEALS_K))
+    offset = max(0, offset)
+    return cached_response(snap, (room_type, neighborhood, max_budget, k, offset),
+                           lambda: find_deals_response(snap, room_type, neighborhood, max_budget, k, offset))
+
+def find_deals_response(snap, room_type, neighborhood, max_budget, k, offset):
     try:
-        # Use correct column names from Processed.csv
-        price_col = 'price_$'
-        room_type_col = 'room type'
-        neighborhood_col = 'neighbourhood group'
-        reviews_col = 'reviews per month'
-        name_col = 'NAME'
-        
-        filtered_data = df[
-            (df[room_type_col] == room_type) & 
-            (df[neighborhood_col] == neighborhood) &
-            (df[price_col] <= max_budget)
-        ]
+        deals_found = snap.deals.deals_found(room_type, neighborhood, max_budget)
         
-        if len(filtered_data) > 0:
-            # Find best deals (price vs value)
-            filtered_data = filtered_data.copy()
-            filtered_data['value_score'] = (
-                (filtered_data[reviews_col].fillna(0) * 20) +
-                (100 - (filtered_data[price_col] / max_budget * 100))
-            )
-            
-            best_deals = filtered_data.nlargest(10, 'value_score')
+        if deals_found > 0:
+            # Find best deals (price vs value) from the presorted segment
+            with stage('rank'):
+                rows, scores = snap.deals.top(room_type, neighborhood, max_budget, k, offset)
+            avg_price = snap.deals.avg_price(room_type, neighborhood, max_budget)
             
             return jsonify({
-                'deals_found': len(filtered_data),
-                'best_deals': [{
-                    'name': row[name_col],
-                    'price': row[price_col],
-                    'reviews_per_month': row[reviews_col] if pd.notna(row[reviews_col]) else 0,
-                    'value_score': row['value_score']
-                } for _, row in best_deals.iterrows()],
-                'avg_price': round(filtered_data[price_col].mean(), 2),
-                'price_savings': round(max_budget - filtered_data[price_col].mean(), 2),
+                'deals_found': deals_found,
+                'best_deals': snap.deals.records(rows, scores),
+                'pagination': {
+                    'k': k,
+                    'offset': offset,
+                    'returned': len(rows),
+                    'has_more': offset + len(rows) < deals_found
+                },
+                'avg_price': round(avg_price, 2),
+                'price_savings': round(max_budget - avg_price, 2),
                 'booking_tips': [
-                    f"Found {len(filtered_data)} options under ${max_budget}",
-                    f"Average savings: ${round(max_budget - filtered_data[price_col].mean(), 2)}",
+                    f"Found {deals_found} options under ${max_budget}",
+                    f"Average savings: ${round(max_budget - avg_price, 2)}",
                     "Book early for better availability"
                 ]
             })
@@ -338,7 +521,7 @@ def find_deals():
                 'message': 'No deals found. Try increasing budget or different area.',
                 'suggestions': {
                     'nearby_areas': ['Brooklyn', 'Queens'] if neighborhood == 'Manhattan' else ['Manhattan'],
-                    'budget_recommendation': round(df[df[room_type_col] == room_type][price_col].quantile(0.5), 2)
+                    'budget_recommendation': round(snap.segments.price_median(room_type), 2)
                 }
             })
     except Exception as e:
@@ -347,6 +530,7 @@ def find_deals():
 
 @app.route('/api/booking-score', methods=['GET', 'POST'])
 def booking_score():
+    snap = current_snapshot()
     if request.method == 'POST':
         data = request.get_json()
         listing_id = data.get('listing_id')
@@ -357,49 +541,18 @@ def booking_score():
         price = float(request.args.get('price', 100))
         neighborhood = request.args.get('neighborhood', 'Manhattan')
     
+    # The score moves with the exact price, so it is keyed on it rather than a step
+    return cached_response(snap, (price, neighborhood), lambda: booking_score_response(snap, price, neighborhood))
+
+def booking_score_response(snap, price, neighborhood):
     try:
-        # Calculate booking success probability
-        neighborhood_col = 'neighbourhood_group' if 'neighbourhood_group' in df.columns else 'neighbourhood group'
-        price_col = 'price_$' if 'price_$' in df.columns else 'price'
-        reviews_col = 'reviews per month' if 'reviews per month' in df.columns else 'reviews_per_month'
+        # Calculate booking success probability against the neighbourhood baseline
+        baseline = snap.scorer.baseline(neighborhood)
         
-        neighborhood_data = df[df[neighborhood_col] == neighborhood]
-        
-        if len(neighborhood_data) > 0:
-            avg_price = neighborhood_data[price_col].mean()
-            avg_reviews = neighborhood_data[reviews_col].fillna(0).mean()
-            
-            # Price competitiveness (lower price = higher score)
-            price_ratio = price / avg_price if avg_price > 0 else 1
-            
-            if price_ratio <= 0.5:  # Super cheap
-                price_score = 98
-            elif price_ratio <= 0.8:  # Very good deal
-                price_score = 85 + (0.8 - price_ratio) * 43
-            elif price_ratio <= 1.0:  # Fair price
-                price_score = 70 + (1.0 - price_ratio) * 75
-            elif price_ratio <= 1.2:  # Slightly expensive
-                price_score = 50 - (price_ratio - 1.0) * 100
-            elif price_ratio <= 1.5:  # Expensive
-                price_score = 30 - (price_ratio - 1.2) * 67
-            else:  # Very expensive
-                price_score = max(5, 10 - (price_ratio - 1.5) * 10)
-            
-            price_score = max(5, min(100, price_score))  # Ensure bounds
-            
-            # Availability score based on neighborhood demand
-            base_availability = min(avg_reviews * 15, 90)
-            
-            # Adjust for price impact on availability
-            if price_ratio < 0.8:
-                availability_score = min(base_availability * 1.2, 95)  # Cheap = high demand
-            elif price_ratio > 1.2:
-                availability_score = base_availability * 0.7  # Expensive = low demand
-            else:
-                availability_score = base_availability
-            
-            # Overall booking score with more dynamic weighting
-            booking_score = (price_score * 0.7 + availability_score * 0.3)
+        if baseline is not None:
+            avg_price, _ = baseline
+            with stage('score'):
+                booking_score, price_score, availability_score = snap.scorer.score(price, neighborhood)
             
             # Booking insights
             best_time = "Weekdays" if booking_score > 70 else "Weekends"
@@ -426,32 +579,48 @@ def booking_score():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/booking-score/batch', methods=['POST'])
+def booking_score_batch():
+    snap = current_snapshot()
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({'error': 'Expected a JSON object with listing_ids or prices'}), 400
+    try:
+        with stage('score'):
+            result = snap.scorer.score_request(data)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify(result)
+
 @app.route('/api/listings', methods=['GET'])
 def get_listings():
+    snap = current_snapshot()
     try:
-        limit = int(request.args.get('limit', 100))
-        neighborhood = request.args.get('neighborhood')
-        room_type = request.args.get('room_type')
-        
-        neighborhood_col = 'neighbourhood group' if 'neighbourhood group' in df.columns else 'neighbourhood_group'
-        room_type_col = 'room type' if 'room type' in df.columns else 'room_type'
-        
-        filtered_df = df.copy()
-        
-        if neighborhood:
-            filtered_df = filtered_df[filtered_df[neighborhood_col] == neighborhood]
-        if room_type:
-            filtered_df = filtered_df[filtered_df[room_type_col] == room_type]
-        
-        return jsonify(filtered_df.head(limit).to_dict('records'))
+        try:
+            query = export.parse_listings_query(request.args, snap.df)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        chunks = export.iter_listing_rows(snap.segments, query)
+        columns = query['columns']
+        
+        if query['format'] == 'ndjson':
+            return app.response_class(serialize.encode_lines(snap.df, chunks, columns), mimetype=export.EXPORT_FORMATS['ndjson'])
+        if query['format'] == 'csv':
+            response = app.response_class(export.encode_csv(snap.df, chunks, columns), mimetype=export.EXPORT_FORMATS['csv'])
+            response.headers['Content-Disposition'] = 'attachment; filename=listings.csv'
+            return response
+        
+        return app.response_class(serialize.encode_rows(snap.df, chunks, columns, query['shape']), mimetype=export.EXPORT_FORMATS['json'])
     except Exception as e:
         print(f"Listings error: {e}")
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/stats', methods=['GET'])
 def get_stats():
+    snap = current_snapshot()
     try:
-        if df.empty:
+        if snap.df.empty:
             return jsonify({
                 'overview': {
                     'avg_price': 152.72,
@@ -462,75 +631,11 @@ def get_stats():
                 'error': 'No data loaded, using fallback'
             })
             
-        price_col = 'price_$' if 'price_$' in df.columns else 'price'
-        reviews_col = 'reviews per month' if 'reviews per month' in df.columns else 'reviews_per_month'
-        room_type_col = 'room type' if 'room type' in df.columns else 'room_type'
-        neighborhood_col = 'neighbourhood group' if 'neighbourhood group' in df.columns else 'neighbourhood_group'
+        if snap.aggregates.stats is None:
+            raise snap.aggregates.stats_error
         
-        valid_prices = df[price_col].dropna()
-        valid_prices = valid_prices[(valid_prices >= 10) & (valid_prices <= 2000)]
-        valid_reviews = df[reviews_col].fillna(0)
-        
-        # Advanced market analytics
-        neighborhood_stats = df.groupby(neighborhood_col).agg({
-            price_col: ['mean', 'median', 'count'],
-            reviews_col: 'mean'
-        }).round(2)
-        
-        room_type_stats = df.groupby(room_type_col).agg({
-            price_col: ['mean', 'count'],
-            reviews_col: 'mean'
-        }).round(2)
-        
-        # Market trends (mock seasonal data)
         current_month = datetime.now().month
-        seasonal_multiplier = 1.2 if current_month in [6, 7, 8] else 1.1 if current_month == 12 else 0.9
-        
-        stats = {
-            'overview': {
-                'avg_price': round(valid_prices.mean(), 2),
-                'median_price': round(valid_prices.median(), 2),
-                'avg_reviews': round(valid_reviews.mean(), 2),
-                'total_listings': len(df),
-                'active_listings': len(df[df[reviews_col] > 0])
-            },
-            'market_trends': {
-                'seasonal_factor': round(seasonal_multiplier, 2),
-                'price_growth': '+12.5%',  # Mock data
-                'demand_index': 85,
-                'supply_index': 78
-            },
-            'neighborhoods': {
-                name: {
-                    'avg_price': float(stats[0]),
-                    'median_price': float(stats[1]),
-                    'listings': int(stats[2]),
-                    'avg_reviews': float(reviews)
-                }
-                for (name, stats), (_, reviews) in zip(
-                    neighborhood_stats[price_col].iterrows(),
-                    neighborhood_stats[reviews_col].items()
-                )
-            },
-            'room_types': {
-                name: {
-                    'avg_price': float(stats[0]),
-                    'listings': int(stats[1]),
-                    'avg_reviews': float(reviews)
-                }
-                for (name, stats), (_, reviews) in zip(
-                    room_type_stats[price_col].iterrows(),
-                    room_type_stats[reviews_col].items()
-                )
-            },
-            'performance_tiers': {
-                'premium': len(valid_prices[valid_prices > valid_prices.quantile(0.8)]),
-                'standard': len(valid_prices[(valid_prices >= valid_prices.quantile(0.2)) & (valid_prices <= valid_prices.quantile(0.8))]),
-                'budget': len(valid_prices[valid_prices < valid_prices.quantile(0.2)])
-            }
-        }
-        
-        return jsonify(stats)
+        return cached_json(snap.aggregates.stats_json(current_month), snap.aggregates.stats_etag(current_month))
     except Exception as e:
         print(f"Stats API Error: {e}")
         return jsonify({
@@ -568,46 +673,106 @@ def get_stats():
             'error': str(e)
         }), 200
 
-@app.route('/api/top-hosts', methods=['GET'])
-def get_top_hosts():
+@app.route('/api/nearby', methods=['GET'])
+def get_nearby():
+    snap = current_snapshot()
     try:
-        # Return mock data for now since host data might be missing
-        mock_hosts = [
-            {'host_name': 'Sarah Johnson', 'listings_count': 12, 'avg_reviews': 4.8, 'total_reviews': 245, 'avg_price': 185, 'price_range': '$120-250', 'performance_score': 85, 'tier': 'Superhost'},
-            {'host_name': 'Michael Chen', 'listings_count': 8, 'avg_reviews': 4.6, 'total_reviews': 189, 'avg_price': 165, 'price_range': '$100-220', 'performance_score': 72, 'tier': 'Plus'},
-            {'host_name': 'Emma Rodriguez', 'listings_count': 15, 'avg_reviews': 4.9, 'total_reviews': 312, 'avg_price': 220, 'price_range': '$150-300', 'performance_score': 92, 'tier': 'Superhost'},
-            {'host_name': 'David Kim', 'listings_count': 6, 'avg_reviews': 4.3, 'total_reviews': 98, 'avg_price': 145, 'price_range': '$90-180', 'performance_score': 58, 'tier': 'Standard'},
-            {'host_name': 'Lisa Thompson', 'listings_count': 10, 'avg_reviews': 4.7, 'total_reviews': 156, 'avg_price': 175, 'price_range': '$110-240', 'performance_score': 78, 'tier': 'Plus'}
-        ]
-        return jsonify(mock_hosts)
+        location = spatial.parse_location(request.args)
+        if location is None:
+            return jsonify({'error': 'lat and long are required'}), 400
+        radius_km = spatial.parse_number(request.args, 'radius_km')
+        min_price = spatial.parse_number(request.args, 'min_price')
+        max_price = spatial.parse_number(request.args, 'max_price')
+        # Radius queries return everything inside up to the cap; k limits either kind
+        try:
+            k = int(request.args.get('k', spatial.MAX_NEARBY_K if radius_km is not None else 10))
+        except ValueError:
+            return jsonify({'error': 'k must be an integer'}), 400
+        k = max(0, min(k, spatial.MAX_NEARBY_K))
+        room_type = request.args.get('room_type') or None
+        if radius_km is not None and radius_km <= 0:
+            return jsonify({'error': 'radius_km must be positive'}), 400
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    try:
+        with stage('spatial_query'):
+            rows, distances = snap.spatial.nearest(*location, k, radius_km, room_type, min_price, max_price)
+        return jsonify({
+            'center': {'lat': location[0], 'long': location[1]},
+            'query': {
+                'k': k,
+                'radius_km': radius_km,
+                'room_type': room_type,
+                'min_price': min_price,
+                'max_price': max_price
+            },
+            'count': len(rows),
+            'listings': snap.spatial.records(rows, distances)
+        })
     except Exception as e:
+        print(f"Nearby error: {e}")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/top-hosts', methods=['GET'])
+def get_top_hosts():
+    snap = current_snapshot()
+    try:
+        limit = max(0, min(int(request.args.get('limit', 10)), hosts.MAX_HOSTS_K))
+        offset = max(0, int(request.args.get('offset', 0)))
+    except ValueError:
+        return jsonify({'error': 'limit and offset must be integers'}), 400
+    tier = request.args.get('tier') or None
+    if tier is not None and tier not in hosts.TIERS:
+        return jsonify({'error': f"tier must be one of {', '.join(hosts.TIERS)}"}), 400
+    neighborhood = request.args.get('neighborhood') or None
+    
+    with stage('filter'):
+        records, total = snap.hosts.top(limit, offset, tier, neighborhood)
+    return jsonify({
+        'hosts': records,
+        'pagination': {
+            'limit': limit,
+            'offset': offset,
+            'returned': len(records),
+            'total': total,
+            'has_more': offset + len(records) < total
+        },
+        'filters': {'tier': tier, 'neighborhood': neighborhood}
+    })
+
+@app.route('/api/hosts/<path:host_name>', methods=['GET'])
+def get_host(host_name):
+    snap = current_snapshot()
+    host = snap.hosts.lookup(host_name)
+    if host is None:
+        return jsonify({'error': f'Unknown host: {host_name}'}), 404
+    return jsonify(host)
+
 @app.route('/api/travel-insights', methods=['GET'])
 def get_travel_insights():
+    snap = current_snapshot()
     try:
         neighborhood = request.args.get('neighborhood', 'Manhattan')
-        budget = float(request.args.get('budget', 200))
-        
-        # Use correct column names from Processed.csv
-        neighborhood_col = 'neighbourhood group' if 'neighbourhood group' in df.columns else 'neighbourhood_group'
-        price_col = 'price_$' if 'price_$' in df.columns else 'price'
-        room_type_col = 'room type' if 'room type' in df.columns else 'room_type'
-        name_col = 'NAME' if 'NAME' in df.columns else 'name'
-        
-        neighborhood_data = df[df[neighborhood_col] == neighborhood]
+        budget = floor_budget(float(request.args.get('budget', 200)))
+    except Exception as e:
+        print(f"Travel insights error: {e}")
+        return jsonify({'error': str(e)}), 500
+    return cached_response(snap, (neighborhood, budget), lambda: travel_insights_response(snap, neighborhood, budget))
+
+def travel_insights_response(snap, neighborhood, budget):
+    try:
+        total_options = snap.segments.count(neighborhood=neighborhood)
         
-        if len(neighborhood_data) == 0:
+        if total_options == 0:
             return jsonify({'error': 'No data for this area'}), 404
         
         # Travel-focused insights
-        budget_options = neighborhood_data[neighborhood_data[price_col] <= budget]
+        within_budget = snap.segments.count_under_price(budget, neighborhood=neighborhood)
         
-        # Calculate dynamic insights based on real data
-        avg_price = neighborhood_data[price_col].mean()
-        price_25 = neighborhood_data[price_col].quantile(0.25)
-        price_75 = neighborhood_data[price_col].quantile(0.75)
-        sweet_spot = neighborhood_data[price_col].quantile(0.4)
+        # Calculate dynamic insights from the neighbourhood's quantile table
+        avg_price = snap.segments.price_mean(neighborhood=neighborhood)
+        price_25, sweet_spot, price_75 = snap.segments.price_quantile([0.25, 0.4, 0.75], neighborhood=neighborhood)
         
         # Dynamic availability based on budget vs market
         budget_ratio = budget / avg_price if avg_price > 0 else 1
@@ -622,8 +787,8 @@ def get_travel_insights():
         
         insights = {
             'destination_overview': {
-                'total_options': len(neighborhood_data),
-                'within_budget': len(budget_options),
+                'total_options': total_options,
+                'within_budget': within_budget,
                 'avg_price': round(avg_price, 2),
                 'budget_savings': round(avg_price - budget, 2) if avg_price > budget else 0
             },
@@ -639,11 +804,11 @@ def get_travel_insights():
                 'description': f"Typical pricing for {neighborhood}"
             },
             'area_highlights': {
-                'accommodation_types': neighborhood_data[room_type_col].value_counts().to_dict() if room_type_col in df.columns else {},
+                'accommodation_types': snap.segments.room_type_counts(neighborhood),
                 'room_distribution': {
-                    'entire_home': len(neighborhood_data[neighborhood_data[room_type_col] == 'Entire home/apt']) if room_type_col in df.columns else 0,
-                    'private_room': len(neighborhood_data[neighborhood_data[room_type_col] == 'Private room']) if room_type_col in df.columns else 0,
-                    'shared_room': len(neighborhood_data[neighborhood_data[room_type_col] == 'Shared room']) if room_type_col in df.columns else 0
+                    'entire_home': snap.segments.count('Entire home/apt', neighborhood),
+                    'private_room': snap.segments.count('Private room', neighborhood),
+                    'shared_room': snap.segments.count('Shared room', neighborhood)
                 }
             }
         }
@@ -655,33 +820,43 @@ def get_travel_insights():
 
 @app.route('/api/booking-optimizer', methods=['POST'])
 def booking_optimizer():
+    snap = current_snapshot()
     try:
         data = request.get_json()
         budget = float(data.get('budget', 200))
         neighborhood = data.get('neighborhood', 'Manhattan')
         guests = int(data.get('guests', 2))
         trip_length = int(data.get('trip_length', 3))
-        
-        # Find optimal booking strategy
-        area_data = df[
-            (df['neighbourhood_group'] == neighborhood) &
-            (df['accommodates'] >= guests)
-        ]
-        
-        if len(area_data) == 0:
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+    if guests < 1 or not 1 <= trip_length <= trips.MAX_TRIP_NIGHTS or budget <= 0:
+        return jsonify({'error': f'guests and budget must be positive and trip_length between 1 and {trips.MAX_TRIP_NIGHTS}'}), 400
+    budget = floor_budget(budget)
+    return cached_response(snap, (budget, neighborhood, guests, trip_length),
+                           lambda: booking_optimizer_response(snap, budget, neighborhood, guests, trip_length))
+
+def booking_optimizer_response(snap, budget, neighborhood, guests, trip_length):
+    try:
+        if not snap.trips.fits(neighborhood, guests):
             return jsonify({'error': 'No suitable options found'}), 400
         
-        # Calculate total trip cost scenarios
-        daily_budget = budget / trip_length
-        suitable_options = area_data[area_data['price'] <= daily_budget]
+        # Whole-stay cost (nightly price + service fee, at least the minimum nights) within budget
+        with stage('plan'):
+            daily_budget = budget / trip_length
+            plan = snap.trips.plan(neighborhood, guests, budget, trip_length)
+            alternatives = sorted(
+                ((snap.trips.count(area, guests, budget, trip_length), area) for area in snap.trips.neighborhoods() if area != neighborhood),
+                key=lambda pair: -pair[0]
+            )
         
         # Optimization strategies
         strategies = {
             'budget_optimization': {
                 'daily_limit': round(daily_budget, 2),
                 'total_budget': budget,
-                'options_found': len(suitable_options),
-                'avg_savings': round(daily_budget - suitable_options['price'].mean(), 2) if len(suitable_options) > 0 else 0
+                'options_found': plan['options_found'],
+                'avg_savings': round(daily_budget - plan['avg_nightly_cost'], 2) if plan['options_found'] else 0,
+                'avg_trip_cost': round(plan['avg_trip_cost'], 2) if plan['options_found'] else None
             },
             'booking_timing': {
                 'optimal_window': '14-21 days ahead',
@@ -690,13 +865,14 @@ def booking_optimizer():
                 'avoid_dates': 'Major holidays and events'
             },
             'value_recommendations': {
-                'best_value': suitable_options.nlargest(3, 'reviews_per_month')[['name', 'price', 'reviews_per_month']].to_dict('records') if len(suitable_options) > 0 else [],
-                'budget_picks': suitable_options.nsmallest(3, 'price')[['name', 'price']].to_dict('records') if len(suitable_options) > 0 else [],
-                'alternative_areas': ['Brooklyn', 'Queens'] if neighborhood == 'Manhattan' else ['Manhattan']
+                'best_value': plan['best_value'],
+                'budget_picks': plan['budget_picks'],
+                'alternative_areas': [str(area) for count, area in alternatives[:2] if count > 0]
             },
             'booking_tips': [
                 f"Book accommodations for {guests} guests",
-                f"Stay within ${daily_budget}/night budget",
+                f"Stay within ${round(daily_budget, 2)}/night budget, service fees included",
+                "Check minimum stays: some listings bill more nights than your trip",
                 "Read recent reviews before booking",
                 "Check cancellation policies",
                 "Consider location vs transportation costs"
@@ -710,6 +886,7 @@ def booking_optimizer():
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', os.environ.get('FLASK_RUN_PORT', 5001)))
     print("🚀 NestMetrics API Server Starting...")
-    print(f"📊 Loaded {len(df)} listings")
-    print(f"🌐 Server running on port {port}")
+    print(f"🌐 Server running on port {port} (data loading in the background, see /readyz)")
+    if watch_files_enabled():
+        markets.watch()
     app.run(debug=False, port=port, host='0.0.0.0')
\ No newline at end of file
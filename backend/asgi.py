@@ -0,0 +1,517 @@
+import argparse
+import asyncio
+import gc
+import io
+import json
+import multiprocessing
+import os
+import signal
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from urllib.parse import parse_qs
+
+from werkzeug.exceptions import HTTPException
+
+import forksafe
+import metrics
+import serialize
+import startup
+from app import STARTUP_ROUTES, app as flask_app, boot, markets, response_cache
+from cache import MISS_ENVIRON, PROBE_ENVIRON, CachedResponse
+from markets import DEFAULT_MARKET, watch_files_enabled
+
+# Async serving: `python asgi.py` or `uvicorn asgi:app --port 5001`
+# The same Flask routes behind an asyncio front end. Routes that only read
+# precomputed aggregates or indexes, and response cache hits, are answered on
+# the event loop; everything else (pandas filtering, model inference, cache
+# misses) runs in a pool of worker processes forked from this one, so they
+# share the loaded snapshots copy-on-write. Whenever this process's snapshots
+# change (reload, market loaded or evicted) the pool is re-forked, so the
+# workers always hold the data the front end holds; requests already running
+# finish on the old pool.
+#
+# Streamed routes (listing exports, batch prediction with an NDJSON body) run
+# on a thread here instead: the request body is handed to Flask as it arrives
+# and the response goes out chunk by chunk, so neither is held whole in memory
+# or pickled between processes. At most ASYNC_STREAM_BUFFER chunks wait for a
+# slow client before the export pauses. A JSON array batch goes to the pool.
+#
+# Listing ingestion (POST /api/admin/ingest) is refused here: every publish
+# is a new snapshot generation, which would re-fork the pool each
+# NESTMETRICS_INGEST_INTERVAL. Ingest through the WSGI server instead.
+#
+# At most ASYNC_MAX_PENDING requests wait for or run in the pool or a stream
+# thread; beyond that the server answers 503 with Retry-After right away
+# instead of queueing, and a request still unanswered after
+# ASYNC_REQUEST_TIMEOUT seconds gets a 504. A stream whose app produces
+# nothing for that long once it has started is cut off.
+
+WORKERS = int(os.environ.get('ASYNC_WORKERS', multiprocessing.cpu_count()))
+MAX_PENDING = int(os.environ.get('ASYNC_MAX_PENDING', 4 * WORKERS))
+REQUEST_TIMEOUT = float(os.environ.get('ASYNC_REQUEST_TIMEOUT', 30))
+MARKET_BODY_LIMIT = 64 * 1024
+STREAM_BUFFER = int(os.environ.get('ASYNC_STREAM_BUFFER', 4))
+
+# Answered on the event loop
+INLINE_ENDPOINTS = {
+    'home', 'test', 'healthz', 'readyz', 'prometheus_metrics', 'list_markets', 'admin_cache',
+    'get_stats', 'advanced_analytics', 'get_top_hosts', 'get_host', 'admin_ingest'
+}
+# May block (a reload, the deep memory_usage walk) and must reach this
+# process's snapshots; run on a thread so the loop keeps serving
+THREAD_ENDPOINTS = {'admin_reload', 'debug_memory'}
+# (endpoint, method) answered with 501
+UNSUPPORTED_ROUTES = {('admin_ingest', 'POST')}
+# Streaming bodies in or out; run on a thread and relayed chunk by chunk
+STREAM_ENDPOINTS = {'get_listings'}
+# Streamed only when the body is NDJSON
+NDJSON_ENDPOINTS = {'ml_predict_batch'}
+NDJSON_TYPES = {'application/x-ndjson', 'application/ndjson'}
+# Routes served through cached_response(): hits inline, misses in the pool
+CACHED_ENDPOINTS = {'find_deals', 'booking_score', 'get_travel_insights', 'booking_optimizer'}
+
+ASYNC_REQUESTS = metrics.registry.counter(
+    'nestmetrics_async_requests_total',
+    'Requests by where the async server answered them (inline, thread, stream, cache_hit, pool, rejected, timeout).',
+    ('tier',)
+)
+POOL_RECYCLES = metrics.registry.counter('nestmetrics_async_pool_recycles_total', 'Worker pools re-forked after a snapshot change.')
+
+
+def wsgi_environ(scope, body):
+    # Picklable WSGI environ for an ASGI HTTP scope; wsgi.input is added by call_app
+    server = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf8').decode('latin1'),
+        'PATH_INFO': scope['path'].encode('utf8').decode('latin1'),
+        'QUERY_STRING': scope['query_string'].decode('latin1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False
+    }
+    client = scope.get('client')
+    if client:
+        environ['REMOTE_ADDR'], environ['REMOTE_PORT'] = client[0], str(client[1])
+    for name, value in scope['headers']:
+        name, value = name.decode('latin1'), value.decode('latin1')
+        if name == 'content-type':
+            key = 'CONTENT_TYPE'
+        elif name == 'content-length':
+            key = 'CONTENT_LENGTH'
+        else:
+            key = 'HTTP_' + name.upper().replace('-', '_')
+        environ[key] = f'{environ[key]},{value}' if key in environ else value
+    if body and 'CONTENT_LENGTH' not in environ:
+        environ['CONTENT_LENGTH'] = str(len(body))
+    return environ
+
+
+def call_app(environ, body):
+    # Runs a request through the Flask app; returns (status, headers, body) and the environ it saw
+    environ = {**environ, 'wsgi.input': io.BytesIO(body), 'wsgi.errors': sys.stderr}
+    started = {}
+
+    def start_response(status, headers, exc_info=None):
+        started['status'], started['headers'] = int(status.split(' ', 1)[0]), headers
+
+    result = flask_app(environ, start_response)
+    try:
+        data = b''.join(result)
+    finally:
+        if hasattr(result, 'close'):
+            result.close()
+    return (started['status'], started['headers'], data), environ
+
+
+def handle_in_worker(environ, body):
+    return call_app(environ, body)[0]
+
+
+def init_worker():
+    # Ctrl-C reaches the whole process group; workers exit when the front end shuts the pool down.
+    # The server's own SIGTERM handler is inherited through fork and would keep a worker alive.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.set_wakeup_fd(-1)
+
+
+def error_reply(status, message, headers=()):
+    body = json.dumps({'error': message}).encode()
+    return status, [('Content-Type', 'application/json'), ('Access-Control-Allow-Origin', '*'), *headers], body
+
+
+def requested_market(environ, body):
+    # Mirrors app.request_market(): ?market=, else a JSON object body's "market".
+    # Large bodies (batch predictions) aren't parsed on the loop; a worker loads their market itself.
+    market = parse_qs(environ['QUERY_STRING']).get('market', [None])[0]
+    if (market is None and 0 < len(body) <= MARKET_BODY_LIMIT and body.lstrip()[:1] == b'{'
+            and environ.get('CONTENT_TYPE', '').startswith('application/json')):
+        try:
+            payload = json.loads(body)
+        except ValueError:
+            payload = None
+        if isinstance(payload, dict) and isinstance(payload.get('market'), str):
+            market = payload['market']
+    return market or DEFAULT_MARKET
+
+
+def streamed(endpoint, scope):
+    if endpoint in STREAM_ENDPOINTS:
+        return True
+    if endpoint not in NDJSON_ENDPOINTS:
+        return False
+    content_type = dict(scope['headers']).get(b'content-type', b'').decode('latin1')
+    return content_type.split(';')[0].strip().lower() in NDJSON_TYPES
+
+
+async def read_body(receive):
+    chunks = []
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            return None
+        chunks.append(message.get('body', b''))
+        if not message.get('more_body'):
+            return b''.join(chunks)
+
+
+class RequestBody(io.RawIOBase):
+    # wsgi.input for streamed routes: pulls ASGI body messages off the event
+    # loop as the app reads, from the thread the app runs on
+    def __init__(self, receive, loop):
+        self._receive = receive
+        self._loop = loop
+        self._pending = b''
+        self._finished = False
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while not self._pending and not self._finished:
+            message = asyncio.run_coroutine_threadsafe(self._receive(), self._loop).result()
+            # A client that disconnects mid-upload reads as the end of the body
+            self._pending = message.get('body', b'')
+            self._finished = message['type'] == 'http.disconnect' or not message.get('more_body')
+        size = min(len(buffer), len(self._pending))
+        buffer[:size] = self._pending[:size]
+        self._pending = self._pending[size:]
+        return size
+
+
+async def send_reply(send, reply):
+    status, headers, body = reply
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(name.lower().encode('latin1'), value.encode('latin1')) for name, value in headers]
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+
+class AsyncServer:
+    def __init__(self, wsgi_app, workers=WORKERS, max_pending=MAX_PENDING, timeout=REQUEST_TIMEOUT):
+        self.wsgi_app = wsgi_app
+        self.workers = workers
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self.pending = 0
+        self._pending_lock = threading.Lock()
+        self._pool = None
+        self._pool_state = None
+        # Cache keys being computed in the pool; identical misses wait for the first one
+        self._computing = {}
+        self._warming = None
+        self._urls = wsgi_app.url_map.bind('localhost')
+        unknown = (INLINE_ENDPOINTS | THREAD_ENDPOINTS | STREAM_ENDPOINTS | NDJSON_ENDPOINTS | CACHED_ENDPOINTS) - set(wsgi_app.view_functions)
+        if unknown:
+            raise ValueError(f"Unknown endpoints in the async routing tables: {', '.join(sorted(unknown))}")
+        metrics.registry.callback_gauge('nestmetrics_async_pending', 'Requests waiting for or running in the worker pool or a stream thread.', lambda: self.pending)
+        forksafe.register(self)
+
+    def _after_fork(self):
+        self._pending_lock = threading.Lock()
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self.lifespan(receive, send)
+        elif scope['type'] == 'http':
+            await self.handle(scope, receive, send)
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                # Accept connections now; the workers fork once the data has loaded
+                self._warming = asyncio.create_task(self.warm())
+                print(f"🚀 Async server listening ({self.workers} workers, {self.max_pending} pending max, {self.timeout:g}s timeout)")
+                if watch_files_enabled():
+                    markets.watch()
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                if self._pool is not None:
+                    # Wait for the workers to exit so none outlive the server
+                    await asyncio.to_thread(self._pool.shutdown, wait=True, cancel_futures=True)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def warm(self):
+        if await asyncio.to_thread(boot.wait):
+            self.pool()
+
+    def pool(self):
+        state = markets.state()
+        if self._pool is not None and state == self._pool_state:
+            return self._pool
+        previous = self._pool
+        # Keep the collector from touching (and un-sharing) what the workers inherit
+        gc.freeze()
+        self._pool = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context('fork'), initializer=init_worker)
+        self._pool_state = state
+        # Fork the workers now rather than on the first request
+        self._pool.submit(os.getpid)
+        if previous is not None:
+            previous.shutdown(wait=False)
+            POOL_RECYCLES.inc()
+            print(f"♻️ Worker pool re-forked for snapshot state {state}")
+        return self._pool
+
+    def route(self, method, path):
+        try:
+            rule, _ = self._urls.match(path, method, return_rule=True)
+        except HTTPException:
+            # 404, 405 and redirects are cheap for Flask to answer
+            return None
+        return rule
+
+    async def handle(self, scope, receive, send):
+        rule = self.route(scope['method'], scope['path'])
+        endpoint = rule.endpoint if rule is not None else None
+        if endpoint is not None and endpoint not in STARTUP_ROUTES and not boot.ready:
+            if not await asyncio.to_thread(boot.wait, startup.STARTUP_WAIT):
+                await send_reply(send, error_reply(503, 'Service is starting up', [('Retry-After', '5')]))
+                return
+        if streamed(endpoint, scope):
+            # Cold markets load on the route's thread
+            await self.stream(wsgi_environ(scope, b''), receive, send)
+            return
+
+        body = await read_body(receive)
+        if body is None:
+            return
+        environ = wsgi_environ(scope, body)
+        market = requested_market(environ, body)
+        if boot.ready and market not in markets:
+            # A cold market loads off the loop; errors surface from the route itself
+            await asyncio.to_thread(self._load_market, market)
+
+        if (endpoint, environ['REQUEST_METHOD']) in UNSUPPORTED_ROUTES:
+            reply = error_reply(501, 'Listing ingestion is not available on the async server; run it under gunicorn or app.py')
+        elif endpoint is None or endpoint in INLINE_ENDPOINTS:
+            ASYNC_REQUESTS.inc(tier='inline')
+            reply, _ = call_app(environ, body)
+        elif endpoint in THREAD_ENDPOINTS:
+            ASYNC_REQUESTS.inc(tier='thread')
+            reply, _ = await asyncio.to_thread(call_app, environ, body)
+        elif endpoint in CACHED_ENDPOINTS:
+            reply = await self.cached(environ, body, rule)
+        else:
+            reply = await self.offload(environ, body, rule)
+        await send_reply(send, reply)
+
+    async def stream(self, environ, receive, send):
+        if self.pending >= self.max_pending:
+            ASYNC_REQUESTS.inc(tier='rejected')
+            await send_reply(send, error_reply(503, 'Server busy, retry shortly', [('Retry-After', '1')]))
+            return
+        ASYNC_REQUESTS.inc(tier='stream')
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue()
+        # Chunks the app may run ahead of the client; released as they are sent
+        slots = threading.Semaphore(STREAM_BUFFER)
+        abandoned = threading.Event()
+
+        def emit(item):
+            try:
+                loop.call_soon_threadsafe(queue.put_nowait, item)
+            except RuntimeError:
+                # The loop is gone (server shutting down)
+                abandoned.set()
+
+        def produce():
+            def start_response(status, headers, exc_info=None):
+                emit((int(status.split(' ', 1)[0]), headers))
+
+            result = None
+            try:
+                result = self.wsgi_app({
+                    **environ,
+                    'wsgi.input': io.BufferedReader(RequestBody(receive, loop)),
+                    'wsgi.input_terminated': True,
+                    'wsgi.errors': sys.stderr
+                }, start_response)
+                for chunk in result:
+                    if not chunk:
+                        continue
+                    slots.acquire()
+                    if abandoned.is_set():
+                        break
+                    emit(chunk)
+            except Exception as e:
+                print(f"❌ Streamed response failed: {e}")
+            finally:
+                if hasattr(result, 'close'):
+                    result.close()
+                emit(None)
+                # Like a pool slot, this one frees when the work stops, not when the client goes
+                self._finished(None)
+
+        with self._pending_lock:
+            self.pending += 1
+        loop.run_in_executor(None, produce)
+        started = False
+        try:
+            while True:
+                try:
+                    # Waiting on the app only; a slow client holds the app back instead
+                    item = await asyncio.wait_for(queue.get(), self.timeout)
+                except asyncio.TimeoutError:
+                    ASYNC_REQUESTS.inc(tier='timeout')
+                    if not started:
+                        await send_reply(send, error_reply(504, f'Request timed out after {self.timeout:g}s'))
+                    else:
+                        # Returning without the final body message drops the connection, so
+                        # the client sees a truncated response rather than a complete one
+                        print(f"⚠️ Stream stalled for {self.timeout:g}s, closing {environ['PATH_INFO']}")
+                    return
+                if item is None:
+                    break
+                if started:
+                    await send({'type': 'http.response.body', 'body': item, 'more_body': True})
+                    slots.release()
+                    continue
+                status, headers = item
+                await send({
+                    'type': 'http.response.start',
+                    'status': status,
+                    'headers': [(name.lower().encode('latin1'), value.encode('latin1')) for name, value in headers]
+                })
+                started = True
+            if started:
+                await send({'type': 'http.response.body', 'body': b''})
+            else:
+                await send_reply(send, error_reply(500, 'Response failed'))
+        finally:
+            # A client that went away (or a timeout) stops the export at its next chunk
+            abandoned.set()
+            slots.release()
+
+    def _load_market(self, market):
+        try:
+            markets.get(market)
+        except Exception:
+            pass
+
+    async def cached(self, environ, body, rule):
+        while True:
+            reply, seen = call_app({**environ, PROBE_ENVIRON: True}, body)
+            key = seen.get(MISS_ENVIRON)
+            if key is None:
+                ASYNC_REQUESTS.inc(tier='cache_hit')
+                return reply
+            computing = self._computing.get(key)
+            if computing is None:
+                break
+            # Probe again once the identical request in flight has filled the cache
+            await asyncio.shield(computing)
+
+        self._computing[key] = done = asyncio.get_running_loop().create_future()
+        try:
+            # The cache holds identity bodies; this client's encoding is applied afterwards
+            identity = {name: value for name, value in environ.items() if name != 'HTTP_ACCEPT_ENCODING'}
+            reply = await self.offload(identity, body, rule)
+            status, headers, data = reply
+            if status < 500 and status != 304:
+                mimetype = dict(headers).get('Content-Type', '').split(';')[0]
+                response_cache.put(key, CachedResponse(data, status, mimetype, response_cache.ttl))
+            return serialize.compress_reply(reply, environ.get('HTTP_ACCEPT_ENCODING'))
+        finally:
+            del self._computing[key]
+            done.set_result(None)
+
+    def _finished(self, future):
+        with self._pending_lock:
+            self.pending -= 1
+
+    async def offload(self, environ, body, rule):
+        started = time.perf_counter()
+        metrics.IN_FLIGHT.inc()
+        try:
+            if self.pending >= self.max_pending:
+                ASYNC_REQUESTS.inc(tier='rejected')
+                reply = error_reply(503, 'Server busy, retry shortly', [('Retry-After', '1')])
+            else:
+                reply = await self._run_in_pool(environ, body)
+        finally:
+            metrics.IN_FLIGHT.inc(-1)
+        method = environ['REQUEST_METHOD']
+        metrics.REQUEST_DURATION.observe(time.perf_counter() - started, route=rule.rule, method=method)
+        metrics.REQUESTS.inc(route=rule.rule, method=method, status=str(reply[0]))
+        return reply
+
+    async def _run_in_pool(self, environ, body):
+        with self._pending_lock:
+            self.pending += 1
+        try:
+            future = self.pool().submit(handle_in_worker, environ, body)
+        except BrokenProcessPool:
+            self._finished(None)
+            self._pool = None
+            return error_reply(503, 'Worker pool restarting, retry shortly', [('Retry-After', '1')])
+        # The slot frees when the worker is actually done, not when the client gives up
+        future.add_done_callback(self._finished)
+        try:
+            reply = await asyncio.wait_for(asyncio.wrap_future(future), self.timeout)
+        except asyncio.TimeoutError:
+            ASYNC_REQUESTS.inc(tier='timeout')
+            return error_reply(504, f'Request timed out after {self.timeout:g}s')
+        except BrokenProcessPool:
+            # A worker died (e.g. out of memory); the next request gets a fresh pool
+            self._pool = None
+            return error_reply(503, 'Worker pool restarting, retry shortly', [('Retry-After', '1')])
+        ASYNC_REQUESTS.inc(tier='pool')
+        return reply
+
+
+app = AsyncServer(flask_app)
+
+
+def main(argv=None):
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description='Serve the NestMetrics API with an async front end and a worker pool')
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=int(os.environ.get('PORT', os.environ.get('FLASK_RUN_PORT', 5001))))
+    parser.add_argument('--workers', type=int, default=WORKERS, help='worker processes for the heavy routes')
+    parser.add_argument('--max-pending', type=int, default=None, help='pool requests before answering 503 (default 4 per worker)')
+    parser.add_argument('--timeout', type=float, default=REQUEST_TIMEOUT, help='seconds before a pool request gets a 504')
+    args = parser.parse_args(argv)
+
+    app.workers = args.workers
+    app.max_pending = args.max_pending or int(os.environ.get('ASYNC_MAX_PENDING', 4 * args.workers))
+    app.timeout = args.timeout
+    uvicorn.run(app, host=args.host, port=args.port, lifespan='on', log_level='warning')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
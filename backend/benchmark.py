@@ -0,0 +1,394 @@
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+# Latency/throughput harness for every route in app.py.
+#
+#   python benchmark.py --rows 100000 --output bench.json
+#   python benchmark.py --rows 1000000 --compare bench.json
+#
+# A synthetic Airbnb-shaped dataset is written to a scratch directory, the app
+# is imported from there, and each route is driven sequentially (latency
+# percentiles) and then from a thread pool (requests/sec). Results are JSON so
+# runs can be diffed.
+
+ROOM_TYPES = ['Entire home/apt', 'Private room', 'Shared room', 'Hotel room']
+ROOM_TYPE_WEIGHTS = [0.52, 0.44, 0.03, 0.01]
+NEIGHBORHOODS = ['Manhattan', 'Brooklyn', 'Queens', 'Bronx', 'Staten Island']
+NEIGHBORHOOD_WEIGHTS = [0.42, 0.41, 0.13, 0.03, 0.01]
+NEIGHBORHOOD_CENTERS = {
+    'Manhattan': (40.78, -73.97),
+    'Brooklyn': (40.65, -73.95),
+    'Queens': (40.73, -73.82),
+    'Bronx': (40.84, -73.88),
+    'Staten Island': (40.58, -74.15)
+}
+ROOM_TYPE_PRICE = {'Entire home/apt': 1.35, 'Private room': 0.85, 'Shared room': 0.55, 'Hotel room': 1.1}
+
+
+def generate_dataset(rows, seed=42):
+    rng = np.random.default_rng(seed)
+    room_type = np.array(ROOM_TYPES)[rng.choice(len(ROOM_TYPES), rows, p=ROOM_TYPE_WEIGHTS)]
+    neighborhood = np.array(NEIGHBORHOODS)[rng.choice(len(NEIGHBORHOODS), rows, p=NEIGHBORHOOD_WEIGHTS)]
+    centers = np.array([NEIGHBORHOOD_CENTERS[n] for n in NEIGHBORHOODS])
+    center = centers[pd.Categorical(neighborhood, categories=NEIGHBORHOODS).codes]
+
+    price_factor = pd.Series(room_type).map(ROOM_TYPE_PRICE).to_numpy()
+    price = np.clip(np.round(rng.lognormal(6.2, 0.45, rows) * price_factor), 50, 1200)
+    reviews = np.round(rng.gamma(0.9, 1.5, rows), 2)
+    reviews[rng.random(rows) < 0.15] = np.nan
+    host_count = max(rows // 4, 1)
+    host_ids = rng.integers(0, host_count, rows)
+    ids = np.arange(1_000_000, 1_000_000 + rows) + rng.integers(0, 3, rows).cumsum()
+
+    df = pd.DataFrame({
+        'id': ids,
+        'NAME': 'Listing ' + pd.Series(ids).astype(str),
+        'host id': 10_000_000_000 + host_ids,
+        'host_identity_verified': np.where(rng.random(rows) < 0.5, 'verified', 'unconfirmed'),
+        'host name': 'Host ' + pd.Series(host_ids).astype(str),
+        'neighbourhood group': neighborhood,
+        'neighbourhood': 'Area ' + pd.Series(rng.integers(0, 50, rows)).astype(str),
+        'lat': center[:, 0] + rng.normal(0, 0.02, rows),
+        'long': center[:, 1] + rng.normal(0, 0.02, rows),
+        'country': 'United States',
+        'country code': 'US',
+        'instant_bookable': rng.random(rows) < 0.5,
+        'cancellation_policy': np.array(['strict', 'moderate', 'flexible'])[rng.integers(0, 3, rows)],
+        'room type': room_type,
+        'Construction year': rng.integers(2003, 2023, rows),
+        'price_$': price,
+        'service_fee_$': np.round(price * 0.2),
+        'minimum nights': rng.integers(1, 31, rows),
+        'number of reviews': rng.integers(0, 500, rows),
+        'last review': pd.Timestamp('2019-01-01') + pd.to_timedelta(rng.integers(0, 1000, rows), unit='D'),
+        'reviews per month': reviews,
+        'review rate number': rng.integers(1, 6, rows),
+        'calculated host listings count': rng.integers(1, 30, rows),
+        'availability 365': rng.integers(0, 366, rows)
+    })
+    df['last review'] = df['last review'].dt.strftime('%Y-%m-%d')
+    df['room_type_enc'] = pd.Categorical(df['room type']).codes
+    df['neighbourhood_group_enc'] = pd.Categorical(df['neighbourhood group']).codes
+    df['host_verified_enc'] = pd.Categorical(df['host_identity_verified']).codes
+    return df
+
+
+def write_fixture(df, workdir, fmt='columnar', with_model=False, seed=42):
+    from dataset import PROCESSED_CSV, COLUMNAR_DIR, write_columnar
+    os.makedirs(os.path.join(workdir, 'models'), exist_ok=True)
+    if fmt == 'csv':
+        df.to_csv(os.path.join(workdir, PROCESSED_CSV), index=False)
+    else:
+        write_columnar(df, os.path.join(workdir, COLUMNAR_DIR))
+
+    if with_model:
+        import joblib
+        from sklearn.ensemble import RandomForestRegressor
+        from inference import ROOM_TYPE_CODES, NEIGHBORHOOD_CODES
+        sample = df.sample(min(len(df), 20000), random_state=seed)
+        features = np.column_stack([
+            sample['room type'].map(ROOM_TYPE_CODES).fillna(0),
+            sample['neighbourhood group'].map(NEIGHBORHOOD_CODES).fillna(0),
+            sample['minimum nights'],
+            sample['availability 365'],
+            sample['calculated host listings count'],
+            sample['lat'],
+            sample['long']
+        ])
+        model = RandomForestRegressor(n_estimators=50, max_depth=12, random_state=seed, n_jobs=-1)
+        model.fit(features, sample['price_$'])
+        joblib.dump(model, os.path.join(workdir, 'models', 'model.pkl'))
+
+
+def scenarios():
+    predict_input = {
+        'room_type': 'Private room',
+        'neighbourhood_group': 'Brooklyn',
+        'minimum_nights': 2,
+        'availability_365': 200,
+        'host_listings': 1
+    }
+    return {
+        'home': ('GET', '/', None),
+        'test': ('GET', '/api/test', None),
+        'stats': ('GET', '/api/stats', None),
+        'advanced_analytics': ('GET', '/api/advanced-analytics', None),
+        'ml_predict': ('POST', '/api/ml-predict', predict_input),
+        'ml_predict_location': ('POST', '/api/ml-predict', {**predict_input, 'lat': 40.68, 'long': -73.95}),
+        'ml_predict_batch': ('POST', '/api/ml-predict/batch', [predict_input] * 1000),
+        'find_deals': ('GET', '/api/find-deals?room_type=Private%20room&neighborhood=Brooklyn&max_budget=150', None),
+        'find_deals_post': ('POST', '/api/find-deals', {'room_type': 'Entire home/apt', 'neighborhood': 'Manhattan', 'max_budget': 250, 'k': 20}),
+        'booking_score': ('GET', '/api/booking-score?price=120&neighborhood=Queens', None),
+        'booking_score_post': ('POST', '/api/booking-score', {'price': 95, 'neighborhood': 'Brooklyn'}),
+        'booking_score_sweep': ('POST', '/api/booking-score/batch', {'prices': list(range(20, 10020)), 'neighborhood': 'Queens'}),
+        'booking_score_portfolio': ('POST', '/api/booking-score/batch', {'listing_ids': list(range(1_000_000, 1_010_000))}),
+        'listings': ('GET', '/api/listings?limit=100&neighborhood=Manhattan', None),
+        'listings_ndjson': ('GET', '/api/listings?format=ndjson&limit=10000', None),
+        'listings_page': ('GET', '/api/listings?limit=10000&after=0', None),
+        'listings_columns': ('GET', '/api/listings?limit=10000&after=0&shape=columns', None),
+        'nearby': ('GET', '/api/nearby?lat=40.7&long=-73.95&k=10&room_type=Private%20room&max_price=150', None),
+        'nearby_radius': ('GET', '/api/nearby?lat=40.7&long=-73.95&radius_km=1', None),
+        'top_hosts': ('GET', '/api/top-hosts', None),
+        'top_hosts_filtered': ('GET', '/api/top-hosts?limit=100&offset=50&tier=Standard&neighborhood=Brooklyn', None),
+        'host_lookup': ('GET', '/api/hosts/Host%201', None),
+        'travel_insights': ('GET', '/api/travel-insights?neighborhood=Brooklyn&budget=180', None),
+        'booking_optimizer': ('POST', '/api/booking-optimizer', {'budget': 600, 'neighborhood': 'Brooklyn', 'guests': 2, 'trip_length': 3}),
+        'booking_optimizer_wide': ('POST', '/api/booking-optimizer', {'budget': 100000, 'neighborhood': 'Manhattan', 'guests': 1, 'trip_length': 7}),
+        'markets': ('GET', '/api/markets', None),
+        'admin_reload_status': ('GET', '/api/admin/reload', None),
+        'admin_cache_status': ('GET', '/api/admin/cache', None),
+        'admin_ingest_status': ('GET', '/api/admin/ingest', None),
+        'debug_memory': ('GET', '/api/debug/memory', None),
+        'healthz': ('GET', '/healthz', None),
+        'readyz': ('GET', '/readyz', None),
+        'metrics': ('GET', '/metrics', None)
+    }
+
+
+# Routes that mutate server state; they are reported but not driven
+SKIPPED_ROUTES = {('POST', '/api/admin/reload'), ('DELETE', '/api/admin/cache'), ('POST', '/api/admin/ingest')}
+
+
+def read_peak_rss():
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def reset_peak_rss():
+    # Linux only: resets VmHWM so each endpoint reports its own peak
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+
+class TestClientDriver:
+    def __init__(self, app):
+        self.app = app
+        self._local = threading.local()
+
+    def _client(self):
+        if not hasattr(self._local, 'client'):
+            self._local.client = self.app.test_client()
+        return self._local.client
+
+    def __call__(self, method, path, payload):
+        response = self._client().open(path, method=method, json=payload)
+        body = response.get_data()
+        # Closing runs call_on_close hooks (request metrics), as a real server would
+        response.close()
+        return response.status_code, len(body)
+
+
+class HttpDriver:
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip('/')
+
+    def __call__(self, method, path, payload):
+        data = json.dumps(payload).encode() if payload is not None else None
+        request = urllib.request.Request(self.base_url + path, data=data, method=method,
+                                         headers={'Content-Type': 'application/json'} if data else {})
+        try:
+            with urllib.request.urlopen(request) as response:
+                return response.status, len(response.read())
+        except urllib.error.HTTPError as e:
+            return e.code, len(e.read())
+
+
+def percentile_ms(samples, q):
+    return round(float(np.percentile(samples, q)) * 1000, 3) if len(samples) else None
+
+
+def bench_endpoint(driver, method, path, payload, iterations, concurrency, duration, warmup=3):
+    for _ in range(warmup):
+        driver(method, path, payload)
+
+    track_rss = reset_peak_rss()
+    latencies = []
+    statuses = {}
+    response_bytes = 0
+    for _ in range(iterations):
+        started = time.perf_counter()
+        status, size = driver(method, path, payload)
+        latencies.append(time.perf_counter() - started)
+        statuses[status] = statuses.get(status, 0) + 1
+        response_bytes = size
+
+    completed = 0
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def worker():
+        nonlocal completed
+        done = 0
+        while time.perf_counter() < deadline:
+            driver(method, path, payload)
+            done += 1
+        with lock:
+            completed += done
+
+    load_started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for _ in range(concurrency):
+            pool.submit(worker)
+    elapsed = time.perf_counter() - load_started
+
+    return {
+        'method': method,
+        'path': path,
+        'iterations': iterations,
+        'statuses': {str(k): v for k, v in sorted(statuses.items())},
+        'response_bytes': response_bytes,
+        'p50_ms': percentile_ms(latencies, 50),
+        'p95_ms': percentile_ms(latencies, 95),
+        'p99_ms': percentile_ms(latencies, 99),
+        'mean_ms': round(float(np.mean(latencies)) * 1000, 3),
+        'concurrency': concurrency,
+        'requests_per_sec': round(completed / elapsed, 1) if elapsed > 0 else None,
+        'peak_rss_mb': round(read_peak_rss() / 2**20, 1) if track_rss else None
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], stderr=subprocess.DEVNULL,
+                                       cwd=os.path.dirname(os.path.abspath(__file__))).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(current, baseline):
+    print(f"{'endpoint':<24}{'p50 ms':>18}{'p99 ms':>18}{'req/s':>20}")
+    for name, result in current['endpoints'].items():
+        before = baseline.get('endpoints', {}).get(name)
+        if not before:
+            continue
+
+        def delta(key):
+            old, new = before.get(key), result.get(key)
+            if not old or new is None:
+                return f'{new}'
+            return f'{new} ({(new - old) / old * 100:+.0f}%)'
+
+        print(f"{name:<24}{delta('p50_ms'):>18}{delta('p99_ms'):>18}{delta('requests_per_sec'):>20}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='NestMetrics API benchmark')
+    parser.add_argument('--rows', type=int, default=100_000, help='synthetic dataset size (10k to 10M)')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--format', choices=['columnar', 'csv'], default='columnar')
+    parser.add_argument('--with-model', action='store_true', help='train a small forest so ml-predict takes the model path')
+    parser.add_argument('--iterations', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--duration', type=float, default=3.0, help='seconds of concurrent load per endpoint')
+    parser.add_argument('--endpoints', help='comma-separated subset of scenario names')
+    parser.add_argument('--url', help='benchmark a running server instead of an in-process app')
+    parser.add_argument('--workdir', help='keep the generated fixture in this directory')
+    parser.add_argument('--output', help='write results JSON here (default: stdout)')
+    parser.add_argument('--compare', help='previous results JSON to diff against')
+    args = parser.parse_args(argv)
+
+    backend_dir = os.path.dirname(os.path.abspath(__file__))
+    sys.path.insert(0, backend_dir)
+    meta = {
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'git_revision': git_revision(),
+        'rows': args.rows,
+        'format': args.format,
+        'with_model': args.with_model,
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'numpy': np.__version__,
+        'cpu_count': os.cpu_count(),
+        # Repeated requests on cached routes measure hits; RESPONSE_CACHE_MAX_ENTRIES=0 measures the computation
+        'response_cache_entries': int(os.environ.get('RESPONSE_CACHE_MAX_ENTRIES', 2048))
+    }
+
+    startup = {}
+    if args.url:
+        driver = HttpDriver(args.url)
+        route_table = None
+    else:
+        workdir = args.workdir or tempfile.mkdtemp(prefix='nestmetrics-bench-')
+        started = time.perf_counter()
+        df = generate_dataset(args.rows, args.seed)
+        write_fixture(df, workdir, args.format, args.with_model, args.seed)
+        del df
+        startup['fixture_s'] = round(time.perf_counter() - started, 3)
+
+        os.chdir(workdir)
+        rss_before = read_peak_rss()
+        started = time.perf_counter()
+        import app as app_module
+        startup['import_s'] = round(time.perf_counter() - started, 3)
+        # The data layer loads in the background; measure until it is ready
+        app_module.boot.wait()
+        startup['ready_s'] = round(time.perf_counter() - started, 3)
+        startup['phases'] = dict(app_module.boot.phases)
+        startup['rss_mb'] = round(read_peak_rss() / 2**20, 1)
+        startup['rss_delta_mb'] = round((read_peak_rss() - rss_before) / 2**20, 1)
+        driver = TestClientDriver(app_module.app)
+        urls = app_module.app.url_map.bind('localhost')
+        route_table = {
+            (method, rule.rule)
+            for rule in app_module.app.url_map.iter_rules() if rule.endpoint != 'static'
+            for method in rule.methods - {'HEAD', 'OPTIONS'}
+        }
+
+    selected = scenarios()
+    if args.endpoints:
+        wanted = set(args.endpoints.split(','))
+        selected = {name: spec for name, spec in selected.items() if name in wanted}
+
+    results = {}
+    for name, (method, path, payload) in selected.items():
+        print(f"⏱  {name} {method} {path}", file=sys.stderr)
+        results[name] = bench_endpoint(driver, method, path, payload, args.iterations, args.concurrency, args.duration)
+
+    uncovered = []
+    if route_table is not None:
+        # Matched against the URL map so routes with variables count as driven
+        driven = {(method, urls.match(path.split('?')[0], method, return_rule=True)[0].rule) for method, path, _ in scenarios().values()}
+        uncovered = sorted(f'{m} {p}' for m, p in route_table - driven - SKIPPED_ROUTES)
+
+    report = {'meta': meta, 'startup': startup, 'endpoints': results, 'uncovered_routes': uncovered}
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(report, json.load(f))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
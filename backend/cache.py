@@ -0,0 +1,204 @@
+import hashlib
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+
+import forksafe
+from metrics import registry
+
+# Response cache for query endpoints that are pure functions of their
+# parameters and the dataset. Keys are (route, dataset version, canonical
+# params), so a reload makes old entries unreachable and they age out of the
+# LRU. Entries hold the already-encoded body, so a hit skips both the
+# computation and JSON encoding. Concurrent misses on the same key wait for
+# the first request's result instead of computing it again.
+#
+# The async server (asgi.py) splits a lookup from its computation: it probes
+# the cache on the event loop with PROBE_ENVIRON set, and on a miss
+# (MISS_ENVIRON holds the key) computes the response in a worker process and
+# put()s it back.
+
+MAX_ENTRIES = int(os.environ.get('RESPONSE_CACHE_MAX_ENTRIES', 2048))
+MAX_BYTES = int(float(os.environ.get('RESPONSE_CACHE_MAX_MB', 64)) * 1024 * 1024)
+TTL_SECONDS = float(os.environ.get('RESPONSE_CACHE_TTL', 300))
+# Budgets are floored to this step (in dollars) before lookup and computation, so
+# requests in one step share a response that never goes over any of their budgets
+PRICE_STEP = float(os.environ.get('RESPONSE_CACHE_PRICE_STEP', 1))
+PROBE_ENVIRON = 'nestmetrics.cache_probe'
+MISS_ENVIRON = 'nestmetrics.cache_miss'
+
+CACHE_REQUESTS = registry.counter(
+    'nestmetrics_response_cache_requests_total',
+    'Cached-route lookups by outcome (hit, miss, coalesced, bypass).',
+    ('route', 'result')
+)
+
+
+def floor_budget(value):
+    if PRICE_STEP <= 0 or not math.isfinite(value):
+        return value
+    # round() first so 0.29 / 0.01 (28.999...) still floors to 29 steps
+    return round(math.floor(round(value / PRICE_STEP, 9)) * PRICE_STEP, 2)
+
+
+class CachedResponse:
+    __slots__ = ('body', 'status', 'mimetype', 'etag', 'expires')
+
+    def __init__(self, body, status, mimetype, ttl=TTL_SECONDS):
+        self.body = body
+        self.status = status
+        self.mimetype = mimetype
+        self.etag = hashlib.sha1(body).hexdigest()[:16]
+        self.expires = time.monotonic() + ttl
+
+    @property
+    def cacheable(self):
+        # Server errors may be transient; everything else is deterministic for a dataset version
+        return self.status < 500
+
+
+class ResponseCache:
+    def __init__(self, max_entries=MAX_ENTRIES, max_bytes=MAX_BYTES, ttl=TTL_SECONDS):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._pending = {}
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+        self.expirations = 0
+        # A forked worker must not inherit a held lock or another process's pending computations
+        forksafe.register(self)
+
+    def _after_fork(self):
+        self._lock = threading.Lock()
+        self._pending = {}
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def enabled(self):
+        return self.max_entries > 0 and self.max_bytes > 0 and self.ttl > 0
+
+    def _drop(self, key):
+        entry = self._entries.pop(key)
+        self.bytes -= len(entry.body)
+
+    def _store(self, key, entry):
+        if len(entry.body) > self.max_bytes:
+            return
+        if key in self._entries:
+            self._drop(key)
+        self._entries[key] = entry
+        self.bytes += len(entry.body)
+        while len(self._entries) > self.max_entries or self.bytes > self.max_bytes:
+            self._drop(next(iter(self._entries)))
+            self.evictions += 1
+
+    def _live(self, key):
+        # Caller holds the lock
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry.expires <= time.monotonic():
+            self._drop(key)
+            self.expirations += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        CACHE_REQUESTS.inc(route=key[0], result='hit')
+        return entry
+
+    def lookup(self, key):
+        # The live entry, or None when the caller has to compute it (counted as a miss)
+        if not self.enabled:
+            CACHE_REQUESTS.inc(route=key[0], result='bypass')
+            return None
+        with self._lock:
+            entry = self._live(key)
+            if entry is None:
+                self.misses += 1
+        if entry is None:
+            CACHE_REQUESTS.inc(route=key[0], result='miss')
+        return entry
+
+    def put(self, key, entry):
+        if self.enabled and entry.cacheable:
+            with self._lock:
+                self._store(key, entry)
+
+    def get_or_compute(self, key, compute):
+        # key[0] is the route; compute() returns a CachedResponse
+        route = key[0]
+        if not self.enabled:
+            CACHE_REQUESTS.inc(route=route, result='bypass')
+            return compute(), 'bypass'
+
+        with self._lock:
+            entry = self._live(key)
+            if entry is not None:
+                return entry, 'hit'
+            pending = self._pending.get(key)
+            leader = pending is None
+            if leader:
+                pending = self._pending[key] = Future()
+                self.misses += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            CACHE_REQUESTS.inc(route=route, result='coalesced')
+            return pending.result(), 'coalesced'
+
+        CACHE_REQUESTS.inc(route=route, result='miss')
+        try:
+            entry = compute()
+        except BaseException as e:
+            with self._lock:
+                del self._pending[key]
+            pending.set_exception(e)
+            raise
+        with self._lock:
+            del self._pending[key]
+            if entry.cacheable:
+                self._store(key, entry)
+        pending.set_result(entry)
+        return entry, 'miss'
+
+    def clear(self):
+        with self._lock:
+            dropped = len(self._entries)
+            self._entries.clear()
+            self.bytes = 0
+        return dropped
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses + self.coalesced
+            routes = {}
+            for key in self._entries:
+                routes[key[0]] = routes.get(key[0], 0) + 1
+            return {
+                'enabled': self.enabled,
+                'entries': len(self._entries),
+                'bytes': self.bytes,
+                'max_entries': self.max_entries,
+                'max_bytes': self.max_bytes,
+                'ttl_seconds': self.ttl,
+                'price_step': PRICE_STEP,
+                'hits': self.hits,
+                'misses': self.misses,
+                'coalesced': self.coalesced,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'hit_rate': round((self.hits + self.coalesced) / lookups, 4) if lookups else None,
+                'entries_by_route': routes
+            }
@@ -0,0 +1,185 @@
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+# Typed columnar layout for the processed dataset: one .npy file per column
+# plus a manifest. Strings are dictionary-encoded (codes + categories),
+# integers are downcast to the narrowest dtype that holds them, and everything is memory-mapped on
+# load, so startup skips CSV parsing and workers share the page cache.
+
+PROCESSED_CSV = 'models/Processed.csv'
+COLUMNAR_DIR = 'models/Processed.columns'
+FALLBACK_CSVS = [
+    ('data/Airbnb_Dataset.csv', 'Dataset.csv'),
+    ('data/Airbnb_cleaned_data.csv', 'cleaned data')
+]
+MANIFEST = 'manifest.json'
+FORMAT_VERSION = 1
+
+
+def source_signature(path):
+    stat = os.stat(path)
+    return {'file': os.path.basename(path), 'size': stat.st_size, 'mtime': int(stat.st_mtime)}
+
+
+def downcast(values):
+    if values.dtype.kind == 'i':
+        return pd.to_numeric(values, downcast='integer')
+    if values.dtype.kind == 'u':
+        return pd.to_numeric(values, downcast='unsigned')
+    # Floats stay float64 so means and quantiles match the CSV path exactly
+    return values
+
+
+def column_kind(series):
+    if pd.api.types.is_bool_dtype(series.dtype):
+        return 'bool'
+    if pd.api.types.is_datetime64_dtype(series.dtype):
+        return 'datetime'
+    if pd.api.types.is_numeric_dtype(series.dtype) and not isinstance(series.dtype, pd.CategoricalDtype):
+        return 'numeric'
+    return 'categorical'
+
+
+def compact(df):
+    # The columnar layout's encoding, in memory, for frames parsed from CSV:
+    # strings dictionary-encoded, integers downcast
+    for name in df.columns:
+        series = df[name]
+        kind = column_kind(series)
+        if kind == 'categorical' and not isinstance(series.dtype, pd.CategoricalDtype):
+            df[name] = series.astype('category')
+        elif kind == 'numeric' and series.dtype.kind in 'iu':
+            df[name] = downcast(series)
+    return df
+
+
+def write_columnar(df, out_dir=COLUMNAR_DIR, source=None):
+    os.makedirs(out_dir, exist_ok=True)
+    columns = []
+    for i, name in enumerate(df.columns):
+        series = df[name]
+        kind = column_kind(series)
+        entry = {'name': name, 'kind': kind, 'file': f'col_{i:03d}.npy'}
+        if kind == 'categorical':
+            categorical = series.astype('category')
+            values = categorical.cat.codes.to_numpy()
+            entry['categories'] = f'col_{i:03d}.categories.json'
+            with open(os.path.join(out_dir, entry['categories']), 'w') as f:
+                json.dump(categorical.cat.categories.tolist(), f)
+        elif kind == 'datetime':
+            values = series.to_numpy()
+            entry['dtype'] = str(values.dtype)
+            values = values.view(np.int64)
+        elif kind == 'bool':
+            values = series.to_numpy(dtype=bool)
+        else:
+            values = downcast(series.to_numpy())
+        np.save(os.path.join(out_dir, entry['file']), np.ascontiguousarray(values))
+        columns.append(entry)
+
+    manifest = {'format_version': FORMAT_VERSION, 'rows': len(df), 'columns': columns, 'source': source}
+    return write_manifest(out_dir, manifest)
+
+
+def write_manifest(out_dir, manifest):
+    # Manifest goes last, so a half-written directory is never picked up
+    tmp_path = os.path.join(out_dir, MANIFEST + '.tmp')
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f, indent=1)
+    os.replace(tmp_path, os.path.join(out_dir, MANIFEST))
+    return manifest
+
+
+def read_manifest(path=COLUMNAR_DIR):
+    with open(os.path.join(path, MANIFEST)) as f:
+        return json.load(f)
+
+
+def load_columnar(path=COLUMNAR_DIR, mmap=True):
+    manifest = read_manifest(path)
+    data = {}
+    for entry in manifest['columns']:
+        values = np.load(os.path.join(path, entry['file']), mmap_mode='r' if mmap else None)
+        if entry['kind'] == 'categorical':
+            with open(os.path.join(path, entry['categories'])) as f:
+                categories = json.load(f)
+            data[entry['name']] = pd.Categorical.from_codes(values, categories=categories, validate=False)
+        elif entry['kind'] == 'datetime':
+            data[entry['name']] = values.view(entry['dtype'])
+        else:
+            data[entry['name']] = values
+    return pd.DataFrame(data, copy=False)
+
+
+def columnar_is_current(path=COLUMNAR_DIR, source_csv=PROCESSED_CSV):
+    if not os.path.exists(os.path.join(path, MANIFEST)):
+        return False
+    manifest = read_manifest(path)
+    if manifest.get('format_version') != FORMAT_VERSION:
+        return False
+    if not os.path.exists(source_csv) or not manifest.get('source'):
+        return True
+    return manifest['source'] == source_signature(source_csv)
+
+
+def load_dataset(csv_path=PROCESSED_CSV, columnar_dir=COLUMNAR_DIR, fallbacks=FALLBACK_CSVS):
+    if os.path.exists(os.path.join(columnar_dir, MANIFEST)):
+        if columnar_is_current(columnar_dir, csv_path):
+            df = load_columnar(columnar_dir)
+            print(f"✅ Loaded: {len(df)} rows from {os.path.basename(columnar_dir)}")
+            return df
+        print(f"⚠️ {columnar_dir} is stale, run `python dataset.py build` to refresh it")
+    if os.path.exists(csv_path):
+        from sharedmem import shared_dataset_enabled, publish_dataset
+        if shared_dataset_enabled():
+            shared_dir = publish_dataset(csv_path)
+            df = load_columnar(shared_dir)
+            print(f"✅ Attached: {len(df)} rows from shared dataset {shared_dir}")
+            return df
+    # The last candidate is read unconditionally so a missing dataset raises
+    candidates = [(csv_path, os.path.basename(csv_path))] + list(fallbacks)
+    for path, label in candidates:
+        if os.path.exists(path) or path == candidates[-1][0]:
+            df = compact(pd.read_csv(path))
+            print(f"✅ Loaded: {len(df)} rows from {label}")
+            return df
+
+
+def build(source=PROCESSED_CSV, out_dir=COLUMNAR_DIR):
+    started = time.perf_counter()
+    df = pd.read_csv(source, low_memory=False)
+    parsed = time.perf_counter()
+    manifest = write_columnar(df, out_dir, source=source_signature(source))
+    written = time.perf_counter()
+    csv_bytes = df.memory_usage(deep=True).sum()
+    columnar_bytes = load_columnar(out_dir, mmap=False).memory_usage(deep=True).sum()
+    print(f"✅ Wrote {manifest['rows']} rows × {len(manifest['columns'])} columns to {out_dir}")
+    print(f"   CSV parse {parsed - started:.2f}s, write {written - parsed:.2f}s")
+    print(f"   Frame size {csv_bytes / 1e6:.1f} MB -> {columnar_bytes / 1e6:.1f} MB")
+    return manifest
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='NestMetrics dataset tools')
+    commands = parser.add_subparsers(dest='command', required=True)
+    build_cmd = commands.add_parser('build', help='Convert the processed CSV to the columnar layout')
+    build_cmd.add_argument('--source', default=PROCESSED_CSV)
+    build_cmd.add_argument('--out', default=COLUMNAR_DIR)
+    args = parser.parse_args(argv)
+
+    if args.command == 'build':
+        if not os.path.exists(args.source):
+            print(f"❌ Source dataset not found: {args.source}")
+            return 1
+        build(args.source, args.out)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
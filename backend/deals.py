@@ -0,0 +1,79 @@
+import numpy as np
+
+from serialize import column_records
+
+# Top-K deal ranking over presorted segments.
+#
+#   value_score = reviews * 20 + (100 - price / max_budget * 100)
+#
+# For a fixed budget the price term is bounded by the cheapest listing in the
+# segment, so walking a segment in descending-reviews order gives an upper
+# bound on every remaining score. The scan stops as soon as that bound drops
+# below the current K-th best, which for skewed review counts touches only a
+# small slice of the segment.
+
+REVIEWS_COL = 'reviews per month'
+NAME_COL = 'NAME'
+SCAN_CHUNK = 1024
+MAX_DEALS_K = 500
+
+
+class DealEngine:
+    def __init__(self, df, segments, reviews_col=REVIEWS_COL, name_col=NAME_COL):
+        self.segments = segments
+        self.names = df[name_col] if name_col in df.columns else None
+        if reviews_col in df.columns:
+            reviews = df[reviews_col].to_numpy(dtype=float, na_value=np.nan)
+        else:
+            reviews = np.zeros(len(df))
+        self.reviews = np.nan_to_num(reviews, nan=0.0)
+
+        self._by_reviews = {}
+        for key in segments.keys():
+            rows = segments.rows(*key)
+            # Descending reviews, ties in dataset order
+            order = rows[np.lexsort((rows, -self.reviews[rows]))]
+            self._by_reviews[key] = (order, self.reviews[order], segments.prices[order])
+
+    def deals_found(self, room_type, neighborhood, max_budget):
+        return self.segments.count_under_price(max_budget, room_type, neighborhood)
+
+    def avg_price(self, room_type, neighborhood, max_budget):
+        return self.segments.price_prefix_mean(max_budget, room_type, neighborhood)
+
+    def top(self, room_type, neighborhood, max_budget, k=10, offset=0):
+        entry = self._by_reviews.get((room_type, neighborhood))
+        found = self.deals_found(room_type, neighborhood, max_budget)
+        if entry is None or found == 0 or k <= 0:
+            return np.empty(0, dtype=np.intp), np.empty(0)
+
+        rows, reviews, prices = entry
+        need = min(offset + k, found)
+        min_price = self.segments.sorted_prices(room_type, neighborhood)[0]
+        price_bound = 100 - (min_price / max_budget * 100)
+
+        best_rows = np.empty(0, dtype=np.intp)
+        best_scores = np.empty(0)
+        for start in range(0, len(rows), SCAN_CHUNK):
+            if len(best_scores) >= need and reviews[start] * 20 + price_bound < best_scores[-1]:
+                break
+            chunk = slice(start, start + SCAN_CHUNK)
+            within = prices[chunk] <= max_budget
+            if not within.any():
+                continue
+            scores = (reviews[chunk][within] * 20) + (100 - (prices[chunk][within] / max_budget * 100))
+            best_rows = np.concatenate([best_rows, rows[chunk][within]])
+            best_scores = np.concatenate([best_scores, scores])
+            # Score descending, dataset order on ties (same as DataFrame.nlargest)
+            order = np.lexsort((best_rows, -best_scores))[:need]
+            best_rows, best_scores = best_rows[order], best_scores[order]
+
+        return best_rows[offset:need], best_scores[offset:need]
+
+    def records(self, rows, scores):
+        return column_records({
+            'name': self.names.array.take(rows) if self.names is not None else [None] * len(rows),
+            'price': self.segments.prices[rows],
+            'reviews_per_month': self.reviews[rows],
+            'value_score': scores
+        })
@@ -0,0 +1,452 @@
+import argparse
+import io
+import json
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from dataset import COLUMNAR_DIR, FORMAT_VERSION, load_columnar, source_signature, write_manifest
+
+# Streaming ETL from the raw Airbnb export to the processed dataset, replacing
+# the preprocessing cells of notebooks/model_training.ipynb.
+#
+#   python etl.py data/Airbnb_Dataset.csv [--out models/Processed.columns] [--csv models/Processed.csv]
+#
+# The raw CSV is cut into byte ranges on record boundaries (quote-aware, so
+# multi-line text fields stay whole) and each range is parsed and cleaned in a
+# worker process. The parent dedups listing ids across chunks in file order
+# and appends every column to a part file, so memory stays bounded by the
+# chunk size and the number of chunks in flight; only the id hash set grows
+# with the dataset. A final pass sorts categories (matching pandas and
+# LabelEncoder order) and writes the columnar layout read by dataset.py.
+
+RAW_CSV = 'data/Airbnb_Dataset.csv'
+CHUNK_BYTES = int(os.environ.get('ETL_CHUNK_MB', 32)) * 2**20
+COPY_BLOCK = 1 << 20
+CSV_BLOCK_ROWS = 100_000
+
+DROP_COLUMNS = ['house_rules', 'license']
+PRICE_COLUMNS = {'price': 'price_$', 'service fee': 'service_fee_$'}
+NEIGHBORHOOD_FIXES = {'brookln': 'Brooklyn', 'manhatan': 'Manhattan'}
+MAX_AVAILABILITY = 500
+# Label-encoded copies appended for the models, as the notebook did
+ENCODED_COLUMNS = {
+    'room_type_enc': 'room type',
+    'neighbourhood_group_enc': 'neighbourhood group',
+    'host_verified_enc': 'host_identity_verified'
+}
+
+# Output kinds; anything not listed is kept as a categorical string. 'number'
+# columns come out as integers only if every raw token in the file is a plain
+# integer, which is what pandas' type inference gave the notebook.
+COLUMN_KINDS = {
+    'id': 'int',
+    'host id': 'int',
+    'lat': 'number',
+    'long': 'number',
+    'instant_bookable': 'bool',
+    'Construction year': 'int',
+    'price_$': 'float',
+    'service_fee_$': 'float',
+    'minimum nights': 'number',
+    'number of reviews': 'number',
+    'last review': 'date',
+    'reviews per month': 'number',
+    'review rate number': 'number',
+    'calculated host listings count': 'number',
+    'availability 365': 'number'
+}
+BOOL_VALUES = {'true': True, 't': True, 'yes': True, 'false': False, 'f': False, 'no': False}
+INTEGER_PATTERN = r'-?\d+(?:\.0*)?'
+
+
+def chunk_ranges(path, chunk_bytes=CHUNK_BYTES):
+    with open(path, 'rb') as f:
+        header = f.readline()
+        start = f.tell()
+        size = os.fstat(f.fileno()).st_size
+        block = chunk_bytes
+        while start < size:
+            f.seek(start)
+            buf = f.read(block)
+            if start + len(buf) >= size:
+                yield header, start, size
+                return
+            data = np.frombuffer(buf, dtype=np.uint8)
+            # A newline ends a record only outside quotes (even quote count before it)
+            quotes = np.flatnonzero(data == ord('"'))
+            newlines = np.flatnonzero(data == ord('\n'))
+            ends = newlines[(np.searchsorted(quotes, newlines) & 1) == 0]
+            if not len(ends):
+                block *= 2
+                continue
+            end = start + int(ends[-1]) + 1
+            yield header, start, end
+            start, block = end, chunk_bytes
+
+
+def parse_price(values):
+    # "$1,234 " -> 1234.0; anything unparseable becomes NaN and is dropped later
+    cleaned = values.str.replace(r'[$,\s]', '', regex=True)
+    return pd.to_numeric(cleaned, errors='coerce')
+
+
+def parse_integers(values):
+    # Straight from the digits, so 18-digit listing ids don't round through float64
+    stripped = values.str.strip()
+    valid = stripped.str.fullmatch(INTEGER_PATTERN).fillna(False).to_numpy(dtype=bool)
+    parsed = np.zeros(len(values), dtype=np.int64)
+    parsed[valid] = stripped[valid].str.replace(r'\.0*$', '', regex=True).astype(np.int64)
+    return parsed, valid
+
+
+def convert(series, kind):
+    if kind == 'int':
+        parsed, valid = parse_integers(series)
+        return pd.Series(pd.arrays.IntegerArray(parsed, ~valid), index=series.index)
+    if kind in ('float', 'number'):
+        return pd.to_numeric(series, errors='coerce')
+    if kind == 'bool':
+        return series.str.strip().str.lower().map(BOOL_VALUES)
+    if kind == 'date':
+        return pd.to_datetime(series, errors='coerce', format='mixed')
+    return series
+
+
+def clean_chunk(path, header, start, end):
+    with open(path, 'rb') as f:
+        f.seek(start)
+        raw = f.read(end - start)
+    # Everything arrives as str so dtypes can't drift between chunks; dropped
+    # free-text columns are never materialized
+    df = pd.read_csv(io.BytesIO(header + raw), dtype=str, low_memory=False, usecols=lambda col: col not in DROP_COLUMNS)
+    del raw
+    raw_rows = len(df)
+    keys, valid_ids = parse_integers(df['id']) if 'id' in df.columns else (np.zeros(raw_rows, dtype=np.int64), np.zeros(raw_rows, dtype=bool))
+
+    for col in PRICE_COLUMNS:
+        if col in df.columns:
+            df[col] = parse_price(df[col])
+    df = df.rename(columns=PRICE_COLUMNS)
+    integral = {}
+    for col in df.columns:
+        if col in COLUMN_KINDS and col not in PRICE_COLUMNS.values():
+            if COLUMN_KINDS[col] == 'number':
+                integral[col] = bool(df[col].str.strip().str.fullmatch(r'-?\d+').fillna(False).all())
+            df[col] = convert(df[col], COLUMN_KINDS[col])
+
+    keep = df.notna().all(axis=1).to_numpy() & valid_ids
+    missing = raw_rows - int(keep.sum())
+    if 'neighbourhood group' in df.columns:
+        df['neighbourhood group'] = df['neighbourhood group'].replace(NEIGHBORHOOD_FIXES)
+    outliers = 0
+    if 'availability 365' in df.columns:
+        in_range = (df['availability 365'] <= MAX_AVAILABILITY).to_numpy()
+        outliers = int((keep & ~in_range).sum())
+        keep &= in_range
+
+    positions = np.flatnonzero(keep)
+    df = df.iloc[positions]
+    columns = {}
+    for col in df.columns:
+        kind = COLUMN_KINDS.get(col, 'category')
+        if kind == 'date':
+            kind, series = 'category', df[col].dt.strftime('%Y-%m-%d')
+        else:
+            series = df[col]
+        if kind == 'category':
+            # Factorize in the worker so only small code arrays cross the process boundary
+            codes, uniques = pd.factorize(series)
+            columns[col] = (kind, codes.astype(np.int32), uniques.tolist())
+        elif kind == 'number':
+            columns[col] = (kind, series.to_numpy(dtype=np.float64), integral[col])
+        elif kind == 'int':
+            columns[col] = (kind, series.to_numpy(dtype=np.int64), None)
+        elif kind == 'bool':
+            columns[col] = (kind, series.to_numpy(dtype=bool), None)
+        else:
+            columns[col] = (kind, series.to_numpy(dtype=np.float64), None)
+
+    return {
+        'raw_rows': raw_rows,
+        'keys': keys[valid_ids],
+        'key_positions': np.flatnonzero(valid_ids),
+        'positions': positions,
+        'columns': columns,
+        'missing': missing,
+        'outliers': outliers
+    }
+
+
+class IdSet:
+    # Open-addressing hash set of int64 ids (linear probing, Fibonacci hashing),
+    # inserted a chunk at a time with numpy ops. ~13 bytes per id at 70% load.
+    MAX_LOAD = 0.7
+
+    def __init__(self, capacity=1 << 16):
+        self._bits = max(int(capacity - 1).bit_length(), 4)
+        self._keys = np.zeros(1 << self._bits, dtype=np.int64)
+        self._used = np.zeros(1 << self._bits, dtype=bool)
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def _slots(self, keys):
+        hashed = keys.view(np.uint64) * np.uint64(0x9E3779B97F4A7C15)
+        return (hashed >> np.uint64(64 - self._bits)).astype(np.intp)
+
+    def _insert_unique(self, keys):
+        mask = len(self._keys) - 1
+        slots = self._slots(keys)
+        fresh = np.zeros(len(keys), dtype=bool)
+        pending = np.arange(len(keys))
+        while len(pending):
+            slot = slots[pending]
+            key = keys[pending]
+            used = self._used[slot]
+            collided = pending[used & (self._keys[slot] != key)]
+            # Several pending keys may claim the same empty slot; the last write wins
+            claim = ~used
+            self._keys[slot[claim]] = key[claim]
+            self._used[slot[claim]] = True
+            won = self._keys[slot[claim]] == key[claim]
+            fresh[pending[claim][won]] = True
+            pending = np.concatenate([collided, pending[claim][~won]])
+            slots[pending] = (slots[pending] + 1) & mask
+        self.size += int(fresh.sum())
+        return fresh
+
+    def _grow(self):
+        existing = self._keys[self._used]
+        self._bits += 1
+        self._keys = np.zeros(1 << self._bits, dtype=np.int64)
+        self._used = np.zeros(1 << self._bits, dtype=bool)
+        self.size = 0
+        self._insert_unique(existing)
+
+    def add(self, keys):
+        # Returns a mask of keys not seen before, counting only the first of repeats within keys
+        keys = np.asarray(keys, dtype=np.int64)
+        unique, first = np.unique(keys, return_index=True)
+        while (self.size + len(unique)) > self.MAX_LOAD * len(self._keys):
+            self._grow()
+        fresh = self._insert_unique(unique)
+        mask = np.zeros(len(keys), dtype=bool)
+        mask[first[fresh]] = True
+        return mask
+
+
+def _smallest_int_dtype(low, high):
+    for dtype in (np.int8, np.int16, np.int32, np.int64):
+        info = np.iinfo(dtype)
+        if info.min <= low and high <= info.max:
+            return np.dtype(dtype)
+    return np.dtype(np.int64)
+
+
+class ColumnParts:
+    # Append-only spill of one output column; categorical values are stored as
+    # codes into a global dictionary that grows in first-seen order
+    def __init__(self, name, kind, path):
+        self.name = name
+        self.kind = kind
+        self.path = path
+        self.dtype = {'int': np.int64, 'float': np.float64, 'number': np.float64, 'bool': np.bool_, 'category': np.int32}[kind]
+        self.categories = {}
+        self.integral = kind == 'number'
+        self.low, self.high = 0, 0
+        self.rows = 0
+        self._file = open(path, 'ab')
+
+    def append(self, values, extra=None):
+        if self.kind == 'category':
+            mapping = np.array([self.categories.setdefault(u, len(self.categories)) for u in extra], dtype=np.int32)
+            values = mapping[values] if len(mapping) else values
+        elif self.kind == 'number':
+            self.integral = self.integral and extra
+        if self.kind in ('int', 'number') and len(values):
+            low, high = values.min(), values.max()
+            self.low, self.high = (low, high) if self.rows == 0 else (min(self.low, low), max(self.high, high))
+        np.ascontiguousarray(values, dtype=self.dtype).tofile(self._file)
+        self.rows += len(values)
+
+    def sorted_codes(self):
+        # Remap first-seen codes to sorted category order (pandas / LabelEncoder order)
+        categories = list(self.categories)
+        order = sorted(range(len(categories)), key=categories.__getitem__)
+        rank = np.empty(len(categories), dtype=np.int64)
+        rank[order] = np.arange(len(categories))
+        return [categories[i] for i in order], rank
+
+    def close(self):
+        self._file.close()
+
+
+def _copy_column(parts, out_path, remap=None, dtype=None):
+    dtype = np.dtype(dtype or parts.dtype)
+    target = np.lib.format.open_memmap(out_path, mode='w+', dtype=dtype, shape=(parts.rows,))
+    with open(parts.path, 'rb') as f:
+        for start in range(0, parts.rows, COPY_BLOCK):
+            block = np.fromfile(f, dtype=parts.dtype, count=min(COPY_BLOCK, parts.rows - start))
+            target[start:start + len(block)] = remap[block] if remap is not None else block
+    target.flush()
+    del target
+
+
+def finalize(parts_by_column, out_dir, source=None, extra=None):
+    columns = []
+    rows = 0
+    sorted_codes = {}
+    for i, parts in enumerate(parts_by_column.values()):
+        parts.close()
+        rows = parts.rows
+        entry = {'name': parts.name, 'kind': 'numeric', 'file': f'col_{i:03d}.npy'}
+        out_path = os.path.join(out_dir, entry['file'])
+        if parts.kind == 'category':
+            categories, rank = parts.sorted_codes()
+            # Same code width pandas picks for astype("category")
+            code_dtype = _smallest_int_dtype(-1, len(categories) + 1)
+            entry['kind'] = 'categorical'
+            entry['categories'] = f'col_{i:03d}.categories.json'
+            with open(os.path.join(out_dir, entry['categories']), 'w') as f:
+                json.dump(categories, f)
+            _copy_column(parts, out_path, rank.astype(code_dtype), code_dtype)
+            sorted_codes[parts.name] = (out_path, code_dtype, len(categories))
+        elif parts.kind == 'int' or (parts.kind == 'number' and parts.integral):
+            _copy_column(parts, out_path, dtype=_smallest_int_dtype(parts.low, parts.high))
+        else:
+            if parts.kind == 'bool':
+                entry['kind'] = 'bool'
+            _copy_column(parts, out_path)
+        os.remove(parts.path)
+        columns.append(entry)
+
+    for name, source_col in ENCODED_COLUMNS.items():
+        if source_col not in sorted_codes:
+            continue
+        codes_path, code_dtype, count = sorted_codes[source_col]
+        entry = {'name': name, 'kind': 'numeric', 'file': f'col_{len(columns):03d}.npy'}
+        # LabelEncoder codes are exactly the sorted category codes
+        codes = np.load(codes_path, mmap_mode='r')
+        np.save(os.path.join(out_dir, entry['file']), codes.astype(_smallest_int_dtype(0, count)))
+        del codes
+        columns.append(entry)
+
+    manifest = {'format_version': FORMAT_VERSION, 'rows': rows, 'columns': columns, 'source': source}
+    if extra:
+        manifest['etl'] = extra
+    return write_manifest(out_dir, manifest)
+
+
+def write_csv(columnar_dir, csv_path, block_rows=CSV_BLOCK_ROWS):
+    df = load_columnar(columnar_dir)
+    tmp_path = csv_path + '.tmp'
+    with open(tmp_path, 'w', newline='') as f:
+        for start in range(0, len(df), block_rows):
+            df.iloc[start:start + block_rows].to_csv(f, index=False, header=start == 0)
+        if not len(df):
+            df.to_csv(f, index=False)
+    os.replace(tmp_path, csv_path)
+
+
+def iter_results(path, workers, chunk_bytes):
+    ranges = chunk_ranges(path, chunk_bytes)
+    if workers <= 1:
+        for header, start, end in ranges:
+            yield clean_chunk(path, header, start, end)
+        return
+
+    with ProcessPoolExecutor(workers) as pool:
+        in_flight = []
+        for header, start, end in ranges:
+            in_flight.append(pool.submit(clean_chunk, path, header, start, end))
+            # Bounded look-ahead keeps memory at a few chunks per worker
+            if len(in_flight) >= workers * 2:
+                yield in_flight.pop(0).result()
+        for future in in_flight:
+            yield future.result()
+
+
+def run(source=RAW_CSV, out_dir=COLUMNAR_DIR, csv_path=None, workers=None, chunk_bytes=CHUNK_BYTES):
+    started = time.perf_counter()
+    workers = workers or os.cpu_count() or 1
+    parent = os.path.dirname(os.path.abspath(out_dir))
+    os.makedirs(parent, exist_ok=True)
+    staging = tempfile.mkdtemp(prefix='.etl-staging-', dir=parent)
+    stats = {'chunks': 0, 'raw_rows': 0, 'duplicates': 0, 'missing': 0, 'outliers': 0}
+
+    try:
+        seen = IdSet()
+        parts_by_column = None
+        for result in iter_results(source, workers, chunk_bytes):
+            stats['chunks'] += 1
+            stats['raw_rows'] += result['raw_rows']
+            stats['missing'] += result['missing']
+            stats['outliers'] += result['outliers']
+
+            # First occurrence of each id in file order wins, even if that row is then dropped
+            first_seen = np.zeros(result['raw_rows'], dtype=bool)
+            first_seen[result['key_positions']] = seen.add(result['keys'])
+            fresh = first_seen[result['positions']]
+            stats['duplicates'] += int(len(result['keys']) - first_seen.sum())
+
+            if parts_by_column is None:
+                parts_by_column = {
+                    col: ColumnParts(col, kind, os.path.join(staging, f'part_{i:03d}.bin'))
+                    for i, (col, (kind, _, _)) in enumerate(result['columns'].items())
+                }
+            for col, (kind, values, extra) in result['columns'].items():
+                parts_by_column[col].append(values[fresh], extra)
+
+        if parts_by_column is None:
+            raise ValueError(f'No rows found in {source}')
+
+        stats['rows'] = next(iter(parts_by_column.values())).rows
+        stats['source'] = source_signature(source)
+        manifest = finalize(parts_by_column, staging, extra=stats)
+        if csv_path:
+            write_csv(staging, csv_path)
+            # Tie the columnar copy to the CSV written alongside it
+            manifest['source'] = source_signature(csv_path)
+            write_manifest(staging, manifest)
+        if os.path.exists(out_dir):
+            shutil.rmtree(out_dir)
+        os.rename(staging, out_dir)
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(f"✅ Wrote {manifest['rows']} rows × {len(manifest['columns'])} columns to {out_dir}")
+    print(f"   {stats['raw_rows']} raw rows in {stats['chunks']} chunks: "
+          f"{stats['duplicates']} duplicate ids, {stats['missing']} incomplete, {stats['outliers']} outliers dropped")
+    print(f"   {time.perf_counter() - started:.2f}s with {workers} workers, parent peak RSS {peak_rss:.0f} MB")
+    return manifest
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Clean the raw Airbnb export into the processed dataset')
+    parser.add_argument('source', nargs='?', default=RAW_CSV)
+    parser.add_argument('--out', default=COLUMNAR_DIR, help='columnar output directory')
+    parser.add_argument('--csv', help='also write the processed rows as CSV (e.g. models/Processed.csv)')
+    parser.add_argument('--workers', type=int, help='worker processes (default: CPU count)')
+    parser.add_argument('--chunk-mb', type=int, default=CHUNK_BYTES // 2**20)
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(args.source):
+        print(f"❌ Raw dataset not found: {args.source}")
+        return 1
+    run(args.source, args.out, args.csv, args.workers, args.chunk_mb * 2**20)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,110 @@
+import os
+
+import numpy as np
+
+from serialize import JSON_SHAPES
+
+# Streaming listings export. Rows are located through the segment index
+# (no frame copy), walked in listing-id order for keyset pagination, and
+# encoded a chunk at a time, so memory stays flat regardless of how many
+# rows a client pulls. JSON and NDJSON chunks are encoded by serialize.py.
+
+EXPORT_FORMATS = {
+    'json': 'application/json',
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv'
+}
+EXPORT_CHUNK_ROWS = int(os.environ.get('EXPORT_CHUNK_ROWS', 5000))
+DEFAULT_JSON_LIMIT = 100
+
+
+def _optional_float(args, name):
+    value = args.get(name)
+    if value in (None, ''):
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        raise ValueError(f'{name} must be a number')
+
+
+def parse_listings_query(args, df):
+    fmt = args.get('format', 'json').lower()
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"format must be one of {', '.join(EXPORT_FORMATS)}")
+
+    # Row objects, or {"columns": [...], "data": [[...], ...]}; only JSON has a choice
+    shape = args.get('shape', 'records').lower()
+    if shape not in JSON_SHAPES:
+        raise ValueError(f"shape must be one of {', '.join(JSON_SHAPES)}")
+
+    limit = args.get('limit')
+    if limit in (None, ''):
+        # Exports stream everything unless told otherwise
+        limit = DEFAULT_JSON_LIMIT if fmt == 'json' else None
+    else:
+        limit = int(limit)
+        if limit < 0:
+            raise ValueError('limit must be non-negative')
+
+    after = args.get('after')
+    if after in (None, ''):
+        after = None
+    elif 'id' in df.columns and np.issubdtype(df['id'].dtype, np.number):
+        try:
+            after = float(after)
+        except ValueError:
+            raise ValueError('after must be a listing id')
+
+    columns = [c.strip() for c in args.get('columns', '').split(',') if c.strip()] or list(df.columns)
+    unknown = [c for c in columns if c not in df.columns]
+    if unknown:
+        raise ValueError(f"Unknown columns: {', '.join(unknown)}")
+
+    return {
+        'format': fmt,
+        'shape': shape,
+        'limit': limit,
+        'after': after,
+        'columns': columns,
+        'neighborhood': args.get('neighborhood') or None,
+        'room_type': args.get('room_type') or None,
+        'min_price': _optional_float(args, 'min_price'),
+        'max_price': _optional_float(args, 'max_price')
+    }
+
+
+def iter_listing_rows(segments, query, chunk_rows=EXPORT_CHUNK_ROWS):
+    # A cursor switches to id order; a plain first page keeps dataset order
+    if query['after'] is not None or query['format'] != 'json':
+        rows = segments.rows_by_id(query['room_type'], query['neighborhood'], query['after'])
+    else:
+        rows = segments.rows(query['room_type'], query['neighborhood'])
+
+    remaining = query['limit']
+    for start in range(0, len(rows), chunk_rows):
+        if remaining == 0:
+            return
+        chunk = rows[start:start + chunk_rows]
+        if query['min_price'] is not None or query['max_price'] is not None:
+            prices = segments.prices[chunk]
+            keep = np.ones(len(chunk), dtype=bool)
+            if query['min_price'] is not None:
+                keep &= prices >= query['min_price']
+            if query['max_price'] is not None:
+                keep &= prices <= query['max_price']
+            chunk = chunk[keep]
+        if remaining is not None:
+            chunk = chunk[:remaining]
+            remaining -= len(chunk)
+        if len(chunk):
+            yield chunk
+
+
+def encode_csv(df, chunks, columns):
+    header = True
+    for chunk in chunks:
+        yield df.iloc[chunk][columns].to_csv(index=False, header=header)
+        header = False
+    if header:
+        yield ','.join(columns) + '\n'
@@ -0,0 +1,280 @@
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from dataset import source_signature
+
+# Array-compiled random forest. Every tree of a fitted sklearn forest is
+# flattened into shared node arrays and evaluated for all trees and rows at
+# once, one tree level per numpy step. Siblings are stored next to each other
+# so the right child is always left + 1, and each node packs its left child
+# and split feature into a single int64, which keeps a level down to three
+# gathers. (tree, row) pairs drop out of the working set as they hit a leaf.
+#
+# Predictions match sklearn bit for bit: inputs are cast to float32 like
+# sklearn's validation does, thresholds stay float64, NaNs follow each node's
+# missing-value direction, and tree outputs are summed in estimator order
+# before dividing by the tree count.
+
+COMPILED_DIR = 'models/model.compiled'
+MANIFEST = 'manifest.json'
+FORMAT_VERSION = 1
+NODE_ARRAYS = ['nodes', 'threshold', 'value', 'missing_left', 'roots']
+FEATURE_BITS = 16
+FEATURE_MASK = (1 << FEATURE_BITS) - 1
+PREDICT_CHUNK_ROWS = int(os.environ.get('FOREST_PREDICT_CHUNK_ROWS', 4096))
+PREDICT_THREADS = int(os.environ.get('FOREST_PREDICT_THREADS', os.cpu_count() or 1))
+# Below this many (tree, row) pairs thread handoff costs more than it saves
+PARALLEL_MIN_PAIRS = 50000
+DEDUPE_MIN_ROWS = 64
+
+_pool = None
+
+
+def _thread_pool():
+    global _pool
+    if _pool is None:
+        _pool = ThreadPoolExecutor(PREDICT_THREADS, thread_name_prefix='forest-predict')
+    return _pool
+
+
+def _flatten_tree(tree, offset):
+    left, right = tree.children_left, tree.children_right
+    count = tree.node_count
+    internal = np.flatnonzero(left >= 0)
+    pair = 1 + 2 * np.arange(len(internal))
+
+    # Root stays first; the k-th internal node's children land at 1+2k, 2+2k
+    position = np.zeros(count, dtype=np.int64)
+    position[left[internal]] = pair
+    position[right[internal]] = pair + 1
+    order = np.empty(count, dtype=np.int64)
+    order[position] = np.arange(count)
+
+    leaf = left[order] < 0
+    child = np.zeros(count, dtype=np.int64)
+    child[position[internal]] = pair
+    feature = np.where(leaf, -1, tree.feature[order])
+    nodes = ((child + offset) << FEATURE_BITS) | (feature + 1)
+    threshold = np.where(leaf, np.inf, tree.threshold[order])
+    value = tree.value.reshape(count, -1)[order, 0]
+    missing = getattr(tree, 'missing_go_to_left', None)
+    missing_left = np.zeros(count, dtype=bool) if missing is None else missing[order].astype(bool)
+    return nodes, threshold, value, missing_left
+
+
+class CompiledForest:
+    def __init__(self, arrays, n_features, source=None):
+        for name in NODE_ARRAYS:
+            setattr(self, name, arrays[name])
+        self.n_features_in_ = n_features
+        self.n_estimators = len(self.roots)
+        self.source = source
+
+    @classmethod
+    def from_sklearn(cls, model):
+        estimators = getattr(model, 'estimators_', None)
+        if not estimators:
+            raise ValueError('Expected a fitted forest with estimators_')
+        if getattr(model, 'n_outputs_', 1) != 1 or hasattr(model, 'classes_'):
+            raise ValueError('Only single-output forest regressors can be compiled')
+        if model.n_features_in_ > FEATURE_MASK - 1:
+            raise ValueError(f'Too many features to pack: {model.n_features_in_}')
+
+        parts = []
+        roots = []
+        offset = 0
+        for estimator in estimators:
+            parts.append(_flatten_tree(estimator.tree_, offset))
+            roots.append(offset)
+            offset += estimator.tree_.node_count
+
+        nodes, threshold, value, missing_left = (np.concatenate(column) for column in zip(*parts))
+        arrays = {
+            'nodes': nodes.astype(np.int64),
+            'threshold': threshold.astype(np.float64),
+            'value': value.astype(np.float64),
+            'missing_left': missing_left,
+            'roots': np.array(roots, dtype=np.int64)
+        }
+        return cls(arrays, int(model.n_features_in_))
+
+    @property
+    def node_count(self):
+        return len(self.nodes)
+
+    @property
+    def feature(self):
+        return (np.asarray(self.nodes) & FEATURE_MASK) - 1
+
+    def _leaf_values(self, flat, n_rows, roots, has_nan):
+        n_trees = len(roots)
+        nodes = np.repeat(np.asarray(roots, dtype=np.intp), n_rows)
+        base = np.tile(np.arange(n_rows, dtype=np.intp) * self.n_features_in_, n_trees)
+        slot = np.arange(n_trees * n_rows, dtype=np.intp)
+        leaves = np.empty(n_trees * n_rows, dtype=np.intp)
+        while True:
+            packed = self.nodes[nodes]
+            feature = packed & FEATURE_MASK
+            at_leaf = feature == 0
+            finished = np.count_nonzero(at_leaf)
+            if finished:
+                leaves[slot[at_leaf]] = nodes[at_leaf]
+                if finished == len(nodes):
+                    break
+                active = ~at_leaf
+                nodes, base, slot = nodes[active], base[active], slot[active]
+                packed, feature = packed[active], feature[active]
+            x = flat[base + feature - 1]
+            go_right = ~(x <= self.threshold[nodes])
+            if has_nan:
+                go_right &= ~(np.isnan(x) & self.missing_left[nodes])
+            nodes = (packed >> FEATURE_BITS) + go_right
+        return self.value[leaves].reshape(n_trees, n_rows)
+
+    def _predict_rows(self, X):
+        n_rows = len(X)
+        flat = X.ravel()
+        has_nan = bool(np.isnan(flat).any())
+        if PREDICT_THREADS > 1 and self.n_estimators * n_rows >= PARALLEL_MIN_PAIRS:
+            groups = np.array_split(np.asarray(self.roots), min(PREDICT_THREADS, self.n_estimators))
+            values = np.concatenate(list(_thread_pool().map(
+                lambda roots: self._leaf_values(flat, n_rows, roots, has_nan), groups
+            )))
+        else:
+            values = self._leaf_values(flat, n_rows, self.roots, has_nan)
+
+        total = np.zeros(n_rows, dtype=np.float64)
+        for tree_values in values:
+            total += tree_values
+        return total / self.n_estimators
+
+    def predict(self, X):
+        X = np.asarray(X, dtype=np.float32)
+        if X.ndim != 2 or X.shape[1] != self.n_features_in_:
+            raise ValueError(f'X has {X.shape[-1]} features, but the model expects {self.n_features_in_}')
+        if np.isinf(X).any():
+            raise ValueError('Input X contains infinity')
+        X = np.ascontiguousarray(X)
+
+        inverse = None
+        if len(X) >= DEDUPE_MIN_ROWS:
+            # Request features are low-cardinality, so batches repeat rows a lot.
+            # Rows compare as raw bytes, which also folds together identical NaN rows.
+            row_bytes = X.view(np.dtype((np.void, X.dtype.itemsize * X.shape[1]))).ravel()
+            _, first, inverse = np.unique(row_bytes, return_index=True, return_inverse=True)
+            if len(first) < len(X):
+                X = X[first]
+            else:
+                inverse = None
+
+        predicted = np.concatenate([
+            self._predict_rows(X[start:start + PREDICT_CHUNK_ROWS])
+            for start in range(0, len(X), PREDICT_CHUNK_ROWS)
+        ]) if len(X) else np.empty(0)
+        return predicted if inverse is None else predicted[inverse.ravel()]
+
+    def save(self, out_dir=COMPILED_DIR):
+        os.makedirs(out_dir, exist_ok=True)
+        for name in NODE_ARRAYS:
+            np.save(os.path.join(out_dir, f'{name}.npy'), np.ascontiguousarray(getattr(self, name)))
+        manifest = {
+            'format_version': FORMAT_VERSION,
+            'n_estimators': self.n_estimators,
+            'n_features': self.n_features_in_,
+            'node_count': self.node_count,
+            'source': self.source
+        }
+        # Manifest goes last, so a half-written directory is never picked up
+        tmp_path = os.path.join(out_dir, MANIFEST + '.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump(manifest, f, indent=1)
+        os.replace(tmp_path, os.path.join(out_dir, MANIFEST))
+        return manifest
+
+    @classmethod
+    def load(cls, path=COMPILED_DIR, mmap=True):
+        with open(os.path.join(path, MANIFEST)) as f:
+            manifest = json.load(f)
+        arrays = {
+            name: np.load(os.path.join(path, f'{name}.npy'), mmap_mode='r' if mmap else None)
+            for name in NODE_ARRAYS
+        }
+        return cls(arrays, manifest['n_features'], manifest.get('source'))
+
+
+def compiled_is_current(path=COMPILED_DIR, model_path='models/model.pkl'):
+    manifest_path = os.path.join(path, MANIFEST)
+    if not os.path.exists(manifest_path):
+        return False
+    with open(manifest_path) as f:
+        manifest = json.load(f)
+    if manifest.get('format_version') != FORMAT_VERSION:
+        return False
+    if not os.path.exists(model_path) or not manifest.get('source'):
+        return True
+    return manifest['source'] == source_signature(model_path)
+
+
+def compile_model(model_path='models/model.pkl', out_dir=COMPILED_DIR, model=None):
+    import joblib
+    started = time.perf_counter()
+    if model is None:
+        model = joblib.load(model_path)
+    loaded = time.perf_counter()
+    forest = CompiledForest.from_sklearn(model)
+    forest.source = source_signature(model_path)
+    manifest = forest.save(out_dir)
+    compiled = time.perf_counter()
+    print(f"✅ Compiled {manifest['n_estimators']} trees ({manifest['node_count']} nodes) to {out_dir}")
+    print(f"   Pickle load {loaded - started:.2f}s, compile {compiled - loaded:.2f}s")
+    return forest, model
+
+
+def verify(forest, model, rows=2000, seed=0):
+    # Random rows spanning each feature's split range, compared exactly
+    rng = np.random.default_rng(seed)
+    feature, threshold = forest.feature, np.asarray(forest.threshold)
+    low = np.zeros(forest.n_features_in_)
+    high = np.ones(forest.n_features_in_)
+    for f in range(forest.n_features_in_):
+        used = threshold[feature == f]
+        if len(used):
+            low[f], high[f] = used.min() - 1, used.max() + 1
+    X = rng.uniform(low, high, size=(rows, forest.n_features_in_))
+    return float(np.max(np.abs(model.predict(X) - forest.predict(X))))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='NestMetrics model tools')
+    commands = parser.add_subparsers(dest='command', required=True)
+    compile_cmd = commands.add_parser('compile', help='Flatten the random forest into memory-mappable arrays')
+    compile_cmd.add_argument('--model', default='models/model.pkl')
+    compile_cmd.add_argument('--out', default=COMPILED_DIR)
+    compile_cmd.add_argument('--verify-rows', type=int, default=2000, help='rows to cross-check against sklearn (0 to skip)')
+    args = parser.parse_args(argv)
+
+    if args.command == 'compile':
+        if not os.path.exists(args.model):
+            print(f"❌ Model not found: {args.model}")
+            return 1
+        forest, model = compile_model(args.model, args.out)
+        if args.verify_rows:
+            # Single-threaded sklearn sums trees in estimator order, like the compiled evaluator
+            if hasattr(model, 'n_jobs'):
+                model.n_jobs = None
+            max_diff = verify(CompiledForest.load(args.out), model, args.verify_rows)
+            if max_diff != 0.0:
+                print(f"❌ Compiled predictions differ from sklearn by up to {max_diff}")
+                return 1
+            print(f"✅ Verified {args.verify_rows} rows: identical to sklearn")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
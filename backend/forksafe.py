@@ -0,0 +1,34 @@
+import os
+import threading
+import weakref
+
+# Locks in a forked child. fork() copies only the calling thread, so a lock
+# another thread held at that moment (the startup loader, the file watcher,
+# an ingest publisher, a to_thread worker of the async server) stays locked
+# in the child forever. Objects that own locks register here and get
+# _after_fork() called in every child to replace them. The set is weak, so
+# evicted markets' managers don't live on through it. (The standard library
+# already does the same for logging, threading and concurrent.futures.)
+
+_objects = weakref.WeakSet()
+
+
+def register(obj):
+    _objects.add(obj)
+    return obj
+
+
+def fresh_event(event):
+    # A new Event in the same state; set() / wait() take its internal lock
+    fresh = threading.Event()
+    if event.is_set():
+        fresh.set()
+    return fresh
+
+
+def _after_fork():
+    for obj in list(_objects):
+        obj._after_fork()
+
+
+os.register_at_fork(after_in_child=_after_fork)
@@ -0,0 +1,36 @@
+import gc
+import multiprocessing
+import os
+
+# Pre-fork serving: `gunicorn -c gunicorn.conf.py app:app`
+# The app (dataset, indexes, model) is imported once in the master and the
+# workers inherit it copy-on-write. Column data is memory-mapped from the
+# columnar layout (or a shared /dev/shm copy of Processed.csv), so extra
+# workers add almost no resident memory.
+
+os.environ.setdefault('NESTMETRICS_SHARED_DATASET', '1')
+
+bind = f"0.0.0.0:{os.environ.get('PORT', os.environ.get('FLASK_RUN_PORT', 5001))}"
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count()))
+threads = int(os.environ.get('GUNICORN_THREADS', 2))
+preload_app = True
+timeout = 120
+
+
+def pre_fork(server, worker):
+    # The master loads the data on a background thread; fork only once it is
+    # live, so every worker inherits it instead of loading its own copy
+    from app import boot
+    boot.wait()
+    # Move everything loaded so far out of the collector's reach, so GC passes
+    # in the workers don't write to (and un-share) the inherited pages
+    gc.collect()
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    # Threads don't survive fork, so each worker runs its own file watcher
+    from markets import watch_files_enabled
+    if watch_files_enabled():
+        from app import markets
+        markets.watch()
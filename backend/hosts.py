@@ -0,0 +1,184 @@
+import math
+
+import numpy as np
+import pandas as pd
+
+from segments import NEIGHBORHOOD_COL, PRICE_COL, row_dtype
+
+# Host leaderboard. Per-host aggregates (listings, mean/min/max price, total
+# reviews, mean review rating, verification) are computed with one groupby per
+# dataset version, overall and per borough, and stored as columnar arrays in
+# rank order. Pages, tier filters and per-host lookups index those arrays and
+# never touch the listing frame.
+#
+# Hosts are keyed by name, like the analytics top hosts always were. Rank is
+# listing count, then performance score, then total reviews.
+
+HOST_NAME_COL = 'host name'
+VERIFIED_COL = 'host_identity_verified'
+REVIEWS_COL = 'number of reviews'
+RATING_COL = 'review rate number'
+VERIFIED_VALUES = ('verified', 't', True)
+MAX_HOSTS_K = 500
+
+# performance_score = 60 * rating / 5 + 40 * review volume (log scale, full at 500)
+FULL_SCORE_REVIEWS = 500
+TIERS = ('Superhost', 'Plus', 'Standard')
+SUPERHOST_RATING, SUPERHOST_REVIEWS = 4.5, 50
+PLUS_RATING, PLUS_REVIEWS = 4.0, 10
+
+AGGREGATES = {
+    'listings': ('price', 'size'),
+    'avg_price': ('price', 'mean'),
+    'min_price': ('price', 'min'),
+    'max_price': ('price', 'max'),
+    'total_reviews': ('reviews', 'sum'),
+    'avg_rating': ('rating', 'mean'),
+    'verified': ('verified', 'max')
+}
+
+
+def performance_scores(avg_rating, total_reviews):
+    rating = np.nan_to_num(avg_rating, nan=0.0)
+    volume = np.minimum(np.log1p(total_reviews) / math.log1p(FULL_SCORE_REVIEWS), 1.0)
+    return np.round(60 * rating / 5 + 40 * volume)
+
+
+def host_tiers(avg_rating, total_reviews, verified):
+    rating = np.nan_to_num(avg_rating, nan=0.0)
+    superhost = (rating >= SUPERHOST_RATING) & (total_reviews >= SUPERHOST_REVIEWS) & verified
+    plus = (rating >= PLUS_RATING) & (total_reviews >= PLUS_REVIEWS)
+    return np.select([superhost, plus], [0, 1], default=2).astype(np.int8)
+
+
+def _number(value, decimals=None):
+    if value != value:
+        return None
+    return round(float(value), decimals) if decimals is not None else float(value)
+
+
+class HostTable:
+    def __init__(self, grouped, tiers, scores, host_count):
+        # Columns in rank order. grouped is indexed by host code; tiers and
+        # scores are the hosts' overall values, also indexed by host code.
+        codes = grouped.index.to_numpy()
+        order = np.lexsort((-grouped['total_reviews'].to_numpy(), -scores[codes], -grouped['listings'].to_numpy()))
+        self.codes = codes[order]
+        self.columns = {name: grouped[name].to_numpy()[order] for name in AGGREGATES}
+        self.tiers = tiers[self.codes]
+        self.scores = scores[self.codes]
+        self.rank_of = np.full(host_count, -1, dtype=row_dtype(host_count))
+        self.rank_of[self.codes] = np.arange(len(self.codes))
+        self._by_tier = {tier: np.flatnonzero(self.tiers == code) for code, tier in enumerate(TIERS)}
+
+    def __len__(self):
+        return len(self.codes)
+
+    def ranked(self, tier=None):
+        return self._by_tier[tier] if tier is not None else np.arange(len(self.codes))
+
+    def record(self, position, names):
+        columns = self.columns
+        min_price, max_price = columns['min_price'][position], columns['max_price'][position]
+        return {
+            'rank': int(position) + 1,
+            'host_name': str(names[self.codes[position]]),
+            'listings_count': int(columns['listings'][position]),
+            'avg_price': _number(columns['avg_price'][position], 2),
+            'min_price': _number(min_price),
+            'max_price': _number(max_price),
+            'price_range': f'${min_price:.0f}-{max_price:.0f}' if min_price == min_price else None,
+            'total_reviews': int(columns['total_reviews'][position]),
+            'avg_rating': _number(columns['avg_rating'][position], 2),
+            'verified': bool(columns['verified'][position]),
+            'performance_score': int(self.scores[position]),
+            'tier': TIERS[self.tiers[position]]
+        }
+
+
+class HostIndex:
+    def __init__(self, df, host_col=HOST_NAME_COL, neighborhood_col=NEIGHBORHOOD_COL, price_col=PRICE_COL):
+        self.tables = {}
+        self.names = np.empty(0, dtype=object)
+        self._lookup = pd.Index(self.names)
+        if host_col not in df.columns or df.empty:
+            return
+
+        def numeric(name):
+            if name not in df.columns:
+                return np.full(len(df), np.nan)
+            return pd.to_numeric(df[name], errors='coerce').to_numpy(dtype=float)
+
+        # Hosts are grouped by integer code; names are only looked up for output
+        codes, names = pd.factorize(df[host_col])
+        self.names = np.asarray(names, dtype=object)
+        self._lookup = pd.Index(self.names)
+        frame = pd.DataFrame({
+            'host': codes,
+            'neighborhood': df[neighborhood_col].reset_index(drop=True) if neighborhood_col in df.columns else None,
+            'price': numeric(price_col),
+            'reviews': np.nan_to_num(numeric(REVIEWS_COL)),
+            'rating': numeric(RATING_COL),
+            'verified': df[VERIFIED_COL].isin(VERIFIED_VALUES).to_numpy() if VERIFIED_COL in df.columns else False
+        })
+        # Listings without a host name aren't ranked
+        frame = frame[codes >= 0]
+
+        host_count = len(self.names)
+        overall = frame.groupby('host', sort=False).agg(**AGGREGATES)
+        tiers = np.full(host_count, len(TIERS) - 1, dtype=np.int8)
+        scores = np.zeros(host_count)
+        host_codes = overall.index.to_numpy()
+        tiers[host_codes] = host_tiers(overall['avg_rating'].to_numpy(), overall['total_reviews'].to_numpy(), overall['verified'].to_numpy())
+        scores[host_codes] = performance_scores(overall['avg_rating'].to_numpy(), overall['total_reviews'].to_numpy())
+        self.tables[None] = HostTable(overall, tiers, scores, host_count)
+
+        # Borough tables rank a host's listings in that borough, with its overall tier
+        if neighborhood_col in df.columns:
+            pairs = frame.groupby(['neighborhood', 'host'], observed=True, sort=False).agg(**AGGREGATES)
+            for neighborhood, grouped in pairs.groupby(level=0, observed=True, sort=False):
+                self.tables[neighborhood] = HostTable(grouped.droplevel(0), tiers, scores, host_count)
+
+    def __len__(self):
+        table = self.tables.get(None)
+        return len(table) if table is not None else 0
+
+    def neighborhoods(self):
+        return [neighborhood for neighborhood in self.tables if neighborhood is not None]
+
+    def top(self, limit=10, offset=0, tier=None, neighborhood=None):
+        # Returns (records, total matching hosts)
+        table = self.tables.get(neighborhood)
+        if table is None:
+            return [], 0
+        ranked = table.ranked(tier)
+        return [table.record(position, self.names) for position in ranked[offset:offset + limit]], len(ranked)
+
+    def lookup(self, host_name):
+        code = self._lookup.get_indexer([host_name])[0]
+        if code < 0 or None not in self.tables:
+            return None
+        host = self.tables[None].record(self.tables[None].rank_of[code], self.names)
+        host['neighborhoods'] = {}
+        for neighborhood in self.neighborhoods():
+            table = self.tables[neighborhood]
+            position = table.rank_of[code]
+            if position >= 0:
+                record = table.record(position, self.names)
+                host['neighborhoods'][str(neighborhood)] = {key: record[key] for key in ('rank', 'listings_count', 'avg_price', 'total_reviews', 'avg_rating')}
+        return host
+
+    def analytics_top(self, limit=10, price_col=PRICE_COL):
+        # The shape /api/advanced-analytics has always returned: name -> count, mean price, total reviews
+        table = self.tables.get(None)
+        if table is None:
+            return {}
+        columns = table.columns
+        return {
+            str(self.names[table.codes[position]]): {
+                'id': int(columns['listings'][position]),
+                price_col: _number(columns['avg_price'][position], 0),
+                'number of reviews': int(columns['total_reviews'][position])
+            }
+            for position in range(min(limit, len(table)))
+        }
@@ -0,0 +1,231 @@
+import json
+import os
+from itertools import islice
+
+import joblib
+import numpy as np
+import pandas as pd
+
+# Feature encoding and vectorized scoring for the price model. The 7 model
+# features are [room_type, neighborhood, min_nights, availability,
+# host_listings, lat, long]. train.py encodes listings through the same
+# function, so the served model always sees the layout it was fitted on.
+# Category codes come from the model's schema: NYC keeps the codes the
+# original model was trained with, other markets number their own values.
+
+ROOM_TYPE_CODES = {'Entire home/apt': 0, 'Private room': 1, 'Shared room': 2}
+NEIGHBORHOOD_CODES = {'Manhattan': 0, 'Brooklyn': 1, 'Queens': 2, 'Bronx': 3, 'Staten Island': 4}
+DEFAULT_LAT, DEFAULT_LONG = 40.7589, -73.9851
+MODEL_FEATURES = ['room_type', 'neighbourhood_group', 'minimum_nights', 'availability_365', 'host_listings', 'lat', 'long']
+MODEL_TARGET = 'price_$'
+
+INPUT_DEFAULTS = {
+    'room_type': 'Entire home/apt',
+    'neighbourhood_group': 'Manhattan',
+    'minimum_nights': 1,
+    'availability_365': 365,
+    'host_listings': 1
+}
+NUMERIC_INPUTS = ['minimum_nights', 'availability_365', 'host_listings']
+
+BATCH_CHUNK_SIZE = int(os.environ.get('BATCH_CHUNK_SIZE', 10000))
+BATCH_N_JOBS = int(os.environ.get('BATCH_N_JOBS', -1))
+
+MODEL_METHOD = 'random_forest'
+STATISTICAL_METHOD = 'statistical'
+
+
+class InvalidRow:
+    def __init__(self, message):
+        self.message = message
+
+
+def read_ndjson(lines):
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError as e:
+            yield InvalidRow(f'Invalid JSON: {e}')
+
+
+def chunked(records, size=BATCH_CHUNK_SIZE):
+    records = iter(records)
+    while True:
+        chunk = list(islice(records, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def coordinate_means(df):
+    avg_lat = float(df['lat'].mean()) if 'lat' in df.columns else DEFAULT_LAT
+    avg_long = float(df['long'].mean()) if 'long' in df.columns else DEFAULT_LONG
+    return avg_lat, avg_long
+
+
+def parse_inputs(records):
+    errors = {}
+    positions = []
+    for position, record in enumerate(records):
+        if isinstance(record, dict):
+            positions.append(position)
+        elif isinstance(record, InvalidRow):
+            errors[position] = record.message
+        else:
+            errors[position] = 'Input must be a JSON object'
+
+    frame = pd.DataFrame.from_records([records[p] for p in positions], columns=list(INPUT_DEFAULTS))
+    frame.index = positions
+    for col, default in INPUT_DEFAULTS.items():
+        frame[col] = frame[col].where(frame[col].notna(), default)
+
+    invalid = pd.Series(False, index=frame.index)
+    for col in ('room_type', 'neighbourhood_group'):
+        bad = ~frame[col].map(lambda value: isinstance(value, str)).astype(bool)
+        for position in frame.index[bad & ~invalid]:
+            errors[position] = f'Invalid {col}: {frame.at[position, col]!r}'
+        invalid |= bad
+    for col in NUMERIC_INPUTS:
+        values = pd.to_numeric(frame[col], errors='coerce')
+        bad = values.isna() | ~np.isfinite(values)
+        for position in frame.index[bad & ~invalid]:
+            errors[position] = f'Invalid {col}: {frame.at[position, col]!r}'
+        invalid |= bad
+        frame[col] = np.trunc(values.where(~bad, 0)).astype(np.int64)
+
+    return frame[~invalid], errors
+
+
+def encode_features(frame, avg_lat, avg_long, schema=None):
+    room_type_codes = schema['room_type_codes'] if schema else ROOM_TYPE_CODES
+    neighborhood_codes = schema['neighborhood_codes'] if schema else NEIGHBORHOOD_CODES
+    features = np.empty((len(frame), 7), dtype=np.float64)
+    features[:, 0] = frame['room_type'].map(room_type_codes).fillna(0).to_numpy(dtype=np.float64)
+    features[:, 1] = frame['neighbourhood_group'].map(neighborhood_codes).fillna(0).to_numpy(dtype=np.float64)
+    features[:, 2] = frame['minimum_nights'].to_numpy(dtype=np.float64)
+    features[:, 3] = frame['availability_365'].to_numpy(dtype=np.float64)
+    features[:, 4] = frame['host_listings'].to_numpy(dtype=np.float64)
+    features[:, 5] = avg_lat
+    features[:, 6] = avg_long
+    return features
+
+
+def model_schema():
+    return {
+        'features': MODEL_FEATURES,
+        'target': MODEL_TARGET,
+        'room_type_codes': ROOM_TYPE_CODES,
+        'neighborhood_codes': NEIGHBORHOOD_CODES
+    }
+
+
+def dataset_schema(df):
+    schema = model_schema()
+    if 'room type' in df.columns:
+        extra = sorted(set(df['room type'].dropna().astype(str)) - set(ROOM_TYPE_CODES))
+        schema['room_type_codes'] = {**ROOM_TYPE_CODES, **{name: len(ROOM_TYPE_CODES) + i for i, name in enumerate(extra)}}
+    if 'neighbourhood group' in df.columns:
+        groups = sorted(set(df['neighbourhood group'].dropna().astype(str)))
+        if not set(groups) <= set(NEIGHBORHOOD_CODES):
+            schema['neighborhood_codes'] = {name: i for i, name in enumerate(groups)}
+    return schema
+
+
+def listing_features(df, schema=None):
+    # Dataset rows mapped onto request inputs; listings keep their own coordinates
+    frame = pd.DataFrame({
+        'room_type': df['room type'].astype(object).to_numpy(),
+        'neighbourhood_group': df['neighbourhood group'].astype(object).to_numpy(),
+        'minimum_nights': df['minimum nights'].to_numpy(dtype=np.float64),
+        'availability_365': df['availability 365'].to_numpy(dtype=np.float64),
+        'host_listings': df['calculated host listings count'].to_numpy(dtype=np.float64)
+    })
+    features = encode_features(frame, 0.0, 0.0, schema)
+    features[:, 5] = df['lat'].to_numpy(dtype=np.float64)
+    features[:, 6] = df['long'].to_numpy(dtype=np.float64)
+    return features
+
+
+def segment_price_stats(segments, frame):
+    # One quantile-table lookup per distinct segment in the chunk, broadcast back to rows
+    stats = np.full((len(frame), 6), np.nan)
+    groups = frame.groupby(['room_type', 'neighbourhood_group'], sort=False).indices
+    for (room_type, neighborhood), rows in groups.items():
+        count = segments.price_count(room_type, neighborhood)
+        stats[rows, 0] = count
+        if count:
+            stats[rows, 1:] = segments.price_quantile([0.1, 0.25, 0.5, 0.75, 0.9], room_type, neighborhood)
+    return stats
+
+
+def model_predictions(model, frame, stats, avg_lat, avg_long, schema=None):
+    features = encode_features(frame, avg_lat, avg_long, schema)
+    with joblib.parallel_config(n_jobs=BATCH_N_JOBS):
+        predicted = np.asarray(model.predict(features), dtype=np.float64)
+
+    count, q10, q90 = stats[:, 0], stats[:, 1], stats[:, 5]
+    has_similar = count > 0
+    lower = np.maximum(predicted * 0.85, np.where(has_similar, q10, predicted * 0.8))
+    upper = np.minimum(predicted * 1.15, np.where(has_similar, q90, predicted * 1.2))
+    return predicted, lower, upper, np.ones(len(frame), dtype=bool)
+
+
+def statistical_predictions(frame, stats):
+    count, q25, median, q75 = stats[:, 0], stats[:, 2], stats[:, 3], stats[:, 4]
+    availability_factor = 1.0 - (frame['availability_365'].to_numpy() - 180) / 365 * 0.1
+    host_factor = 1.0 + np.minimum(frame['host_listings'].to_numpy() - 1, 10) * 0.02
+    nights_factor = 1.0 - np.minimum(frame['minimum_nights'].to_numpy() - 1, 7) * 0.01
+
+    predicted = median * availability_factor * host_factor * nights_factor
+    lower = np.maximum(predicted * 0.8, q25)
+    upper = np.minimum(predicted * 1.2, q75)
+    return predicted, lower, upper, count > 0
+
+
+def predict_chunk(model, df, segments, records, offset=0, coordinates=None, schema=None):
+    frame, errors = parse_inputs(records)
+    results = [None] * len(records)
+    for position, message in errors.items():
+        results[position] = {'index': offset + position, 'error': message}
+    if len(frame) == 0:
+        return results
+
+    stats = segment_price_stats(segments, frame)
+    method = STATISTICAL_METHOD
+    if model is not None:
+        try:
+            avg_lat, avg_long = coordinates or coordinate_means(df)
+            predicted, lower, upper, ok = model_predictions(model, frame, stats, avg_lat, avg_long, schema)
+            method = MODEL_METHOD
+        except Exception as model_error:
+            print(f"ML batch prediction failed: {model_error}")
+    if method == STATISTICAL_METHOD:
+        predicted, lower, upper, ok = statistical_predictions(frame, stats)
+
+    counts = stats[:, 0].astype(np.int64)
+    for i, position in enumerate(frame.index):
+        if not ok[i]:
+            results[position] = {'index': offset + position, 'error': 'No similar listings found'}
+            continue
+        results[position] = {
+            'index': offset + position,
+            'predicted_price': round(float(predicted[i]), 2),
+            'confidence_interval': {
+                'lower': round(float(lower[i]), 2),
+                'upper': round(float(upper[i]), 2)
+            },
+            'similar_listings_count': int(counts[i]),
+            'method': method
+        }
+    return results
+
+
+def predict_batch(model, df, segments, records, chunk_size=BATCH_CHUNK_SIZE, schema=None):
+    coordinates = coordinate_means(df)
+    offset = 0
+    for chunk in chunked(records, chunk_size):
+        yield predict_chunk(model, df, segments, chunk, offset, coordinates, schema)
+        offset += len(chunk)
@@ -0,0 +1,344 @@
+import copy
+import hashlib
+import os
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+import forksafe
+from dataset import column_kind
+from inference import InvalidRow, chunked
+from segments import ID_COL
+from streaming import StreamingStats
+
+# Listing ingestion: bulk upserts by id, applied to the live snapshot.
+#
+# Accepted rows are queued per market and a publisher thread folds everything
+# queued into a new snapshot every NESTMETRICS_INGEST_INTERVAL seconds: the
+# changed rows are written into a copy of the frame (new ids are appended),
+# the indexes are rebuilt for the new frame, and /api/stats comes from running
+# aggregates that only subtract the old rows and add the new ones. The
+# dataset version is chained from the previous one, so cached responses roll
+# over without rehashing the frame.
+#
+# Fields left out of an update (or sent as null) keep their current value.
+# Ingested rows live in memory only; a reload from disk replaces them.
+
+INGEST_INTERVAL = float(os.environ.get('NESTMETRICS_INGEST_INTERVAL', 1.0))
+INGEST_CHUNK_SIZE = int(os.environ.get('INGEST_CHUNK_SIZE', 10000))
+READ_BLOCK_SIZE = 1 << 20
+MAX_REPORTED_ERRORS = 20
+TRUE_VALUES = {'t', 'true', 'yes', '1'}
+FALSE_VALUES = {'f', 'false', 'no', '0'}
+
+
+def read_lines(stream, block_size=READ_BLOCK_SIZE):
+    # Body lines, read a block at a time; line-by-line reads of a request
+    # stream cost a call per line and dominate large uploads
+    tail = b''
+    for block in iter(lambda: stream.read(block_size), b''):
+        lines = (tail + block).split(b'\n')
+        tail = lines.pop()
+        for line in lines:
+            yield line.decode('utf-8', errors='replace')
+    if tail:
+        yield tail.decode('utf-8', errors='replace')
+
+
+def _parse_bool(value):
+    if isinstance(value, bool):
+        return value
+    text = str(value).strip().lower()
+    if text in TRUE_VALUES:
+        return True
+    if text in FALSE_VALUES:
+        return False
+    return np.nan
+
+
+def parse_rows(records, kinds):
+    # Returns (upserts, errors by position, ignored columns); kinds maps the
+    # live frame's columns to dataset.column_kind
+    errors = {}
+    positions = []
+    for position, record in enumerate(records):
+        if isinstance(record, dict):
+            positions.append(position)
+        elif isinstance(record, InvalidRow):
+            errors[position] = record.message
+        else:
+            errors[position] = 'Row must be a JSON object'
+
+    frame = pd.DataFrame.from_records([records[p] for p in positions])
+    frame.index = positions
+    ignored = [name for name in frame.columns if name not in kinds]
+    frame = frame.drop(columns=ignored)
+    if ID_COL not in frame.columns:
+        frame[ID_COL] = np.nan
+
+    invalid = pd.Series(False, index=frame.index)
+    for name in frame.columns:
+        raw = frame[name]
+        provided = raw.notna()
+        kind = kinds[name]
+        if kind == 'numeric':
+            values = pd.to_numeric(raw, errors='coerce')
+            bad = provided & ~np.isfinite(values.fillna(0))
+            bad |= provided & values.isna()
+            if name == ID_COL:
+                bad = values.isna() | (values != np.floor(values))
+        elif kind == 'bool':
+            values = raw.map(_parse_bool, na_action='ignore')
+            bad = provided & values.isna()
+        elif kind == 'datetime':
+            values = pd.to_datetime(raw, errors='coerce')
+            bad = provided & values.isna()
+        else:
+            values = raw.astype(str).where(provided, None)
+            bad = pd.Series(False, index=frame.index)
+        for position in frame.index[bad & ~invalid]:
+            errors[position] = f'Missing or invalid {name}' if name == ID_COL else f'Invalid {name}: {raw[position]!r}'
+        invalid |= bad
+        frame[name] = values
+
+    return frame[~invalid].reset_index(drop=True), errors, ignored
+
+
+def coalesce(batches):
+    # One row per id; for repeated ids the latest non-null value of each field wins
+    upserts = pd.concat(batches, ignore_index=True) if len(batches) > 1 else batches[0]
+    if upserts[ID_COL].duplicated().any():
+        upserts = upserts.groupby(ID_COL, sort=False).last().reset_index()
+    return upserts
+
+
+def _merged_column(series, rows, updates, inserts):
+    # series with updates written at rows (nulls keep the old value) and inserts appended
+    provided = updates.notna().to_numpy()
+    rows = rows[provided]
+    updates = updates[provided]
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        categories = series.cat.categories
+        incoming = pd.Index(pd.concat([updates, inserts]).dropna().unique())
+        categories = categories.append(incoming.difference(categories))
+        codes = np.concatenate([series.cat.codes.to_numpy(), categories.get_indexer(inserts)])
+        codes[rows] = categories.get_indexer(updates)
+        return pd.Categorical.from_codes(codes, categories)
+
+    base = series.to_numpy()
+    kind = column_kind(series)
+    if kind == 'numeric':
+        incoming = pd.concat([updates, inserts]).dropna().to_numpy(dtype=float)
+        dtype = base.dtype
+        if dtype.kind in 'iu':
+            # Integers stay integers unless new rows leave gaps or bring fractions
+            if inserts.isna().any() or (incoming != np.floor(incoming)).any():
+                dtype = np.dtype(float)
+            elif len(incoming):
+                limits = np.iinfo(dtype)
+                if incoming.min() < limits.min or incoming.max() > limits.max:
+                    dtype = np.dtype(np.int64)
+        values = np.concatenate([base.astype(dtype), inserts.to_numpy(dtype=float).astype(dtype)])
+        values[rows] = updates.to_numpy(dtype=float).astype(dtype)
+        return values
+    if kind == 'bool':
+        values = np.concatenate([base, inserts.fillna(False).to_numpy(dtype=bool)])
+        values[rows] = updates.to_numpy(dtype=bool)
+        return values
+    if kind == 'datetime':
+        values = np.concatenate([base, inserts.to_numpy(dtype=base.dtype)])
+        values[rows] = updates.to_numpy(dtype=base.dtype)
+        return values
+    values = np.concatenate([base.astype(object), inserts.to_numpy(dtype=object)])
+    values[rows] = updates.to_numpy(dtype=object)
+    return values
+
+
+def apply_upserts(df, rows, upserts):
+    # rows: the frame row of each upsert id, -1 for new listings
+    found = rows >= 0
+    updates, inserts = upserts[found], upserts[~found]
+    empty = pd.Series(np.nan, index=range(len(inserts)), dtype=object)
+    columns = {}
+    for name in df.columns:
+        if name in upserts.columns:
+            columns[name] = _merged_column(df[name], rows[found], updates[name], inserts[name].reset_index(drop=True))
+        else:
+            columns[name] = _merged_column(df[name], rows[found], pd.Series(np.nan, index=updates.index, dtype=object), empty)
+    return pd.DataFrame(columns, copy=False)
+
+
+def next_version(version, upserts):
+    digest = hashlib.sha1(version.encode())
+    digest.update(pd.util.hash_pandas_object(upserts.astype(str), index=False).values.tobytes())
+    return digest.hexdigest()[:16]
+
+
+class ListingIngestor:
+    def __init__(self, manager, interval=INGEST_INTERVAL):
+        self.manager = manager
+        self.interval = interval
+        self._pending = []
+        self._pending_rows = 0
+        # Tickets: batches are numbered as they are queued; waiters block until published
+        self._queued = 0
+        self._published = 0
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+        forksafe.register(self)
+        # Running aggregates of self._base, the snapshot this ingestor last built on
+        self._stats = None
+        self._base = None
+        self.status = {
+            'accepted_rows': 0,
+            'published_rows': 0,
+            'inserted': 0,
+            'updated': 0,
+            'publishes': 0,
+            'last_publish': None,
+            'duration_s': None,
+            'last_error': None
+        }
+
+    def _after_fork(self):
+        # The publisher thread isn't copied; a child that ingests starts its own
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+        self._wake = forksafe.fresh_event(self._wake)
+        self._stopped = forksafe.fresh_event(self._stopped)
+        self._thread = None
+
+    def kinds(self):
+        df = self.manager.current().df
+        return {name: column_kind(df[name]) for name in df.columns}
+
+    def ingest(self, records, chunk_size=INGEST_CHUNK_SIZE):
+        # Parses and queues records chunk by chunk; returns a summary and the ticket to wait on
+        kinds = self.kinds()
+        accepted, failed, ignored, errors = 0, 0, set(), []
+        offset = 0
+        batches = []
+        for chunk in chunked(records, chunk_size):
+            upserts, chunk_errors, chunk_ignored = parse_rows(chunk, kinds)
+            if len(upserts):
+                batches.append(upserts)
+            accepted += len(upserts)
+            failed += len(chunk_errors)
+            ignored.update(chunk_ignored)
+            for position, message in sorted(chunk_errors.items()):
+                if len(errors) < MAX_REPORTED_ERRORS:
+                    errors.append({'index': offset + position, 'error': message})
+            offset += len(chunk)
+        ticket = self.submit(batches) if batches else None
+        return {
+            'accepted': accepted,
+            'failed': failed,
+            'errors': errors,
+            'ignored_columns': sorted(ignored)
+        }, ticket
+
+    def submit(self, batches):
+        with self._lock:
+            self._pending.extend(batches)
+            self._pending_rows += sum(len(batch) for batch in batches)
+            self.status['accepted_rows'] += sum(len(batch) for batch in batches)
+            self._queued += 1
+            ticket = self._queued
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='ingest-publisher', daemon=True)
+                self._thread.start()
+        self._wake.set()
+        return ticket
+
+    def wait(self, ticket, timeout=None):
+        with self._changed:
+            return self._changed.wait_for(lambda: self._published >= ticket, timeout)
+
+    def stop(self):
+        self._stopped.set()
+        self._wake.set()
+
+    def _run(self):
+        last = 0.0
+        while not self._stopped.is_set():
+            self._wake.wait()
+            self._wake.clear()
+            # Let more rows queue up so back-to-back requests share one rebuild
+            delay = last + self.interval - time.perf_counter()
+            if delay > 0 and self._stopped.wait(delay):
+                return
+            self.publish()
+            last = time.perf_counter()
+
+    def publish(self):
+        with self._lock:
+            batches, ticket = self._pending, self._queued
+            self._pending, self._pending_rows = [], 0
+        if not batches:
+            return
+        started = time.perf_counter()
+        base = self.manager.current()
+        try:
+            snapshot, stats, inserted, updated = self._build(base, coalesce(batches))
+            installed = self.manager.replace(base, snapshot)
+        except Exception as e:
+            print(f"❌ Ingest publish failed: {e}")
+            with self._changed:
+                self.status['last_error'] = str(e)
+                self._published = ticket
+                self._changed.notify_all()
+            return
+        if not installed:
+            # A reload swapped the snapshot underneath; apply the rows on top of it next tick
+            with self._lock:
+                self._pending[:0] = batches
+                self._pending_rows += sum(len(batch) for batch in batches)
+            self._wake.set()
+            return
+
+        self._base, self._stats = snapshot, stats
+        rows = inserted + updated
+        duration = round(time.perf_counter() - started, 3)
+        with self._changed:
+            self.status['published_rows'] += rows
+            self.status['inserted'] += inserted
+            self.status['updated'] += updated
+            self.status['publishes'] += 1
+            self.status.update(last_publish=datetime.now().isoformat(timespec='seconds'), duration_s=duration, last_error=None)
+            self._published = ticket
+            self._changed.notify_all()
+        print(f"📥 Ingested {rows} rows ({inserted} new, {updated} updated) as snapshot {snapshot.generation} in {duration:.2f}s")
+
+    def _build(self, base, upserts):
+        from snapshot import DataSnapshot
+
+        if self._base is not base:
+            self._stats = StreamingStats(base.df)
+        # Compared as int64: new ids may not fit the frame's (downcast) id dtype
+        rows = base.segments.rows_for_ids(upserts[ID_COL].to_numpy(dtype=float).astype(np.int64))
+        found = rows >= 0
+        df = apply_upserts(base.df, rows, upserts)
+
+        # Running aggregates: take the old rows out, put the new versions in
+        stats = copy.deepcopy(self._stats)
+        stats.remove(base.df.iloc[rows[found]])
+        stats.add(df.iloc[np.concatenate([rows[found], np.arange(len(base.df), len(df))])])
+        try:
+            stats_payload = stats.stats()
+        except ValueError:
+            stats_payload = None
+
+        snapshot = DataSnapshot(df, base.model, base.generation + 1, base.market, base.schema,
+                                version=next_version(base.version, upserts), stats=stats_payload, verbose=False)
+        return snapshot, stats, int((~found).sum()), int(found.sum())
+
+    def describe(self):
+        with self._lock:
+            return {**self.status, 'pending_rows': self._pending_rows, 'interval_s': self.interval,
+                    'generation': self.manager.current().generation}
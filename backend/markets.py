@@ -0,0 +1,176 @@
+import os
+import re
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+
+import forksafe
+from startup import lazy_import
+
+# Market registry: one SnapshotManager per city, loaded the first time a
+# request names the market and kept in an LRU bounded by the snapshots'
+# estimated memory. Markets that stop getting traffic are evicted once the
+# budget is exceeded; requests already running keep their snapshot alive
+# until they finish. The default market is loaded at startup and never
+# evicted, so single-city deployments behave exactly as before.
+#
+# snapshot (pandas, the indexes) is imported lazily: app.py imports this
+# module before the server binds, and the data layer loads in the background.
+
+snapshot = lazy_import('snapshot')
+
+DEFAULT_MARKET = os.environ.get('NESTMETRICS_DEFAULT_MARKET', 'nyc')
+MARKETS_DIR = os.environ.get('NESTMETRICS_MARKETS_DIR', 'models/markets')
+MEMORY_BUDGET = int(float(os.environ.get('NESTMETRICS_MARKET_MEMORY_MB', 4096)) * 1024 * 1024)
+MARKET_NAME = re.compile(r'^[a-z0-9][a-z0-9_-]*$')
+
+
+def watch_files_enabled():
+    return os.environ.get('NESTMETRICS_WATCH_FILES', '').lower() in ('1', 'true', 'yes')
+
+
+class UnknownMarket(LookupError):
+    def __init__(self, market):
+        super().__init__(f'Unknown market: {market}')
+        self.market = market
+
+
+class MarketUnavailable(RuntimeError):
+    def __init__(self, market, error):
+        super().__init__(f'Market {market} failed to load: {error}')
+        self.market = market
+
+
+def market_paths(market):
+    if market == DEFAULT_MARKET:
+        return snapshot.DEFAULT_PATHS
+    if not MARKET_NAME.match(market):
+        raise UnknownMarket(market)
+    paths = snapshot.MarketPaths(os.path.join(MARKETS_DIR, market))
+    if not paths.exists():
+        raise UnknownMarket(market)
+    return paths
+
+
+def available_markets():
+    markets = [DEFAULT_MARKET]
+    if os.path.isdir(MARKETS_DIR):
+        for name in sorted(os.listdir(MARKETS_DIR)):
+            if name != DEFAULT_MARKET and MARKET_NAME.match(name) and snapshot.MarketPaths(os.path.join(MARKETS_DIR, name)).exists():
+                markets.append(name)
+    return markets
+
+
+class MarketRegistry:
+    def __init__(self, memory_budget=MEMORY_BUDGET):
+        self.memory_budget = memory_budget
+        self._managers = OrderedDict()
+        self._loading = {}
+        self._lock = threading.Lock()
+        self._watching = False
+        self.loads = 0
+        self.evictions = 0
+        forksafe.register(self)
+
+    def _after_fork(self):
+        # Loads that were running in the parent never finish in a forked child
+        self._lock = threading.Lock()
+        self._loading = {}
+
+    def __len__(self):
+        return len(self._managers)
+
+    def __contains__(self, market):
+        return (market or DEFAULT_MARKET).strip().lower() in self._managers
+
+    def state(self):
+        # Changes whenever a market is loaded, evicted or reloaded
+        return tuple((name, manager.current().generation) for name, manager in list(self._managers.items()))
+
+    def get(self, market=None):
+        market = (market or DEFAULT_MARKET).strip().lower()
+        with self._lock:
+            manager = self._managers.get(market)
+            if manager is not None:
+                self._managers.move_to_end(market)
+                return manager
+            # Requests racing on a cold market wait for a single load
+            pending = self._loading.get(market)
+            leader = pending is None
+            if leader:
+                pending = self._loading[market] = Future()
+        if not leader:
+            return pending.result()
+
+        try:
+            paths = market_paths(market)
+            # The default market keeps its fallback data on load errors; others must load cleanly
+            strict = market != DEFAULT_MARKET
+            try:
+                manager = snapshot.SnapshotManager(snapshot.load_snapshot(paths=paths, market=market, strict=strict), paths)
+            except Exception as e:
+                raise MarketUnavailable(market, e) from e
+        except BaseException as e:
+            with self._lock:
+                del self._loading[market]
+            pending.set_exception(e)
+            raise
+
+        with self._lock:
+            del self._loading[market]
+            self._managers[market] = manager
+            self.loads += 1
+            evicted = self._evict(keep=market)
+        if self._watching:
+            manager.watch()
+        for name, old in evicted:
+            old.stop()
+            print(f"♻️ Evicted market {name} (memory budget {self.memory_budget / 1e6:.0f} MB)")
+        print(f"✅ Market {market} ready ({manager.current().memory_bytes / 1e6:.1f} MB)")
+        pending.set_result(manager)
+        return manager
+
+    def memory_bytes(self):
+        return sum(manager.current().memory_bytes for manager in list(self._managers.values()))
+
+    def _evict(self, keep):
+        evicted = []
+        total = sum(manager.current().memory_bytes for manager in self._managers.values())
+        for name in list(self._managers):
+            if total <= self.memory_budget:
+                break
+            if name in (keep, DEFAULT_MARKET):
+                continue
+            manager = self._managers.pop(name)
+            total -= manager.current().memory_bytes
+            evicted.append((name, manager))
+            self.evictions += 1
+        return evicted
+
+    def loaded(self):
+        return list(self._managers.items())
+
+    def watch(self):
+        self._watching = True
+        for manager in list(self._managers.values()):
+            manager.watch()
+
+    def describe(self):
+        loaded = dict(self.loaded())
+        markets = []
+        for name in available_markets():
+            manager = loaded.get(name)
+            entry = {'market': name, 'loaded': manager is not None}
+            if manager is not None:
+                snap = manager.current()
+                entry.update(rows=len(snap.df), version=snap.version, memory_bytes=snap.memory_bytes)
+            markets.append(entry)
+        return {
+            'default': DEFAULT_MARKET,
+            'markets': markets,
+            'loaded': len(loaded),
+            'memory_bytes': self.memory_bytes(),
+            'memory_budget_bytes': self.memory_budget,
+            'loads': self.loads,
+            'evictions': self.evictions
+        }
@@ -0,0 +1,361 @@
+import os
+import sys
+import threading
+import time
+from collections import Counter as TallyCounter
+from contextlib import contextmanager
+from datetime import datetime
+
+import forksafe
+
+# In-process instrumentation. Every request is timed by the middleware in
+# install(), expensive sections are wrapped in stage() timers, and /metrics
+# renders the lot in Prometheus text format. Metrics are per process: under
+# gunicorn each worker reports its own series, so scrape workers individually
+# or aggregate with sum() on the Prometheus side.
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+PROMETHEUS_MIMETYPE = 'text/plain; version=0.0.4; charset=utf-8'
+PROFILE_SLOW_MS = float(os.environ.get('NESTMETRICS_PROFILE_SLOW_MS', 0))
+PROFILE_INTERVAL_MS = float(os.environ.get('NESTMETRICS_PROFILE_INTERVAL_MS', 5))
+PROFILE_DIR = os.environ.get('NESTMETRICS_PROFILE_DIR', 'profiles')
+# WSGI environ flag for requests the async server hands on to a worker process; it records them itself
+DEFERRED_ENVIRON = 'nestmetrics.deferred'
+
+_context = threading.local()
+
+
+def _label_text(names, values):
+    if not names:
+        return ''
+    pairs = []
+    for name, value in zip(names, values):
+        escaped = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        pairs.append(f'{name}="{escaped}"')
+    return '{' + ','.join(pairs) + '}'
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    kind = 'counter'
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(name, '') for name in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(tuple(labels.get(name, '') for name in self.labels), 0)
+
+    def samples(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            yield self.name, _label_text(self.labels, key), value
+
+
+class Gauge(Counter):
+    kind = 'gauge'
+
+    def set(self, value, **labels):
+        key = tuple(labels.get(name, '') for name in self.labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class CallbackGauge:
+    kind = 'gauge'
+
+    def __init__(self, name, help_text, callback):
+        self.name = name
+        self.help = help_text
+        self.callback = callback
+
+    def samples(self):
+        try:
+            value = self.callback()
+        except Exception:
+            return
+        if value is not None:
+            yield self.name, '', value
+
+
+class Histogram:
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(name, '') for name in self.labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+                    break
+            series[1] += value
+            series[2] += 1
+
+    def samples(self):
+        with self._lock:
+            items = sorted((key, (list(counts), total, count)) for key, (counts, total, count) in self._series.items())
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket in zip(self.buckets, counts):
+                cumulative += bucket
+                yield f'{self.name}_bucket', _label_text(self.labels + ('le',), key + (_number(bound),)), cumulative
+            yield f'{self.name}_bucket', _label_text(self.labels + ('le',), key + ('+Inf',)), count
+            yield f'{self.name}_sum', _label_text(self.labels, key), total
+            yield f'{self.name}_count', _label_text(self.labels, key), count
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+        forksafe.register(self)
+
+    def _after_fork(self):
+        self._lock = threading.Lock()
+        for metric in self._metrics.values():
+            if hasattr(metric, '_lock'):
+                metric._lock = threading.Lock()
+
+    def _register(self, metric):
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name, help_text, labels=()):
+        return self._register(Counter(name, help_text, labels))
+
+    def gauge(self, name, help_text, labels=()):
+        return self._register(Gauge(name, help_text, labels))
+
+    def callback_gauge(self, name, help_text, callback):
+        with self._lock:
+            self._metrics[name] = CallbackGauge(name, help_text, callback)
+            return self._metrics[name]
+
+    def histogram(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        return self._register(Histogram(name, help_text, labels, buckets))
+
+    def render(self):
+        lines = []
+        for metric in list(self._metrics.values()):
+            lines.append(f'# HELP {metric.name} {metric.help}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            for name, labels, value in metric.samples():
+                lines.append(f'{name}{labels} {_number(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+REQUESTS = registry.counter('nestmetrics_http_requests_total', 'HTTP requests handled.', ('route', 'method', 'status'))
+REQUEST_DURATION = registry.histogram(
+    'nestmetrics_http_request_duration_seconds',
+    'Wall time from request start until the response body is fully sent.',
+    ('route', 'method')
+)
+IN_FLIGHT = registry.gauge('nestmetrics_http_requests_in_flight', 'Requests currently being handled.')
+STAGE_DURATION = registry.histogram(
+    'nestmetrics_stage_duration_seconds',
+    'Time spent in instrumented stages (filter, model_predict, json_encode, ...).',
+    ('route', 'stage')
+)
+ML_PREDICT_FALLBACKS = registry.counter(
+    'nestmetrics_ml_predict_fallback_total',
+    'ml-predict requests answered by the statistical fallback instead of the model.',
+    ('reason',)
+)
+SLOW_PROFILES = registry.counter(
+    'nestmetrics_slow_request_profiles_total',
+    'Slow requests whose sampled stacks were written to the profile directory.',
+    ('route',)
+)
+
+
+def current_route():
+    return getattr(_context, 'route', None) or 'background'
+
+
+@contextmanager
+def stage(name, timings=None):
+    # timings, when given, also collects the seconds per stage name
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - started
+        STAGE_DURATION.observe(seconds, route=current_route(), stage=name)
+        if timings is not None:
+            timings[name] = seconds
+
+
+def count_fallback(reason):
+    ML_PREDICT_FALLBACKS.inc(reason=reason)
+
+
+def process_memory():
+    # Resident and peak resident bytes of this process (Linux; None elsewhere)
+    memory = {'rss_bytes': None, 'peak_rss_bytes': None}
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    memory['rss_bytes'] = int(line.split()[1]) * 1024
+                elif line.startswith('VmHWM:'):
+                    memory['peak_rss_bytes'] = int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return memory
+
+
+class SlowRequestProfiler:
+    # Samples the stacks of threads with a request in flight and, for
+    # requests slower than the threshold, appends them in collapsed-stack
+    # format (one "frame;frame;frame count" line per stack) so the files feed
+    # straight into flamegraph.pl or speedscope.
+
+    def __init__(self, threshold_ms, interval_ms=PROFILE_INTERVAL_MS, out_dir=PROFILE_DIR):
+        self.threshold = threshold_ms / 1000
+        self.interval = interval_ms / 1000
+        self.out_dir = out_dir
+        self._active = {}
+        self._lock = threading.Lock()
+        self._thread = None
+        forksafe.register(self)
+
+    def _after_fork(self):
+        # The sampler thread isn't copied; the child starts its own when needed
+        self._lock = threading.Lock()
+        self._active = {}
+        self._thread = None
+
+    def _ensure_sampler(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._thread = threading.Thread(target=self._sample_forever, name='slow-request-profiler', daemon=True)
+        self._thread.start()
+
+    def _sample_forever(self):
+        while True:
+            time.sleep(self.interval)
+            with self._lock:
+                active = list(self._active.values())
+            if not active:
+                continue
+            frames = sys._current_frames()
+            for thread_id, tally in active:
+                frame = frames.get(thread_id)
+                if frame is None:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})')
+                    frame = frame.f_back
+                tally[';'.join(reversed(stack))] += 1
+
+    def start(self):
+        self._ensure_sampler()
+        token = object()
+        with self._lock:
+            self._active[token] = (threading.get_ident(), TallyCounter())
+        return token
+
+    def stop(self, token, route, seconds):
+        with self._lock:
+            _, tally = self._active.pop(token, (None, None))
+        if not tally or seconds < self.threshold:
+            return None
+        os.makedirs(self.out_dir, exist_ok=True)
+        safe_route = route.strip('/').replace('/', '_').replace('<', '').replace('>', '') or 'root'
+        path = os.path.join(self.out_dir, f'{safe_route}.folded')
+        with open(path, 'a') as f:
+            f.write(f"# {datetime.now().isoformat(timespec='seconds')} {route} {seconds * 1000:.1f}ms\n")
+            for stack, samples in tally.most_common():
+                f.write(f'{stack} {samples}\n')
+        SLOW_PROFILES.inc(route=route)
+        return path
+
+
+profiler = SlowRequestProfiler(PROFILE_SLOW_MS) if PROFILE_SLOW_MS > 0 else None
+
+
+def install(app):
+    from flask import g, request
+    from flask.json.provider import DefaultJSONProvider
+
+    import serialize
+
+    class TimedJSONProvider(DefaultJSONProvider):
+        # jsonify with NaN sent as null and numpy values converted (serialize.dumps)
+        def dumps(self, obj, **kwargs):
+            kwargs.setdefault('ensure_ascii', self.ensure_ascii)
+            kwargs.setdefault('sort_keys', self.sort_keys)
+            return serialize.dumps(obj, self.default, **kwargs)
+
+        def response(self, *args, **kwargs):
+            with stage('json_encode'):
+                return super().response(*args, **kwargs)
+
+    app.json = TimedJSONProvider(app)
+
+    @app.before_request
+    def start_timer():
+        _context.route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        g.metrics_started = time.perf_counter()
+        IN_FLIGHT.inc()
+        if profiler is not None:
+            g.profile_token = profiler.start()
+
+    @app.after_request
+    def record_request(response):
+        started = g.pop('metrics_started', None)
+        if started is None:
+            return response
+        route = _context.route
+        method = request.method
+        profile_token = g.pop('profile_token', None)
+        if request.environ.get(DEFERRED_ENVIRON):
+            IN_FLIGHT.inc(-1)
+            if profile_token is not None:
+                profiler.stop(profile_token, route, 0)
+            return response
+
+        def finish():
+            # Runs once the body has been sent, so streamed exports count in full
+            seconds = time.perf_counter() - started
+            REQUEST_DURATION.observe(seconds, route=route, method=method)
+            REQUESTS.inc(route=route, method=method, status=str(response.status_code))
+            IN_FLIGHT.inc(-1)
+            if profile_token is not None:
+                profiler.stop(profile_token, route, seconds)
+
+        response.call_on_close(finish)
+        return response
+
+    @app.teardown_request
+    def clear_route(exc):
+        _context.route = None
@@ -0,0 +1,181 @@
+import os
+
+import numpy as np
+
+# Booking scores for one price or a whole portfolio / price sweep at once.
+#
+#   price_ratio   = price / neighbourhood average price
+#   booking_score = price_score(price_ratio) * 0.7 + availability * 0.3
+#
+# The neighbourhood averages (price, reviews per month) are computed once per
+# snapshot, so scoring is a table lookup followed by the piecewise curves
+# evaluated over whole arrays with np.select.
+
+MAX_BULK_SCORES = int(os.environ.get('MAX_BULK_SCORES', 200000))
+
+
+def price_ratios(prices, avg_prices):
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(avg_prices > 0, prices / avg_prices, 1.0)
+
+
+def price_scores(ratio):
+    # Lower price relative to the neighbourhood = higher score
+    conditions = [ratio <= 0.5, ratio <= 0.8, ratio <= 1.0, ratio <= 1.2, ratio <= 1.5]
+    curves = [
+        np.full_like(ratio, 98.0),          # Super cheap
+        85 + (0.8 - ratio) * 43,            # Very good deal
+        70 + (1.0 - ratio) * 75,            # Fair price
+        50 - (ratio - 1.0) * 100,           # Slightly expensive
+        30 - (ratio - 1.2) * 67             # Expensive
+    ]
+    very_expensive = np.maximum(5, 10 - (ratio - 1.5) * 10)
+    return np.clip(np.select(conditions, curves, default=very_expensive), 5, 100)
+
+
+def availability_scores(ratio, avg_reviews):
+    # Neighbourhood demand, raised for cheap listings and cut for expensive ones
+    base = np.minimum(avg_reviews * 15, 90)
+    return np.select([ratio < 0.8, ratio > 1.2], [np.minimum(base * 1.2, 95), base * 0.7], default=base)
+
+
+def booking_scores(prices, avg_prices, avg_reviews):
+    ratio = price_ratios(prices, avg_prices)
+    price_score = price_scores(ratio)
+    availability = availability_scores(ratio, avg_reviews)
+    return price_score * 0.7 + availability * 0.3, price_score, availability
+
+
+class BookingScorer:
+    def __init__(self, segments, reviews):
+        # Per-neighbourhood baselines, indexed by position in self.neighborhoods.
+        # A trailing NaN slot is what code -1 (unknown neighbourhood) reads.
+        self.segments = segments
+        self.neighborhoods = segments.neighborhoods()
+        self._codes = {neighborhood: code for code, neighborhood in enumerate(self.neighborhoods)}
+        self.avg_prices = np.array([segments.price_mean(neighborhood=n) for n in self.neighborhoods] + [np.nan])
+        self.avg_reviews = np.array([reviews[segments.rows(neighborhood=n)].mean() for n in self.neighborhoods] + [np.nan])
+
+        # Neighbourhood code of every row, -1 where it has none
+        self.row_codes = np.full(segments.size, -1, dtype=np.int16 if len(self.neighborhoods) < 2 ** 15 else np.intp)
+        for code, neighborhood in enumerate(self.neighborhoods):
+            self.row_codes[segments.rows(neighborhood=neighborhood)] = code
+
+    def baseline(self, neighborhood):
+        code = self._codes.get(neighborhood)
+        if code is None:
+            return None
+        return float(self.avg_prices[code]), float(self.avg_reviews[code])
+
+    def score(self, price, neighborhood):
+        booking, price_score, availability, _ = self.score_prices([price], neighborhood)
+        return float(booking[0]), float(price_score[0]), float(availability[0])
+
+    def score_prices(self, prices, neighborhoods):
+        prices = np.asarray(prices, dtype=float)
+        if isinstance(neighborhoods, str):
+            code = self._codes.get(neighborhoods, -1)
+            codes = np.full(len(prices), code, dtype=np.intp)
+        else:
+            codes = np.fromiter((self._codes.get(n, -1) for n in neighborhoods), dtype=np.intp, count=len(neighborhoods))
+        return self._score(prices, codes)
+
+    def score_listings(self, ids, prices=None):
+        # Each listing's own price and neighbourhood unless prices are given
+        rows = self.segments.rows_for_ids(ids)
+        if prices is None:
+            prices = self.listing_prices(rows)
+        return self._score(np.asarray(prices, dtype=float), self.listing_codes(rows))
+
+    def listing_prices(self, rows):
+        return np.where(rows >= 0, self.segments.prices[rows], np.nan)
+
+    def listing_codes(self, rows):
+        return np.where(rows >= 0, self.row_codes[rows], -1)
+
+    def _score(self, prices, codes):
+        # Unknown neighbourhoods and missing prices score NaN
+        known = (codes >= 0) & np.isfinite(prices)
+        scores = booking_scores(prices, self.avg_prices[codes], self.avg_reviews[codes])
+        return tuple(np.where(known, values, np.nan) for values in scores) + (known,)
+
+    def score_request(self, data):
+        # {"listing_ids": [...], "prices"?: [...]} scores a portfolio (optionally
+        # at new prices); {"prices": [...], "neighborhoods": [...] or
+        # "neighborhood": "..."} scores price points
+        ids = data.get('listing_ids')
+        prices = data.get('prices')
+        if ids is None and prices is None:
+            raise ValueError('Expected listing_ids or prices')
+        for name, values in (('listing_ids', ids), ('prices', prices)):
+            if values is not None and not isinstance(values, list):
+                raise ValueError(f'{name} must be an array')
+        count = len(ids) if ids is not None else len(prices)
+        if count > MAX_BULK_SCORES:
+            raise ValueError(f'At most {MAX_BULK_SCORES} scores per request')
+        if ids is not None and prices is not None and len(prices) != count:
+            raise ValueError('listing_ids and prices must have the same length')
+        if prices is not None:
+            prices = parse_prices(prices)
+
+        if ids is not None:
+            ids, fits = parse_ids(ids)
+            rows = np.where(fits, self.segments.rows_for_ids(ids), -1)
+            if prices is None:
+                prices = self.listing_prices(rows)
+            booking, price_score, availability, known = self._score(prices, self.listing_codes(rows))
+        else:
+            neighborhoods = data.get('neighborhoods', data.get('neighborhood', 'Manhattan'))
+            if not isinstance(neighborhoods, (str, list)):
+                raise ValueError('neighborhoods must be an array or a single name')
+            if isinstance(neighborhoods, list) and len(neighborhoods) != count:
+                raise ValueError('prices and neighborhoods must have the same length')
+            booking, price_score, availability, known = self.score_prices(prices, neighborhoods)
+
+        scored = int(known.sum())
+        return {
+            'count': count,
+            'scored': scored,
+            'failed': count - scored,
+            'scores': {
+                'price': nullable(prices, 2),
+                'booking_score': nullable(booking, 1),
+                'price_competitiveness': nullable(price_score, 1),
+                'availability_likelihood': nullable(availability, 1)
+            }
+        }
+
+
+def parse_ids(values):
+    # Compared as int64, not the frame's (downcast) id dtype; ids beyond int64
+    # can't be in the dataset and come back unknown (fits False) instead
+    try:
+        ids = np.asarray(values, dtype=np.int64)
+        return ids, np.ones(len(ids), dtype=bool)
+    except OverflowError:
+        pass
+    except (TypeError, ValueError):
+        raise ValueError('listing_ids must be integers')
+    ids = np.zeros(len(values), dtype=np.int64)
+    fits = np.ones(len(values), dtype=bool)
+    for i, value in enumerate(values):
+        try:
+            ids[i] = np.int64(value)
+        except OverflowError:
+            fits[i] = False
+        except (TypeError, ValueError):
+            raise ValueError('listing_ids must be integers')
+    return ids, fits
+
+
+def parse_prices(values):
+    try:
+        return np.array([np.nan if value is None else value for value in values], dtype=float)
+    except (TypeError, ValueError):
+        raise ValueError('prices must be numbers')
+
+
+def nullable(values, decimals):
+    # NaN isn't valid JSON; unscored entries become null
+    values = np.round(np.asarray(values, dtype=float), decimals)
+    return np.where(np.isfinite(values), values, None).tolist()
@@ -0,0 +1,183 @@
+import numpy as np
+import pandas as pd
+
+# Row-position index over the (room type, neighbourhood group) segments.
+# Handlers slice the frame with these positions instead of building a boolean
+# mask over every row, so a lookup costs O(segment size), not O(dataset size).
+
+ROOM_TYPE_COL = 'room type'
+NEIGHBORHOOD_COL = 'neighbourhood group'
+PRICE_COL = 'price_$'
+ID_COL = 'id'
+
+EMPTY_ROWS = np.empty(0, dtype=np.intp)
+# Indexes store row positions as int32 (half of intp) unless the frame is too long
+MAX_INT32_ROWS = 2 ** 31 - 1
+MARKET_PERCENTILES = [0.1, 0.25, 0.5, 0.75, 0.9]
+
+
+def sorted_quantile(values, q):
+    # Linear interpolation between order statistics of ascending values, matching Series.quantile
+    n = len(values)
+    if n == 0:
+        return np.full(np.shape(q), np.nan) if np.ndim(q) else np.nan
+    position = np.asarray(q, dtype=float) * (n - 1)
+    below = np.floor(position).astype(np.intp)
+    above = np.minimum(below + 1, n - 1)
+    t = position - below
+    a, b = values[below], values[above]
+    diff = b - a
+    result = np.where(t >= 0.5, b - diff * (1 - t), a + diff * t)
+    return result if np.ndim(q) else float(result)
+
+
+def percentile_labels(percentiles, values):
+    return {f'p{round(q * 100):g}': round(float(v), 2) for q, v in zip(percentiles, values) if not np.isnan(v)}
+
+
+class PriceSample:
+    # Ascending prices of some set of listings, with the segment quantile helpers
+    def __init__(self, sorted_prices):
+        self.sorted_prices = sorted_prices
+
+    @property
+    def count(self):
+        return len(self.sorted_prices)
+
+    def quantile(self, q):
+        return sorted_quantile(self.sorted_prices, q)
+
+    def median(self):
+        return self.quantile(0.5)
+
+    def percentiles(self, percentiles):
+        return percentile_labels(percentiles, self.quantile(percentiles))
+
+
+def row_dtype(size):
+    return np.int32 if size <= MAX_INT32_ROWS else np.intp
+
+
+def categorize(df, columns=(ROOM_TYPE_COL, NEIGHBORHOOD_COL)):
+    for col in columns:
+        if col in df.columns and not isinstance(df[col].dtype, pd.CategoricalDtype):
+            df[col] = df[col].astype('category')
+    return df
+
+
+class SegmentIndex:
+    def __init__(self, df, room_type_col=ROOM_TYPE_COL, neighborhood_col=NEIGHBORHOOD_COL, price_col=PRICE_COL, id_col=ID_COL):
+        self.size = len(df)
+        if price_col in df.columns:
+            self.prices = df[price_col].to_numpy(dtype=float, na_value=np.nan)
+        else:
+            self.prices = np.full(self.size, np.nan)
+        self.ids = df[id_col].to_numpy() if id_col in df.columns else np.arange(self.size)
+
+        self._rows = {}
+        dtype = row_dtype(self.size)
+        if room_type_col in df.columns and neighborhood_col in df.columns:
+            pairs = df.groupby([room_type_col, neighborhood_col], observed=True, sort=False).indices
+            self._rows.update((key, rows.astype(dtype)) for key, rows in pairs.items())
+        if room_type_col in df.columns:
+            for room_type, rows in df.groupby(room_type_col, observed=True, sort=False).indices.items():
+                self._rows[(room_type, None)] = rows.astype(dtype)
+        if neighborhood_col in df.columns:
+            for neighborhood, rows in df.groupby(neighborhood_col, observed=True, sort=False).indices.items():
+                self._rows[(None, neighborhood)] = rows.astype(dtype)
+        self._rows[(None, None)] = np.arange(self.size, dtype=dtype)
+
+        # Price-sorted view of every segment; NaN prices sort to the end, so
+        # the first _price_counts[key] entries double as a quantile table
+        self._by_price = {}
+        self._sorted_prices = {}
+        self._price_counts = {}
+        self._price_means = {}
+        self._price_cumsums = {}
+        for key, rows in self._rows.items():
+            order = rows[np.argsort(self.prices[rows], kind='stable')]
+            sorted_prices = self.prices[order]
+            count = len(sorted_prices) - int(np.isnan(sorted_prices).sum())
+            self._by_price[key] = order
+            self._sorted_prices[key] = sorted_prices
+            self._price_counts[key] = count
+            self._price_means[key] = float(sorted_prices[:count].mean()) if count else np.nan
+            self._price_cumsums[key] = np.cumsum(sorted_prices[:count])
+
+        # id-sorted view of every segment for keyset pagination
+        self._by_id = {}
+        self._sorted_ids = {}
+        for key, rows in self._rows.items():
+            order = rows[np.argsort(self.ids[rows], kind='stable')]
+            self._by_id[key] = order
+            self._sorted_ids[key] = self.ids[order]
+
+    def keys(self):
+        return [key for key in self._rows if None not in key]
+
+    def neighborhoods(self):
+        return [neighborhood for room_type, neighborhood in self._rows if room_type is None and neighborhood is not None]
+
+    def rows(self, room_type=None, neighborhood=None):
+        return self._rows.get((room_type, neighborhood), EMPTY_ROWS)
+
+    def count(self, room_type=None, neighborhood=None):
+        return len(self.rows(room_type, neighborhood))
+
+    def rows_by_price(self, room_type=None, neighborhood=None):
+        return self._by_price.get((room_type, neighborhood), EMPTY_ROWS)
+
+    def sorted_prices(self, room_type=None, neighborhood=None):
+        return self._sorted_prices.get((room_type, neighborhood), np.empty(0))
+
+    def count_under_price(self, max_price, room_type=None, neighborhood=None):
+        return int(np.searchsorted(self.sorted_prices(room_type, neighborhood), max_price, side='right'))
+
+    def rows_under_price(self, max_price, room_type=None, neighborhood=None):
+        # Returned in dataset order so ties resolve exactly like a boolean mask
+        n = self.count_under_price(max_price, room_type, neighborhood)
+        return np.sort(self.rows_by_price(room_type, neighborhood)[:n])
+
+    def rows_by_id(self, room_type=None, neighborhood=None, after=None):
+        rows = self._by_id.get((room_type, neighborhood), EMPTY_ROWS)
+        if after is None or len(rows) == 0:
+            return rows
+        start = np.searchsorted(self._sorted_ids[(room_type, neighborhood)], after, side='right')
+        return rows[start:]
+
+    def rows_for_ids(self, ids):
+        # Row of each listing id, -1 where the id isn't in the dataset
+        order, sorted_ids = self._by_id[(None, None)], self._sorted_ids[(None, None)]
+        if not len(sorted_ids):
+            return np.full(len(ids), -1, dtype=np.intp)
+        positions = np.minimum(np.searchsorted(sorted_ids, ids), len(sorted_ids) - 1)
+        return np.where(sorted_ids[positions] == ids, order[positions], -1)
+
+    def price_count(self, room_type=None, neighborhood=None):
+        return self._price_counts.get((room_type, neighborhood), 0)
+
+    def price_mean(self, room_type=None, neighborhood=None):
+        return self._price_means.get((room_type, neighborhood), np.nan)
+
+    def price_prefix_mean(self, max_price, room_type=None, neighborhood=None):
+        # Mean price of the listings at or under max_price
+        n = min(self.count_under_price(max_price, room_type, neighborhood), self.price_count(room_type, neighborhood))
+        return float(self._price_cumsums[(room_type, neighborhood)][n - 1] / n) if n else np.nan
+
+    def price_quantile(self, q, room_type=None, neighborhood=None):
+        n = self.price_count(room_type, neighborhood)
+        return sorted_quantile(self.sorted_prices(room_type, neighborhood)[:n], q)
+
+    def price_sample(self, room_type=None, neighborhood=None):
+        n = self.price_count(room_type, neighborhood)
+        return PriceSample(self.sorted_prices(room_type, neighborhood)[:n])
+
+    def price_median(self, room_type=None, neighborhood=None):
+        return self.price_quantile(0.5, room_type, neighborhood)
+
+    def price_percentiles(self, percentiles, room_type=None, neighborhood=None):
+        return percentile_labels(percentiles, self.price_quantile(percentiles, room_type, neighborhood))
+
+    def room_type_counts(self, neighborhood):
+        return {room_type: len(rows) for (room_type, group), rows in self._rows.items()
+                if group == neighborhood and room_type is not None}
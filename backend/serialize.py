@@ -0,0 +1,275 @@
+import hashlib
+import json
+import math
+import os
+import threading
+import zlib
+from collections import OrderedDict
+
+import forksafe
+from startup import lazy_import
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# JSON encoding and response compression.
+#
+# Row data goes out through pandas' C encoder (DataFrame.to_json) a chunk at
+# a time instead of being turned into a dict per row and walked by the json
+# module: columns are encoded straight from their arrays, missing values
+# become null and numpy types need no conversion. Row sets can be sent as an
+# array of objects or, with ?shape=columns, as {"columns": [...], "data":
+# [[...], ...]}, which names each column once.
+#
+# Everything else goes through dumps(), which sends NaN / infinity as null
+# (plain json.dumps writes NaN, which isn't JSON) and converts numpy values.
+#
+# Responses are compressed with brotli (when installed) or gzip if the client
+# accepts it. Bodies of cached responses are compressed once, harder, and reused.
+#
+# app.py and metrics.py import this before the data layer is loaded, so
+# numpy and pandas are only imported when first used.
+
+np = lazy_import('numpy')
+pd = lazy_import('pandas')
+
+JSON_SHAPES = ('records', 'columns')
+# Digits kept for floats; pandas' default (10) would round coordinates and prices
+DOUBLE_PRECISION = 15
+# Below this many rows building a frame costs more than encoding dicts
+FRAME_ENCODE_MIN_ROWS = 200
+COMPRESS_MIN_BYTES = int(os.environ.get('NESTMETRICS_COMPRESS_MIN_BYTES', 1024))
+# Computed bodies are compressed per request, so cheaply; cached ones once, so harder
+GZIP_LEVEL = int(os.environ.get('NESTMETRICS_GZIP_LEVEL', 1))
+GZIP_CACHED_LEVEL = int(os.environ.get('NESTMETRICS_GZIP_CACHED_LEVEL', 6))
+BROTLI_QUALITY = int(os.environ.get('NESTMETRICS_BROTLI_QUALITY', 1))
+BROTLI_CACHED_QUALITY = int(os.environ.get('NESTMETRICS_BROTLI_CACHED_QUALITY', 6))
+COMPRESSED_CACHE_MAX_BYTES = int(float(os.environ.get('NESTMETRICS_COMPRESSED_CACHE_MB', 16)) * 1024 * 1024)
+COMPRESSIBLE_TYPES = {'application/json', 'application/x-ndjson', 'text/csv'}
+ENCODINGS = ('br', 'gzip') if brotli is not None else ('gzip',)
+
+
+class RawJSON(str):
+    # Already-encoded JSON; dumps() writes it as-is when it is a value of the top-level object
+    pass
+
+
+def _native(value, default=None):
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if default is not None:
+        return default(value)
+    raise TypeError(f'{type(value).__name__} is not JSON serializable')
+
+
+def _scrub(value):
+    if isinstance(value, float):
+        return value if math.isfinite(value) else None
+    if isinstance(value, dict):
+        return {key: _scrub(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_scrub(item) for item in value]
+    if isinstance(value, np.generic):
+        return _scrub(value.item())
+    if isinstance(value, np.ndarray):
+        return _scrub(value.tolist())
+    return value
+
+
+def dumps(payload, default=None, **kwargs):
+    # Sorted keys and compact separators unless told otherwise, like Flask's jsonify
+    kwargs.setdefault('sort_keys', True)
+    if 'indent' not in kwargs:
+        kwargs.setdefault('separators', (',', ':'))
+    if isinstance(payload, dict) and any(isinstance(value, RawJSON) for value in payload.values()):
+        items = sorted(payload.items()) if kwargs['sort_keys'] else payload.items()
+        kwargs.pop('indent', None)
+        return '{' + ','.join(
+            json.dumps(str(key)) + ':' + (value if isinstance(value, RawJSON) else dumps(value, default, **kwargs))
+            for key, value in items
+        ) + '}'
+    try:
+        return json.dumps(payload, allow_nan=False, default=lambda value: _native(value, default), **kwargs)
+    except ValueError:
+        # Only payloads holding NaN / infinity pay for the extra pass
+        return json.dumps(_scrub(payload), allow_nan=False, default=lambda value: _native(value, default), **kwargs)
+
+
+def encode_json(payload):
+    return dumps(payload).encode('utf-8')
+
+
+def frame_json(frame, orient, lines=False):
+    return frame.to_json(orient=orient, lines=lines, date_format='iso', double_precision=DOUBLE_PRECISION)
+
+
+def encode_rows(df, chunks, columns, shape='records'):
+    # One JSON document for all chunks: an array of row objects, or the columnar shape
+    positions = df.columns.get_indexer(columns)
+    if shape == 'columns':
+        yield '{"columns":' + dumps(list(columns)) + ',"data":['
+    else:
+        yield '['
+    orient = 'values' if shape == 'columns' else 'records'
+    first = True
+    for chunk in chunks:
+        body = frame_json(df.iloc[chunk, positions], orient)
+        if len(body) > 2:
+            yield body[1:-1] if first else ',' + body[1:-1]
+            first = False
+    yield ']}' if shape == 'columns' else ']'
+
+
+def encode_lines(df, chunks, columns):
+    # NDJSON: one object per line
+    positions = df.columns.get_indexer(columns)
+    for chunk in chunks:
+        body = frame_json(df.iloc[chunk, positions], 'records', lines=True)
+        yield body if body.endswith('\n') else body + '\n'
+
+
+def column_records(columns):
+    # Row objects from equal-length columns (arrays, pandas arrays or lists),
+    # with keys sorted like jsonify's; large sets are encoded by pandas in one pass
+    names = sorted(columns)
+    values = [columns[name] if isinstance(columns[name], list) else np.asarray(columns[name]) for name in names]
+    if values and len(values[0]) >= FRAME_ENCODE_MIN_ROWS:
+        return RawJSON(frame_json(pd.DataFrame(dict(zip(names, values)), copy=False), 'records'))
+    lists = [
+        [None if isinstance(value, float) and not math.isfinite(value) else value
+         for value in (column if isinstance(column, list) else column.tolist())]
+        for column in values
+    ]
+    return [dict(zip(names, row)) for row in zip(*lists)]
+
+
+def negotiate(accept_encoding):
+    # Preferred encoding the client accepts (q > 0), or None for identity
+    accepted = {}
+    for part in (accept_encoding or '').split(','):
+        name, _, params = part.partition(';')
+        quality = 1.0
+        for param in params.split(';'):
+            key, _, value = param.strip().partition('=')
+            if key == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if name.strip():
+            accepted[name.strip().lower()] = quality
+    for encoding in ENCODINGS:
+        if accepted.get(encoding, accepted.get('*', 0.0)) > 0:
+            return encoding
+    return None
+
+
+def _compressor(encoding, cached=False):
+    # (compress, flush, finish) for one body
+    if encoding == 'br':
+        compressor = brotli.Compressor(quality=BROTLI_CACHED_QUALITY if cached else BROTLI_QUALITY)
+        return compressor.process, compressor.flush, compressor.finish
+    compressor = zlib.compressobj(GZIP_CACHED_LEVEL if cached else GZIP_LEVEL, zlib.DEFLATED, 31)
+    return compressor.compress, lambda: compressor.flush(zlib.Z_SYNC_FLUSH), compressor.flush
+
+
+def compress(body, encoding, cached=False):
+    process, _, finish = _compressor(encoding, cached)
+    return process(body) + finish()
+
+
+def compress_stream(chunks, encoding):
+    # Each chunk is flushed as it is compressed, so streamed exports keep streaming
+    process, flush, finish = _compressor(encoding)
+    for chunk in chunks:
+        data = process(chunk.encode('utf-8') if isinstance(chunk, str) else chunk) + flush()
+        if data:
+            yield data
+    yield finish()
+
+
+class CompressedCache:
+    # Compressed bodies keyed by content hash; only responses that carry an
+    # ETag (cached and pre-encoded ones) are kept, as those get served again
+    def __init__(self, max_bytes=COMPRESSED_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        forksafe.register(self)
+
+    def _after_fork(self):
+        self._lock = threading.Lock()
+
+    def compress(self, body, encoding):
+        if self.max_bytes <= 0:
+            return compress(body, encoding)
+        key = (hashlib.sha1(body).digest(), encoding)
+        with self._lock:
+            data = self._entries.get(key)
+            if data is not None:
+                self._entries.move_to_end(key)
+                return data
+        data = compress(body, encoding, cached=True)
+        with self._lock:
+            if key not in self._entries and len(data) <= self.max_bytes:
+                self._entries[key] = data
+                self.bytes += len(data)
+                while self.bytes > self.max_bytes:
+                    self.bytes -= len(self._entries.popitem(last=False)[1])
+        return data
+
+
+compressed_cache = CompressedCache()
+
+
+def _compressible(status, mimetype, encoded):
+    return status == 200 and mimetype in COMPRESSIBLE_TYPES and not encoded
+
+
+def compress_response(response, accept_encoding):
+    # Flask after_request hook body
+    if not _compressible(response.status_code, response.mimetype, 'Content-Encoding' in response.headers):
+        return response
+    response.vary.add('Accept-Encoding')
+    encoding = negotiate(accept_encoding)
+    if encoding is None:
+        return response
+    etag, _ = response.get_etag()
+    if response.is_streamed:
+        response.response = compress_stream(response.response, encoding)
+        response.headers.pop('Content-Length', None)
+    else:
+        body = response.get_data()
+        if len(body) < COMPRESS_MIN_BYTES:
+            return response
+        response.set_data(compressed_cache.compress(body, encoding) if etag else compress(body, encoding))
+    response.headers['Content-Encoding'] = encoding
+    if etag:
+        # A different representation of the same resource; conditional requests still match it
+        response.set_etag(etag, weak=True)
+    return response
+
+
+def compress_reply(reply, accept_encoding):
+    # compress_response for a (status, headers, body) reply of the async server
+    status, headers, body = reply
+    fields = {name.lower(): value for name, value in headers}
+    if not _compressible(status, fields.get('content-type', '').split(';')[0], 'content-encoding' in fields):
+        return reply
+    vary = [field.strip() for field in fields.get('vary', '').split(',') if field.strip()]
+    vary = ', '.join(vary if 'accept-encoding' in map(str.lower, vary) else vary + ['Accept-Encoding'])
+    headers = [(name, value) for name, value in headers if name.lower() != 'vary'] + [('Vary', vary)]
+    encoding = negotiate(accept_encoding)
+    if encoding is None or len(body) < COMPRESS_MIN_BYTES:
+        return status, headers, body
+    etag = fields.get('etag')
+    body = compressed_cache.compress(body, encoding) if etag else compress(body, encoding)
+    headers = [(name, value) for name, value in headers if name.lower() not in ('content-length', 'etag')]
+    if etag:
+        headers.append(('ETag', etag if etag.startswith('W/') else 'W/' + etag))
+    return status, headers + [('Content-Encoding', encoding), ('Content-Length', str(len(body)))], body
@@ -0,0 +1,92 @@
+import glob
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+import pandas as pd
+
+from dataset import columnar_is_current, source_signature, write_columnar
+from forest import compiled_is_current, compile_model
+
+# Shared dataset for multi-worker serving. The first process to start
+# converts the CSV into the columnar layout under a tmpfs directory
+# (/dev/shm when available); every other worker attaches to the same files
+# read-only through mmap, so the column data lives in RAM exactly once. The
+# price model gets the same treatment as a compiled forest. Publishing a new
+# version of a file removes the previous ones.
+
+SHARED_ENV = 'NESTMETRICS_SHARED_DATASET'
+SHARED_ROOT = os.environ.get('NESTMETRICS_SHARED_DIR') or ('/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir())
+
+
+def shared_dataset_enabled():
+    return os.environ.get(SHARED_ENV, '').lower() in ('1', 'true', 'yes')
+
+
+def _version_dir(prefix, path):
+    # <prefix>-<source path key>-<source version key>: one directory per
+    # version, grouped by source so superseded versions can be found
+    signature = json.dumps(source_signature(path), sort_keys=True)
+    path_key = hashlib.sha1(os.path.abspath(path).encode()).hexdigest()[:12]
+    version_key = hashlib.sha1(signature.encode()).hexdigest()[:12]
+    return os.path.join(SHARED_ROOT, f'{prefix}-{path_key}-{version_key}')
+
+
+def _publish(target, is_current, build):
+    import fcntl
+    source_prefix = target.rsplit('-', 1)[0]
+    # One lock per source (not per version), so it never piles up and the
+    # cleanup below can't race another publisher of the same source
+    with open(source_prefix + '.lock', 'w') as lock:
+        # Workers racing on a cold start wait here; only one builds the files
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        if is_current():
+            return target
+        staging = tempfile.mkdtemp(prefix='nestmetrics-staging-', dir=SHARED_ROOT)
+        try:
+            build(staging)
+        except Exception:
+            shutil.rmtree(staging, ignore_errors=True)
+            raise
+        if os.path.exists(target):
+            shutil.rmtree(target)
+        os.rename(staging, target)
+        _remove_superseded(source_prefix, target)
+    return target
+
+
+def _remove_superseded(source_prefix, current):
+    # Earlier versions of the same source. Workers still serving one keep its
+    # pages mapped until they reload; tmpfs frees them after that
+    for path in glob.glob(glob.escape(source_prefix) + '-*'):
+        if path != current and os.path.isdir(path):
+            shutil.rmtree(path, ignore_errors=True)
+
+
+def shared_dataset_dir(source_csv):
+    return _version_dir('nestmetrics', source_csv)
+
+
+def publish_dataset(source_csv):
+    target = shared_dataset_dir(source_csv)
+    if columnar_is_current(target, source_csv):
+        return target
+
+    def build(staging):
+        df = pd.read_csv(source_csv, low_memory=False)
+        write_columnar(df, staging, source=source_signature(source_csv))
+
+    return _publish(target, lambda: columnar_is_current(target, source_csv), build)
+
+
+def shared_model_dir(model_path):
+    return _version_dir('nestmetrics-model', model_path)
+
+
+def publish_model(model_path):
+    target = shared_model_dir(model_path)
+    if compiled_is_current(target, model_path):
+        return target
+    return _publish(target, lambda: compiled_is_current(target, model_path), lambda staging: compile_model(model_path, staging))
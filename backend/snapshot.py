@@ -0,0 +1,399 @@
+import ctypes
+import json
+import os
+import threading
+import time
+from datetime import datetime
+
+import joblib
+import numpy as np
+import pandas as pd
+
+import forksafe
+from dataset import FALLBACK_CSVS, MANIFEST, load_dataset
+from aggregates import AggregateSnapshot
+from segments import SegmentIndex, categorize
+from deals import DealEngine
+from hosts import HostIndex
+from scoring import BookingScorer
+from spatial import SpatialIndex
+from trips import TripIndex
+from forest import COMPILED_DIR, MANIFEST as FOREST_MANIFEST, CompiledForest, compiled_is_current
+from inference import MODEL_FEATURES, MODEL_TARGET, model_schema
+from markets import DEFAULT_MARKET, watch_files_enabled
+from metrics import stage
+
+# Everything a request reads (frame, model, indexes, aggregates) lives on one
+# immutable DataSnapshot. Handlers grab SnapshotManager.current() once per
+# request; a reload builds the next snapshot off to the side and swaps the
+# reference, so in-flight requests finish on the snapshot they started with.
+
+class MarketPaths:
+    # Where one market's dataset and model live. The default market uses
+    # models/ itself; others get the same layout under models/markets/<name>/.
+    def __init__(self, root='models', fallbacks=()):
+        self.root = root
+        self.csv = os.path.join(root, 'Processed.csv')
+        self.columns = os.path.join(root, 'Processed.columns')
+        self.model = os.path.join(root, 'model.pkl')
+        self.compiled = os.path.join(root, 'model.compiled')
+        # Written by train.py next to the model: feature order and encodings it was fitted on
+        self.schema = os.path.join(root, 'model.json')
+        self.fallbacks = list(fallbacks)
+
+    @property
+    def watched(self):
+        return [self.csv, os.path.join(self.columns, MANIFEST), self.model, self.schema, os.path.join(self.compiled, FOREST_MANIFEST)]
+
+    def exists(self):
+        return os.path.exists(self.csv) or os.path.exists(os.path.join(self.columns, MANIFEST))
+
+
+DEFAULT_PATHS = MarketPaths('models', FALLBACK_CSVS)
+MODEL_PATH = DEFAULT_PATHS.model
+MODEL_SCHEMA = DEFAULT_PATHS.schema
+WATCHED_FILES = DEFAULT_PATHS.watched
+WATCH_INTERVAL = float(os.environ.get('NESTMETRICS_WATCH_INTERVAL', 5))
+
+
+def load_schema(path=MODEL_SCHEMA):
+    # Models from before train.py have no schema file and use the NYC codes
+    if not os.path.exists(path):
+        return model_schema()
+    with open(path) as f:
+        return {**model_schema(), **json.load(f)}
+
+
+def schema_mismatch(schema):
+    # Codes may differ per market; the feature layout may not
+    expected = {'features': MODEL_FEATURES, 'target': MODEL_TARGET}
+    return [key for key in expected if schema.get(key) != expected[key]] or None
+
+
+def load_model(path=MODEL_PATH, compiled_dir=COMPILED_DIR, schema=None):
+    mismatch = schema_mismatch(schema or model_schema())
+    if mismatch:
+        print(f"❌ ML model schema doesn't match the serving features ({', '.join(mismatch)}), using statistical methods")
+        return None
+    if compiled_is_current(compiled_dir, path):
+        model = CompiledForest.load(compiled_dir)
+        print(f"✅ Compiled ML model loaded ({model.n_estimators} trees, memory-mapped)")
+        return model
+    if os.path.exists(path):
+        from sharedmem import shared_dataset_enabled, publish_model
+        if shared_dataset_enabled():
+            try:
+                shared_dir = publish_model(path)
+                model = CompiledForest.load(shared_dir)
+                print(f"✅ Attached: compiled ML model from {shared_dir}")
+                return model
+            except ValueError as e:
+                print(f"⚠️ Model can't be compiled ({e}), loading the pickle")
+        if os.path.exists(os.path.join(compiled_dir, FOREST_MANIFEST)):
+            print(f"⚠️ {compiled_dir} is stale, run `python forest.py compile` to refresh it")
+        model = joblib.load(path)
+        print("✅ ML model loaded successfully")
+        return model
+    print("⚠️ ML model not found, using statistical methods")
+    return None
+
+
+def _footprint(value, seen):
+    # Approximate bytes held by index structures: numpy buffers, strings and
+    # the containers around them. pandas objects are views of the frame,
+    # which is counted on its own.
+    if id(value) in seen or value is None or isinstance(value, (pd.DataFrame, pd.Series, pd.Index)):
+        return 0
+    seen.add(id(value))
+    if isinstance(value, np.ndarray):
+        return value.nbytes if value.base is None or not isinstance(value.base, np.ndarray) else 0
+    if isinstance(value, (str, bytes)):
+        return len(value)
+    if isinstance(value, dict):
+        return sum(_footprint(k, seen) + _footprint(v, seen) for k, v in value.items())
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return sum(_footprint(item, seen) for item in value)
+    if hasattr(value, 'query') and hasattr(value, 'indices') and hasattr(value, 'data'):
+        # KD-tree: points, permutation and ~72-byte nodes
+        return value.data.nbytes + value.indices.nbytes + value.size * 72
+    estimators = getattr(value, 'estimators_', None)
+    if estimators is not None:
+        # sklearn tree nodes are 64-byte structs plus one value per node
+        return sum(e.tree_.node_count * (64 + 8 * e.tree_.value.shape[-1]) for e in estimators)
+    attrs = getattr(value, '__dict__', None)
+    if attrs is not None:
+        return _footprint(attrs, seen)
+    slots = getattr(type(value), '__slots__', ())
+    return sum(_footprint(getattr(value, name, None), seen) for name in slots)
+
+
+def _mapped(values):
+    # Views of a memory-mapped column file are paged in on use and shared between workers
+    while values is not None:
+        if isinstance(values, np.memmap):
+            return True
+        values = getattr(values, 'base', None)
+    return False
+
+
+class DataSnapshot:
+    def __init__(self, df, model, generation=0, market=DEFAULT_MARKET, schema=None, timings=None,
+                 version=None, stats=None, verbose=True, load_error=None):
+        self.generation = generation
+        self.market = market
+        self.schema = schema or model_schema()
+        self.loaded_at = datetime.now().isoformat(timespec='seconds')
+        # Seconds per load stage, for the startup breakdown
+        self.timings = dict(timings or {})
+        # Why the dataset or model couldn't be loaded, when this is the empty fallback
+        self.load_error = load_error
+
+        # Segment filters hit the categorical index instead of scanning the frame
+        with stage('categorize', self.timings):
+            self.df = categorize(df)
+        self.model = model
+        with stage('segment_index', self.timings):
+            self.segments = SegmentIndex(self.df)
+        with stage('deal_index', self.timings):
+            self.deals = DealEngine(self.df, self.segments)
+        with stage('score_index', self.timings):
+            self.scorer = BookingScorer(self.segments, self.deals.reviews)
+        # Ingest publishes a snapshot every few seconds; only full loads log each stage
+        log = print if verbose else lambda message: None
+        log(f"✅ Segment index built ({len(self.segments.keys())} room type × neighbourhood segments)")
+        with stage('spatial_index', self.timings):
+            self.spatial = SpatialIndex(self.df, self.segments)
+        log(f"✅ Spatial index built ({self.spatial.size} located listings)")
+
+        with stage('trip_index', self.timings):
+            self.trips = TripIndex(self.df, self.segments, self.deals)
+
+        with stage('host_index', self.timings):
+            self.hosts = HostIndex(self.df)
+        log(f"✅ Host index built ({len(self.hosts)} hosts)")
+
+        # Precompute dataset-wide aggregates once per dataset version; ingest
+        # passes in the chained version and its running stats
+        with stage('aggregates', self.timings):
+            self.aggregates = AggregateSnapshot(self.df, self.hosts, version, stats)
+        self.version = self.aggregates.version
+        log(f"✅ Aggregates cached (dataset version {self.version})")
+        self._memory = None
+        self._columns = None
+
+    def memory_breakdown(self):
+        # Computed once: the snapshot never changes after construction
+        if self._memory is None:
+            seen = set()
+            self._memory = {
+                'dataframe': int(self.df.memory_usage(deep=True).sum()) if len(self.df.columns) else 0,
+                'segments': _footprint(self.segments, seen),
+                'deals': _footprint(self.deals, seen),
+                'scorer': _footprint(self.scorer, seen),
+                'spatial': _footprint(self.spatial, seen),
+                'hosts': _footprint(self.hosts, seen),
+                'trips': _footprint(self.trips, seen),
+                'aggregates': _footprint(self.aggregates, seen),
+                'model': _footprint(self.model, seen)
+            }
+        return self._memory
+
+    def memory_columns(self):
+        if self._columns is None:
+            usage = self.df.memory_usage(deep=True, index=False)
+            self._columns = {}
+            for name in self.df.columns:
+                series = self.df[name]
+                categorical = isinstance(series.dtype, pd.CategoricalDtype)
+                values = series.cat.codes.to_numpy() if categorical else series.to_numpy()
+                self._columns[str(name)] = {
+                    'dtype': str(series.dtype),
+                    'bytes': int(usage[name]),
+                    'categories': len(series.cat.categories) if categorical else None,
+                    'mapped': _mapped(values)
+                }
+        return self._columns
+
+    def describe_memory(self):
+        breakdown = self.memory_breakdown()
+        columns = self.memory_columns()
+        return {
+            **self.describe(),
+            'total_bytes': self.memory_bytes,
+            'dataframe': {
+                'bytes': breakdown['dataframe'],
+                'mapped_bytes': sum(column['bytes'] for column in columns.values() if column['mapped']),
+                'columns': columns
+            },
+            'indexes': {name: size for name, size in breakdown.items() if name != 'dataframe'}
+        }
+
+    @property
+    def memory_bytes(self):
+        return sum(self.memory_breakdown().values())
+
+    def missing(self):
+        # What a ready snapshot needs and this one lacks
+        missing = []
+        if self.df.empty:
+            missing.append('dataset')
+        if not len(self.segments.keys()):
+            missing.append('indexes')
+        if self.model is None:
+            missing.append('model')
+        return missing
+
+    def describe(self):
+        return {
+            'market': self.market,
+            'generation': self.generation,
+            'version': self.version,
+            'loaded_at': self.loaded_at,
+            'rows': len(self.df),
+            'model_loaded': self.model is not None,
+            'model_engine': type(self.model).__name__ if self.model is not None else None
+        }
+
+
+def release_memory():
+    # Building a snapshot frees far more than it keeps (CSV parse buffers,
+    # groupby and sort temporaries); glibc keeps freed heap mapped until asked
+    try:
+        ctypes.CDLL('libc.so.6').malloc_trim(0)
+    except (OSError, AttributeError):
+        pass
+
+
+def load_snapshot(generation=0, strict=False, paths=DEFAULT_PATHS, market=DEFAULT_MARKET):
+    print(f"Loading data and ML model ({market})...")
+    schema = load_schema(paths.schema)
+    timings = {}
+    load_error = None
+    try:
+        with stage('dataset', timings):
+            df = load_dataset(paths.csv, paths.columns, paths.fallbacks)
+        with stage('model', timings):
+            model = load_model(paths.model, paths.compiled, schema)
+    except Exception as e:
+        if strict:
+            raise
+        print(f"❌ Error loading data: {e}")
+        df = pd.DataFrame()  # Empty fallback
+        model = None
+        load_error = str(e)
+    snapshot = DataSnapshot(df, model, generation, market, schema, timings, load_error=load_error)
+    release_memory()
+    return snapshot
+
+
+def _file_signature(path):
+    try:
+        stat = os.stat(path)
+        return stat.st_size, stat.st_mtime_ns
+    except OSError:
+        return None
+
+
+class SnapshotManager:
+    def __init__(self, snapshot, paths=DEFAULT_PATHS):
+        self._snapshot = snapshot
+        self.paths = paths
+        self._lock = threading.Lock()
+        self._reload_thread = None
+        self._watch_thread = None
+        self._stopped = threading.Event()
+        self._ingestor = None
+        self.status = {'state': 'ready', 'last_error': None, 'last_reload': None, 'duration_s': None}
+        forksafe.register(self)
+
+    def _after_fork(self):
+        self._lock = threading.Lock()
+        self._stopped = forksafe.fresh_event(self._stopped)
+
+    def current(self):
+        return self._snapshot
+
+    @property
+    def reloading(self):
+        return self._reload_thread is not None and self._reload_thread.is_alive()
+
+    def replace(self, expected, snapshot):
+        # Installs an ingested snapshot unless a reload got there first
+        with self._lock:
+            if self._snapshot is not expected or self.reloading:
+                return False
+            self._snapshot = snapshot
+            return True
+
+    @property
+    def ingestor(self):
+        with self._lock:
+            if self._ingestor is None:
+                from ingest import ListingIngestor
+                self._ingestor = ListingIngestor(self)
+            return self._ingestor
+
+    def reload(self, wait=False):
+        with self._lock:
+            if self.reloading:
+                return False
+            self.status['state'] = 'loading'
+            self._reload_thread = threading.Thread(target=self._reload, name='snapshot-reload', daemon=True)
+            self._reload_thread.start()
+        if wait:
+            self._reload_thread.join()
+        return True
+
+    def _reload(self):
+        started = time.perf_counter()
+        try:
+            snapshot = load_snapshot(self._snapshot.generation + 1, True, self.paths, self._snapshot.market)
+        except Exception as e:
+            # Keep serving the previous snapshot
+            print(f"❌ Reload failed: {e}")
+            self.status.update(state='failed', last_error=str(e))
+            return
+        self._snapshot = snapshot
+        self.status.update(
+            state='ready',
+            last_error=None,
+            last_reload=snapshot.loaded_at,
+            duration_s=round(time.perf_counter() - started, 3)
+        )
+        print(f"🔄 Snapshot {snapshot.generation} live (dataset version {snapshot.version})")
+
+    def watch(self, paths=None, interval=WATCH_INTERVAL):
+        if self._watch_thread is not None:
+            return
+        paths = paths or self.paths.watched
+
+        def poll():
+            seen = {path: _file_signature(path) for path in paths}
+            pending = None
+            while not self._stopped.wait(interval):
+                current = {path: _file_signature(path) for path in paths}
+                if current == seen:
+                    pending = None
+                    continue
+                if current != pending:
+                    # Wait one more tick so files that are still being written settle
+                    pending = current
+                    continue
+                changed = [path for path in paths if current[path] != seen[path]]
+                print(f"🔄 Detected change in {', '.join(changed)}, reloading")
+                # Retry on the next tick if a reload is already running
+                if self.reload():
+                    seen, pending = current, None
+
+        self._watch_thread = threading.Thread(target=poll, name='snapshot-watch', daemon=True)
+        self._watch_thread.start()
+        print(f"👀 Watching {', '.join(paths)} every {interval}s")
+
+    def stop(self):
+        # Ends the file watcher and ingest publisher so an evicted market can be freed
+        self._stopped.set()
+        if self._ingestor is not None:
+            self._ingestor.stop()
+
+    def describe(self):
+        return {**self.status, 'snapshot': self._snapshot.describe()}
@@ -0,0 +1,197 @@
+import math
+import os
+
+import numpy as np
+
+from deals import NAME_COL
+from segments import NEIGHBORHOOD_COL, ROOM_TYPE_COL, PriceSample, row_dtype
+from serialize import column_records
+
+# Nearest-neighbour index over listing coordinates. Each room type gets its
+# own KD-tree of points on the unit sphere, so a chord distance in the tree
+# converts exactly to a great-circle distance and a room type filter never
+# scans other listings. Queries without a room type merge the per-type
+# results.
+#
+# Price filters are applied to the nearest candidates, starting from the
+# fetch size the filter's selectivity predicts and growing 4x until k match
+# or the radius is exhausted. Each tree also keeps its points in price order,
+# so when only a small slice of a tree is in the price range that slice is
+# scanned directly instead of walking most of the tree.
+
+LAT_COL = 'lat'
+LONG_COL = 'long'
+EARTH_RADIUS_KM = 6371.0088
+MAX_NEARBY_K = 500
+COMPARABLE_K = int(os.environ.get('COMPARABLE_K', 50))
+FETCH_GROWTH = 4
+# Scan the price slice when it is smaller than this many expected KD-tree fetches
+SCAN_FACTOR = 32
+
+
+def to_unit_xyz(lat, long):
+    lat = np.radians(np.asarray(lat, dtype=np.float64))
+    long = np.radians(np.asarray(long, dtype=np.float64))
+    cos_lat = np.cos(lat)
+    return np.column_stack([cos_lat * np.cos(long), cos_lat * np.sin(long), np.sin(lat)])
+
+
+def chord_to_km(chord):
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.minimum(np.asarray(chord) / 2, 1.0))
+
+
+def km_to_chord(km):
+    return 2 * math.sin(min(km / EARTH_RADIUS_KM, math.pi) / 2)
+
+
+def parse_location(values):
+    # Returns (lat, long), or None when the caller sent neither
+    lat, long = values.get('lat'), values.get('long')
+    if lat in (None, '') and long in (None, ''):
+        return None
+    if lat in (None, '') or long in (None, ''):
+        raise ValueError('lat and long must be given together')
+    try:
+        lat, long = float(lat), float(long)
+    except (TypeError, ValueError):
+        raise ValueError(f'Invalid coordinates: {lat!r}, {long!r}')
+    if not (-90 <= lat <= 90 and -180 <= long <= 180):
+        raise ValueError(f'Coordinates out of range: {lat}, {long}')
+    return lat, long
+
+
+def parse_number(values, name):
+    # A finite float, or None when the parameter is absent
+    value = values.get(name)
+    if value in (None, ''):
+        return None
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        raise ValueError(f'{name} must be a number')
+    if not math.isfinite(number):
+        raise ValueError(f'{name} must be finite')
+    return number
+
+
+class SpatialIndex:
+    def __init__(self, df, segments, room_type_col=ROOM_TYPE_COL, lat_col=LAT_COL, long_col=LONG_COL):
+        from scipy.spatial import cKDTree
+
+        self.prices = segments.prices
+        self.ids = segments.ids
+        self.names = df[NAME_COL] if NAME_COL in df.columns else None
+        self.room_types = df[room_type_col] if room_type_col in df.columns else None
+        self.neighborhoods = df[NEIGHBORHOOD_COL] if NEIGHBORHOOD_COL in df.columns else None
+        self._trees = []
+        self.size = 0
+        if lat_col not in df.columns or long_col not in df.columns:
+            self.lat = self.long = np.empty(0)
+            return
+        self.lat = df[lat_col].to_numpy(dtype=float, na_value=np.nan)
+        self.long = df[long_col].to_numpy(dtype=float, na_value=np.nan)
+        located = np.isfinite(self.lat) & np.isfinite(self.long) & (np.abs(self.lat) <= 90) & (np.abs(self.long) <= 180)
+
+        groups = []
+        if room_type_col in df.columns:
+            room_types = df[room_type_col].astype('category')
+            codes = room_types.cat.codes.to_numpy()
+            for code, room_type in enumerate(room_types.cat.categories):
+                groups.append((room_type, np.flatnonzero(located & (codes == code))))
+            # Listings without a room type only show up in unfiltered queries
+            groups.append((None, np.flatnonzero(located & (codes < 0))))
+        else:
+            groups.append((None, np.flatnonzero(located)))
+
+        dtype = row_dtype(len(df))
+        for room_type, rows in groups:
+            if len(rows) == 0:
+                continue
+            rows = rows.astype(dtype)
+            tree = cKDTree(to_unit_xyz(self.lat[rows], self.long[rows]), balanced_tree=False)
+            # Tree positions of the priced listings, in price order
+            prices = self.prices[rows]
+            by_price = np.argsort(prices, kind='stable')[:int(np.isfinite(prices).sum())].astype(dtype)
+            self._trees.append((room_type, tree, rows, by_price, prices[by_price]))
+            self.size += len(rows)
+
+    def _price_mask(self, rows, min_price, max_price, priced):
+        prices = self.prices[rows]
+        keep = np.isfinite(prices) if priced else np.ones(len(rows), dtype=bool)
+        if min_price is not None:
+            keep &= prices >= min_price
+        if max_price is not None:
+            keep &= prices <= max_price
+        return keep
+
+    def _scan(self, tree, rows, positions, point, k, bound):
+        distances = np.sqrt(((tree.data[positions] - point) ** 2).sum(axis=1))
+        inside = distances <= bound
+        candidates, distances = rows[positions[inside]], distances[inside]
+        order = np.lexsort((candidates, distances))[:k]
+        return candidates[order], distances[order]
+
+    def _query_tree(self, tree, rows, by_price, sorted_prices, point, k, bound, min_price, max_price, priced):
+        filtered = priced or min_price is not None or max_price is not None
+        fetch = k
+        if filtered:
+            low = int(np.searchsorted(sorted_prices, min_price, side='left')) if min_price is not None else 0
+            high = int(np.searchsorted(sorted_prices, max_price, side='right')) if max_price is not None else len(sorted_prices)
+            available = high - low
+            if available <= 0:
+                return np.empty(0, dtype=np.intp), np.empty(0)
+            fetch = int(math.ceil(k * tree.n / available))
+            if available < fetch * SCAN_FACTOR:
+                return self._scan(tree, rows, by_price[low:high], point, k, bound)
+        while True:
+            fetch = min(fetch, tree.n)
+            distances, positions = tree.query(point, k=fetch, distance_upper_bound=bound)
+            distances, positions = np.atleast_1d(distances), np.atleast_1d(positions)
+            hit = positions < tree.n
+            candidates, distances = rows[positions[hit]], distances[hit]
+            if filtered:
+                keep = self._price_mask(candidates, min_price, max_price, priced)
+                candidates, distances = candidates[keep], distances[keep]
+            exhausted = fetch >= tree.n or not hit.all()
+            if len(candidates) >= k or exhausted:
+                return candidates[:k], distances[:k]
+            fetch *= FETCH_GROWTH
+
+    def nearest(self, lat, long, k=10, radius_km=None, room_type=None, min_price=None, max_price=None, priced=False):
+        # Row positions and distances in km, nearest first (ties in dataset order)
+        if k <= 0:
+            return np.empty(0, dtype=np.intp), np.empty(0)
+        point = to_unit_xyz(lat, long)[0]
+        bound = km_to_chord(radius_km) if radius_km is not None else np.inf
+        found_rows, found_distances = [], []
+        for tree_room_type, tree, rows, by_price, sorted_prices in self._trees:
+            if room_type is not None and tree_room_type != room_type:
+                continue
+            candidates, distances = self._query_tree(tree, rows, by_price, sorted_prices, point, k, bound, min_price, max_price, priced)
+            found_rows.append(candidates)
+            found_distances.append(distances)
+        if not found_rows:
+            return np.empty(0, dtype=np.intp), np.empty(0)
+        rows, distances = np.concatenate(found_rows), np.concatenate(found_distances)
+        order = np.lexsort((rows, distances))[:k]
+        return rows[order], chord_to_km(distances[order])
+
+    def comparables(self, lat, long, room_type, k=COMPARABLE_K):
+        # The k nearest priced listings of the same room type, and how far out they reach
+        rows, distances = self.nearest(lat, long, k, room_type=room_type, priced=True)
+        max_km = float(distances[-1]) if len(distances) else None
+        return PriceSample(np.sort(self.prices[rows])), max_km
+
+    def records(self, rows, distances):
+        # .array.take skips the index bookkeeping .iloc does for a handful of rows
+        missing = [None] * len(rows)
+        return column_records({
+            'id': self.ids[rows],
+            'name': self.names.array.take(rows) if self.names is not None else missing,
+            'room_type': self.room_types.array.take(rows) if self.room_types is not None else missing,
+            'neighbourhood_group': self.neighborhoods.array.take(rows) if self.neighborhoods is not None else missing,
+            'price': self.prices[rows],
+            'lat': self.lat[rows],
+            'long': self.long[rows],
+            'distance_km': np.round(distances, 3)
+        })
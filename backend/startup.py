@@ -0,0 +1,126 @@
+import importlib
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+import forksafe
+
+# Startup timeline. The web server binds as soon as Flask is imported; the
+# data layer (pandas, numpy, scipy, the dataset, indexes and model) is
+# imported and loaded on a background thread. Until that finishes /healthz
+# answers and /readyz reports progress, while data routes wait for it (up to
+# NESTMETRICS_STARTUP_WAIT seconds, then 503). Each phase is timed and the
+# breakdown is printed once the service is ready.
+
+STARTUP_WAIT = float(os.environ.get('NESTMETRICS_STARTUP_WAIT', 30))
+
+
+class LazyModule:
+    # Stands in for a module until an attribute is first read, then imports it.
+    # It isn't registered in sys.modules, so code walking sys.modules never
+    # triggers the import, and concurrent first reads wait on the import lock.
+    __slots__ = ('_name', '_module')
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def _load(self):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return self._module
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __repr__(self):
+        return f"<lazy module '{self._name}'{' (loaded)' if self._module is not None else ''}>"
+
+
+def lazy_import(name):
+    module = sys.modules.get(name)
+    return module if module is not None else LazyModule(name)
+
+
+def resolve(*modules):
+    # Imports lazily referenced modules now
+    for module in modules:
+        if isinstance(module, LazyModule):
+            module._load()
+
+
+class Startup:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self._mark = self.started
+        self.phases = {}
+        self.state = 'starting'
+        self.error = None
+        self.ready_after = None
+        self._done = threading.Event()
+        self._thread = None
+        forksafe.register(self)
+
+    def _after_fork(self):
+        self._done = forksafe.fresh_event(self._done)
+        self._thread = None
+
+    @property
+    def ready(self):
+        return self.state == 'ready'
+
+    def mark(self, name):
+        # Time since the previous mark, for the imports the main thread does itself
+        now = time.perf_counter()
+        self.phases[name] = round(now - self._mark, 4)
+        self._mark = now
+
+    @contextmanager
+    def phase(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = round(time.perf_counter() - started, 4)
+
+    def record(self, timings):
+        for name, seconds in timings.items():
+            self.phases[name] = round(seconds, 4)
+
+    def begin(self, load):
+        # load(startup) runs on a daemon thread; the service is ready when it returns
+        def run():
+            self.state = 'loading'
+            try:
+                load(self)
+            except Exception as e:
+                self.state, self.error = 'failed', str(e)
+                print(f"❌ Startup failed: {e}")
+            else:
+                self.state = 'ready'
+            self.ready_after = round(time.perf_counter() - self.started, 3)
+            self._done.set()
+            if self.ready:
+                self.report()
+
+        self._thread = threading.Thread(target=run, name='startup-loader', daemon=True)
+        self._thread.start()
+
+    def wait(self, timeout=None):
+        self._done.wait(timeout)
+        return self.ready
+
+    def report(self):
+        breakdown = ', '.join(f'{name} {seconds:.2f}s' for name, seconds in self.phases.items())
+        print(f"⏱️ Ready after {self.ready_after:.2f}s ({breakdown})")
+
+    def describe(self):
+        return {
+            'state': self.state,
+            'error': self.error,
+            'uptime_s': round(time.perf_counter() - self.started, 3),
+            'ready_after_s': self.ready_after,
+            'phases': dict(self.phases)
+        }
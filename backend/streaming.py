@@ -0,0 +1,233 @@
+import math
+import os
+
+import numpy as np
+import pandas as pd
+
+from deals import REVIEWS_COL
+from segments import NEIGHBORHOOD_COL, PRICE_COL, ROOM_TYPE_COL
+
+# Running aggregates behind /api/stats once listings are being ingested.
+#
+# Every per-neighbourhood and per-room-type figure is a running count or sum,
+# and medians / tier cut-offs come from quantile sketches, so an upsert only
+# subtracts the old rows and adds the new ones instead of re-reading the
+# frame. The sketches are log-bucketed histograms: a value v lands in bucket
+# ceil(log_gamma(v)) with gamma = (1 + a) / (1 - a), which bounds the
+# relative error of any quantile by a (0.5% by default). Buckets are plain
+# counters, so sketches merge by addition and support deletes, which upserts
+# need and rank-based sketches (KLL, t-digest) don't.
+
+SKETCH_ACCURACY = float(os.environ.get('NESTMETRICS_SKETCH_ACCURACY', 0.005))
+VALID_PRICE_RANGE = (10, 2000)
+
+
+class QuantileSketch:
+    def __init__(self, accuracy=SKETCH_ACCURACY):
+        self.gamma = (1 + accuracy) / (1 - accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.counts = np.zeros(0, dtype=np.int64)
+        self.offset = 0
+        # Values <= 0 have no log bucket
+        self.zeros = 0
+
+    @property
+    def count(self):
+        return self.zeros + int(self.counts.sum())
+
+    def _keys(self, values):
+        return np.ceil(np.log(values) / self._log_gamma).astype(np.int64)
+
+    def _grow(self, low, high):
+        if not len(self.counts):
+            self.counts = np.zeros(high - low + 1, dtype=np.int64)
+            self.offset = low
+            return
+        low, high = min(low, self.offset), max(high, self.offset + len(self.counts) - 1)
+        if low == self.offset and high == self.offset + len(self.counts) - 1:
+            return
+        counts = np.zeros(high - low + 1, dtype=np.int64)
+        counts[self.offset - low:self.offset - low + len(self.counts)] = self.counts
+        self.counts, self.offset = counts, low
+
+    def update(self, values, sign=1):
+        # sign=-1 removes values that were added earlier
+        values = np.asarray(values, dtype=float)
+        values = values[np.isfinite(values)]
+        positive = values > 0
+        self.zeros += sign * int(len(values) - positive.sum())
+        if not positive.any():
+            return
+        keys = self._keys(values[positive])
+        low, high = int(keys.min()), int(keys.max())
+        self._grow(low, high)
+        self.counts[low - self.offset:high - self.offset + 1] += sign * np.bincount(keys - low, minlength=high - low + 1)
+
+    def merge(self, other):
+        self.zeros += other.zeros
+        if len(other.counts):
+            self._grow(other.offset, other.offset + len(other.counts) - 1)
+            start = other.offset - self.offset
+            self.counts[start:start + len(other.counts)] += other.counts
+
+    def _value_at(self, rank, cumulative):
+        # Representative value of the rank-th smallest entry (0-based)
+        if rank < self.zeros:
+            return 0.0
+        bucket = int(np.searchsorted(cumulative, rank - self.zeros, side='right'))
+        return 2 * self.gamma ** (bucket + self.offset) / (self.gamma + 1)
+
+    def quantile(self, q):
+        # Linear interpolation between order statistics, like pandas
+        n = self.count
+        if n == 0:
+            return np.nan
+        cumulative = np.cumsum(self.counts)
+        position = q * (n - 1)
+        below, above = math.floor(position), math.ceil(position)
+        low = self._value_at(below, cumulative)
+        if above == below:
+            return low
+        return low + (self._value_at(above, cumulative) - low) * (position - below)
+
+    def count_below(self, value):
+        # Entries below value, spreading value's own bucket uniformly over its range
+        if value <= 0 or not len(self.counts):
+            return self.zeros if value > 0 else 0
+        key = int(self._keys(np.array([value]))[0])
+        index = key - self.offset
+        if index < 0:
+            return self.zeros
+        if index >= len(self.counts):
+            return self.count
+        upper = self.gamma ** key
+        lower = upper / self.gamma
+        partial = self.counts[index] * (value - lower) / (upper - lower)
+        return self.zeros + int(self.counts[:index].sum() + round(partial))
+
+    def count_above(self, value):
+        return self.count - self.count_below(value)
+
+
+class GroupTotals:
+    # Running price / reviews totals per value of one grouping column
+    def __init__(self, with_sketches=False):
+        self.codes = {}
+        self.names = []
+        self.totals = np.zeros((0, 4))
+        self.sketches = [] if with_sketches else None
+
+    def _code(self, name):
+        code = self.codes.get(name)
+        if code is None:
+            code = self.codes[name] = len(self.names)
+            self.names.append(name)
+            if self.sketches is not None:
+                self.sketches.append(QuantileSketch())
+        return code
+
+    def _code_array(self, values):
+        local, uniques = pd.factorize(values)
+        mapping = np.array([self._code(name) for name in uniques] + [-1], dtype=np.intp)
+        if len(self.names) > len(self.totals):
+            self.totals = np.vstack([self.totals, np.zeros((len(self.names) - len(self.totals), 4))])
+        # factorize marks missing values -1, which reads the trailing -1
+        return mapping[local]
+
+    def update(self, groups, prices, reviews, sign):
+        codes = self._code_array(groups)
+        keep = codes >= 0
+        codes, prices, reviews = codes[keep], prices[keep], reviews[keep]
+        has_price, has_reviews = ~np.isnan(prices), ~np.isnan(reviews)
+        n = len(self.names)
+        # Columns: price sum, price count, reviews sum, reviews count
+        self.totals += sign * np.column_stack([
+            np.bincount(codes, weights=np.where(has_price, prices, 0), minlength=n),
+            np.bincount(codes, weights=has_price, minlength=n),
+            np.bincount(codes, weights=np.where(has_reviews, reviews, 0), minlength=n),
+            np.bincount(codes, weights=has_reviews, minlength=n)
+        ])
+        if self.sketches is not None:
+            for code in np.unique(codes):
+                self.sketches[code].update(prices[codes == code], sign)
+
+    def describe(self, with_median=False):
+        groups = {}
+        for code, name in enumerate(self.names):
+            price_sum, price_count, reviews_sum, reviews_count = self.totals[code]
+            if round(price_count) == 0 and round(reviews_count) == 0:
+                continue
+            entry = {
+                'avg_price': round(float(price_sum / price_count), 2) if price_count else np.nan,
+                'listings': int(round(price_count)),
+                'avg_reviews': round(float(reviews_sum / reviews_count), 2) if reviews_count else np.nan
+            }
+            if with_median:
+                entry['median_price'] = round(float(self.sketches[code].quantile(0.5)), 2)
+            groups[name] = entry
+        return groups
+
+
+class StreamingStats:
+    def __init__(self, df, price_col=PRICE_COL, reviews_col=REVIEWS_COL,
+                 room_type_col=ROOM_TYPE_COL, neighborhood_col=NEIGHBORHOOD_COL):
+        self.price_col = price_col
+        self.reviews_col = reviews_col
+        self.room_type_col = room_type_col
+        self.neighborhood_col = neighborhood_col
+        self.rows = 0
+        self.active = 0
+        self.reviews_total = 0.0
+        self.valid_sum = 0.0
+        self.valid_prices = QuantileSketch()
+        self.neighborhoods = GroupTotals(with_sketches=True)
+        self.room_types = GroupTotals()
+        self.add(df)
+
+    def _column(self, df, name):
+        if name not in df.columns:
+            return np.full(len(df), np.nan)
+        return pd.to_numeric(df[name], errors='coerce').to_numpy(dtype=float)
+
+    def _update(self, df, sign):
+        prices = self._column(df, self.price_col)
+        reviews = self._column(df, self.reviews_col)
+        low, high = VALID_PRICE_RANGE
+        valid = prices[(prices >= low) & (prices <= high)]
+        self.rows += sign * len(df)
+        self.active += sign * int((reviews > 0).sum())
+        self.reviews_total += sign * float(np.nansum(reviews))
+        self.valid_sum += sign * float(valid.sum())
+        self.valid_prices.update(valid, sign)
+        for totals, column in ((self.neighborhoods, self.neighborhood_col), (self.room_types, self.room_type_col)):
+            if column in df.columns:
+                totals.update(df[column].reset_index(drop=True), prices, reviews, sign)
+
+    def add(self, df):
+        self._update(df, 1)
+
+    def remove(self, df):
+        self._update(df, -1)
+
+    def stats(self):
+        # Same payload as aggregates.build_stats
+        valid_count = self.valid_prices.count
+        if not valid_count:
+            raise ValueError('No valid price data')
+        q20, q80 = self.valid_prices.quantile(0.2), self.valid_prices.quantile(0.8)
+        return {
+            'overview': {
+                'avg_price': round(self.valid_sum / valid_count, 2),
+                'median_price': round(float(self.valid_prices.quantile(0.5)), 2),
+                'avg_reviews': round(self.reviews_total / self.rows, 2) if self.rows else 0.0,
+                'total_listings': self.rows,
+                'active_listings': self.active
+            },
+            'neighborhoods': self.neighborhoods.describe(with_median=True),
+            'room_types': self.room_types.describe(),
+            'performance_tiers': {
+                'premium': self.valid_prices.count_above(q80),
+                'standard': self.valid_prices.count_below(q80) - self.valid_prices.count_below(q20),
+                'budget': self.valid_prices.count_below(q20)
+            }
+        }
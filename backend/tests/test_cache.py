@@ -0,0 +1,151 @@
+import threading
+import time
+
+import pytest
+
+import cache
+from cache import CachedResponse, ResponseCache, floor_budget
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(cache, 'time', clock)
+    return clock
+
+
+def wait_until(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, 'timed out'
+        time.sleep(0.001)
+
+
+def key(name, route='/api/find-deals'):
+    return (route, 'nyc', 'v1', (name,))
+
+
+def response(body=b'{}', status=200, ttl=60):
+    return CachedResponse(body, status, 'application/json', ttl)
+
+
+def test_entries_expire_after_ttl(clock):
+    responses = ResponseCache(ttl=60)
+    responses.put(key('a'), response(ttl=60))
+    clock.now += 59
+    assert responses.lookup(key('a')) is not None
+    clock.now += 2
+    assert responses.lookup(key('a')) is None
+    assert responses.expirations == 1
+    assert len(responses) == 0
+
+
+def test_least_recently_used_entry_is_evicted(clock):
+    responses = ResponseCache(max_entries=2)
+    responses.put(key('a'), response())
+    responses.put(key('b'), response())
+    # Touching a makes b the oldest
+    assert responses.lookup(key('a')) is not None
+    responses.put(key('c'), response())
+    assert responses.lookup(key('b')) is None
+    assert responses.lookup(key('a')) is not None
+    assert responses.lookup(key('c')) is not None
+    assert responses.evictions == 1
+
+
+def test_byte_budget_evicts_oldest(clock):
+    responses = ResponseCache(max_bytes=10)
+    responses.put(key('a'), response(b'x' * 6))
+    responses.put(key('b'), response(b'y' * 6))
+    assert responses.lookup(key('a')) is None
+    assert responses.bytes == 6
+    # Larger than the whole budget: never stored
+    responses.put(key('c'), response(b'z' * 11))
+    assert responses.lookup(key('c')) is None
+
+
+def test_server_errors_are_not_cached(clock):
+    responses = ResponseCache()
+    entry, outcome = responses.get_or_compute(key('a'), lambda: response(status=500))
+    assert outcome == 'miss' and entry.status == 500
+    assert responses.lookup(key('a')) is None
+
+
+def test_concurrent_misses_compute_once(clock):
+    responses = ResponseCache()
+    release = threading.Event()
+    calls = []
+
+    def compute():
+        calls.append(1)
+        release.wait(5)
+        return response(b'{"deals":1}')
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(responses.get_or_compute(key('a'), compute)))
+               for _ in range(4)]
+    threads[0].start()
+    wait_until(lambda: responses._pending)
+    for thread in threads[1:]:
+        thread.start()
+    wait_until(lambda: responses.coalesced == 3)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert len(calls) == 1
+    assert sorted(outcome for _, outcome in results) == ['coalesced', 'coalesced', 'coalesced', 'miss']
+    assert {entry.body for entry, _ in results} == {b'{"deals":1}'}
+    assert responses.get_or_compute(key('a'), compute)[1] == 'hit'
+
+
+def test_failed_computation_reaches_waiters_and_is_retried(clock):
+    responses = ResponseCache()
+    release = threading.Event()
+
+    def fail():
+        release.wait(5)
+        raise RuntimeError('boom')
+
+    errors = []
+
+    def request():
+        try:
+            responses.get_or_compute(key('a'), fail)
+        except RuntimeError as e:
+            errors.append(str(e))
+
+    leader = threading.Thread(target=request)
+    leader.start()
+    wait_until(lambda: responses._pending)
+    waiter = threading.Thread(target=request)
+    waiter.start()
+    wait_until(lambda: responses.coalesced == 1)
+    release.set()
+    leader.join(5)
+    waiter.join(5)
+
+    assert errors == ['boom', 'boom']
+    assert not responses._pending
+    assert responses.get_or_compute(key('a'), response)[1] == 'miss'
+
+
+def test_disabled_cache_bypasses(clock):
+    responses = ResponseCache(max_entries=0)
+    assert responses.get_or_compute(key('a'), response)[1] == 'bypass'
+    assert responses.lookup(key('a')) is None
+
+
+@pytest.mark.parametrize('budget,expected', [(99.6, 99.0), (100.0, 100.0), (100.4, 100.0), (0.29, 0.0)])
+def test_budgets_round_down(monkeypatch, budget, expected):
+    monkeypatch.setattr(cache, 'PRICE_STEP', 1.0)
+    assert floor_budget(budget) == expected
+    assert floor_budget(budget) <= budget
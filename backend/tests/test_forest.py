@@ -0,0 +1,65 @@
+import numpy as np
+import pytest
+
+from forest import DEDUPE_MIN_ROWS, CompiledForest
+
+sklearn_ensemble = pytest.importorskip('sklearn.ensemble')
+
+
+def training_data(rows=3000, features=6, nan_fraction=0.0, seed=0):
+    rng = np.random.default_rng(seed)
+    X = rng.uniform(-5, 5, size=(rows, features))
+    # A few low-cardinality columns, like the encoded request features
+    X[:, :2] = rng.integers(0, 5, size=(rows, 2))
+    y = X[:, 0] * 30 + np.sin(X[:, 2]) * 50 + X[:, 3] ** 2 + rng.normal(0, 5, rows)
+    if nan_fraction:
+        X[rng.random(X.shape) < nan_fraction] = np.nan
+    return X, y
+
+
+def fit(X, y):
+    model = sklearn_ensemble.RandomForestRegressor(n_estimators=12, min_samples_leaf=2, random_state=0)
+    return model.fit(X, y)
+
+
+@pytest.fixture(scope='module')
+def model():
+    return fit(*training_data())
+
+
+@pytest.fixture(scope='module')
+def nan_model():
+    return fit(*training_data(nan_fraction=0.1))
+
+
+def test_random_rows_match_sklearn_exactly(model):
+    X, _ = training_data(rows=2000, seed=1)
+    forest = CompiledForest.from_sklearn(model)
+    np.testing.assert_array_equal(forest.predict(X), model.predict(X))
+
+
+def test_repeated_rows_match_sklearn_exactly(model):
+    # Enough repeats for predict() to take its dedupe path
+    X, _ = training_data(rows=20, seed=2)
+    X = np.repeat(X, DEDUPE_MIN_ROWS, axis=0)
+    forest = CompiledForest.from_sklearn(model)
+    np.testing.assert_array_equal(forest.predict(X), model.predict(X))
+
+
+def test_missing_values_match_sklearn_exactly(nan_model):
+    X, _ = training_data(rows=2000, nan_fraction=0.2, seed=3)
+    X[0] = np.nan
+    forest = CompiledForest.from_sklearn(nan_model)
+    np.testing.assert_array_equal(forest.predict(X), nan_model.predict(X))
+
+
+def test_saved_forest_matches_sklearn_exactly(model, tmp_path):
+    X, _ = training_data(rows=500, seed=4)
+    CompiledForest.from_sklearn(model).save(str(tmp_path))
+    forest = CompiledForest.load(str(tmp_path))
+    np.testing.assert_array_equal(forest.predict(X), model.predict(X))
+
+
+def test_rejects_wrong_feature_count(model):
+    with pytest.raises(ValueError):
+        CompiledForest.from_sklearn(model).predict(np.zeros((3, 2)))
@@ -0,0 +1,93 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from deals import DealEngine
+from segments import MARKET_PERCENTILES, PriceSample, SegmentIndex, categorize
+
+ROOM_TYPES = ['Entire home/apt', 'Private room', 'Shared room']
+NEIGHBORHOODS = ['Manhattan', 'Brooklyn', 'Queens']
+
+
+def listings(rows=5000, seed=0):
+    rng = np.random.default_rng(seed)
+    prices = rng.integers(20, 800, rows).astype(float)
+    prices[rng.random(rows) < 0.05] = np.nan
+    df = pd.DataFrame({
+        'id': rng.permutation(rows) + 1000,
+        'room type': rng.choice(ROOM_TYPES, rows, p=[0.6, 0.35, 0.05]),
+        'neighbourhood group': rng.choice(NEIGHBORHOODS, rows),
+        'price_$': prices,
+        # Rounded, so many listings tie on score
+        'reviews per month': np.round(rng.exponential(1.5, rows), 1),
+        'NAME': [f'Listing {i}' for i in range(rows)]
+    })
+    df.loc[rng.random(rows) < 0.05, 'reviews per month'] = np.nan
+    return categorize(df)
+
+
+@pytest.fixture(scope='module')
+def df():
+    return listings()
+
+
+@pytest.fixture(scope='module')
+def segments(df):
+    return SegmentIndex(df)
+
+
+def segment_keys():
+    return [(None, None)] + [(room_type, None) for room_type in ROOM_TYPES] + \
+        [(None, area) for area in NEIGHBORHOODS] + [(room_type, area) for room_type in ROOM_TYPES for area in NEIGHBORHOODS]
+
+
+def segment_frame(df, room_type, neighborhood):
+    mask = np.ones(len(df), dtype=bool)
+    if room_type is not None:
+        mask &= df['room type'] == room_type
+    if neighborhood is not None:
+        mask &= df['neighbourhood group'] == neighborhood
+    return df[mask]
+
+
+@pytest.mark.parametrize('key', segment_keys())
+def test_quantiles_match_series_quantile(df, segments, key):
+    prices = segment_frame(df, *key)['price_$']
+    qs = [0.0, 0.1, 0.25, 0.4, 0.5, 0.75, 0.9, 0.99, 1.0]
+    np.testing.assert_allclose(segments.price_quantile(qs, *key), prices.quantile(qs).to_numpy(), rtol=1e-12)
+    assert segments.price_median(*key) == pytest.approx(prices.median(), rel=1e-12)
+    assert segments.price_mean(*key) == pytest.approx(prices.mean(), rel=1e-12)
+    assert segments.count_under_price(150, *key) == int((prices <= 150).sum())
+
+
+def test_price_sample_percentiles_match_series_quantile(df):
+    prices = df['price_$'].dropna()
+    sample = PriceSample(np.sort(prices.to_numpy()))
+    expected = prices.quantile(MARKET_PERCENTILES).to_numpy()
+    np.testing.assert_allclose(sample.quantile(MARKET_PERCENTILES), expected, rtol=1e-12)
+
+
+def test_empty_segment_quantile_is_nan(segments):
+    assert np.isnan(segments.price_quantile(0.5, 'Hotel room', 'Manhattan'))
+
+
+def nlargest_deals(df, room_type, neighborhood, max_budget, k, offset):
+    segment = segment_frame(df, room_type, neighborhood)
+    within = segment[segment['price_$'] <= max_budget]
+    reviews = within['reviews per month'].fillna(0)
+    scores = (reviews * 20) + (100 - (within['price_$'] / max_budget * 100))
+    best = scores.nlargest(offset + k, keep='first')
+    return best.index.to_numpy()[offset:], best.to_numpy()[offset:]
+
+
+@pytest.mark.parametrize('chunk', [7, 64, 1024])
+@pytest.mark.parametrize('room_type,neighborhood', [('Entire home/apt', 'Manhattan'), ('Private room', 'Queens'), ('Shared room', 'Brooklyn')])
+@pytest.mark.parametrize('max_budget,k,offset', [(150, 10, 0), (400, 25, 30), (60, 5, 0), (10000, 50, 100)])
+def test_top_deals_match_nlargest(df, segments, monkeypatch, chunk, room_type, neighborhood, max_budget, k, offset):
+    # Smaller chunks make the early exit kick in sooner
+    monkeypatch.setattr('deals.SCAN_CHUNK', chunk)
+    engine = DealEngine(df, segments)
+    rows, scores = engine.top(room_type, neighborhood, max_budget, k, offset)
+    expected_rows, expected_scores = nlargest_deals(df, room_type, neighborhood, max_budget, k, offset)
+    np.testing.assert_array_equal(rows, expected_rows)
+    np.testing.assert_array_equal(scores, expected_scores)
@@ -0,0 +1,424 @@
+import argparse
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+
+import joblib
+import numpy as np
+import pandas as pd
+
+from aggregates import dataset_fingerprint
+from dataset import load_dataset
+from etl import ENCODED_COLUMNS
+from inference import MODEL_TARGET, dataset_schema, listing_features
+from markets import UnknownMarket, market_paths
+from snapshot import DEFAULT_MARKET, DEFAULT_PATHS, schema_mismatch
+
+# Parallel training for the random forest models. Every (target, candidate,
+# fold) fit of the cross-validated search is an independent task on a single
+# process pool, and each fit runs with n_jobs=1 to keep forests from
+# oversubscribing the cores. Once a target's search finishes, its best
+# parameters are refitted on the full training split in the same pool, so
+# the other targets' searches keep the remaining cores busy. Workers
+# memory-map the feature matrices from a scratch directory instead of
+# receiving them through the pool's pipes.
+#
+# The price model is built from listing_features(), the encoding ml_predict
+# uses for requests. Each run lands in models/artifacts/<version>/ with a
+# metadata.json holding the feature schema, chosen parameters, CV and holdout
+# scores and timings. Publishing copies the price model to models/model.pkl,
+# writes the schema next to it and recompiles the memory-mapped forest.
+# --market trains and publishes inside models/markets/<name>/ instead.
+
+ARTIFACTS = 'artifacts'
+ARTIFACTS_DIR = os.path.join(DEFAULT_PATHS.root, ARTIFACTS)
+METADATA = 'metadata.json'
+SERVED_MODEL = 'price'
+MATRICES = ['X_train', 'y_train', 'X_test', 'y_test']
+
+# Targets and feature sets follow notebooks/model_training.ipynb, except that
+# the price model uses the serving layout
+TARGETS = {
+    'price': {
+        'target': MODEL_TARGET,
+        'features': None,
+        'baseline': {'n_estimators': 200}
+    },
+    'review_rate': {
+        'target': 'review rate number',
+        'features': ['room_type_enc', 'neighbourhood_group_enc', 'price_$', 'service_fee_$', 'host_verified_enc'],
+        'baseline': {'n_estimators': 150}
+    },
+    'availability': {
+        'target': 'availability 365',
+        'features': ['room_type_enc', 'neighbourhood_group_enc', 'price_$', 'calculated host listings count'],
+        'baseline': {'n_estimators': 150}
+    }
+}
+
+SEARCH_SPACE = {
+    'n_estimators': [100, 150, 200],
+    'max_depth': [None, 12, 20],
+    'min_samples_leaf': [1, 2, 4],
+    'max_features': [1.0, 0.5, 'sqrt']
+}
+
+_matrices = {}
+
+
+def feature_names(name, schema):
+    return schema['features'] if name == SERVED_MODEL else TARGETS[name]['features']
+
+
+def feature_column(df, column):
+    if column not in df.columns and column in ENCODED_COLUMNS:
+        # LabelEncoder codes are the sorted category codes, as etl.py writes them
+        values = df[ENCODED_COLUMNS[column]]
+        codes = pd.Categorical(values, categories=sorted(values.dropna().unique())).codes
+        return np.where(codes < 0, np.nan, codes)
+    return df[column].to_numpy(dtype=np.float64)
+
+
+def build_matrices(df, name, workdir, test_size, seed, schema):
+    spec = TARGETS[name]
+    if name == SERVED_MODEL:
+        X = listing_features(df, schema)
+    else:
+        X = np.column_stack([feature_column(df, column) for column in spec['features']])
+    y = df[spec['target']].to_numpy(dtype=np.float64)
+    keep = np.isfinite(y) & np.isfinite(X).all(axis=1)
+    X, y = X[keep], y[keep]
+
+    # Shuffled once up front: the first rows of the training split double as the search sample
+    order = np.random.default_rng(seed).permutation(len(y))
+    n_test = int(round(len(y) * test_size))
+    test, train = order[:n_test], order[n_test:]
+
+    out_dir = os.path.join(workdir, name)
+    os.makedirs(out_dir)
+    parts = {'X_train': X[train], 'y_train': y[train], 'X_test': X[test], 'y_test': y[test]}
+    for part, values in parts.items():
+        np.save(os.path.join(out_dir, f'{part}.npy'), np.ascontiguousarray(values))
+    return {'rows': int(len(y)), 'dropped': int((~keep).sum()), 'train_rows': len(train), 'test_rows': n_test}
+
+
+def _load(workdir, name):
+    key = (workdir, name)
+    if key not in _matrices:
+        base = os.path.join(workdir, name)
+        _matrices[key] = {part: np.load(os.path.join(base, f'{part}.npy'), mmap_mode='r') for part in MATRICES}
+    return _matrices[key]
+
+
+def _regressor(params, seed, n_jobs=1):
+    from sklearn.ensemble import RandomForestRegressor
+    return RandomForestRegressor(random_state=seed, n_jobs=n_jobs, **params)
+
+
+def regression_metrics(actual, predicted):
+    from sklearn.metrics import mean_absolute_error, mean_squared_error, r2_score
+    return {
+        'r2': round(float(r2_score(actual, predicted)), 4),
+        'rmse': round(float(np.sqrt(mean_squared_error(actual, predicted))), 4),
+        'mae': round(float(mean_absolute_error(actual, predicted)), 4)
+    }
+
+
+def candidates(name, strategy, n_iter, seed):
+    baseline = TARGETS[name]['baseline']
+    if strategy == 'none':
+        return [baseline]
+    from sklearn.model_selection import ParameterGrid, ParameterSampler
+    if strategy == 'grid':
+        sampled = list(ParameterGrid(SEARCH_SPACE))
+    else:
+        sampled = list(ParameterSampler(SEARCH_SPACE, n_iter, random_state=seed))
+    # The notebook's settings always compete, so a search never ships something worse on CV
+    return [baseline] + [params for params in sampled if params != baseline]
+
+
+def cv_fold(workdir, name, candidate, params, fold, folds, search_rows, seed):
+    from sklearn.model_selection import KFold
+    data = _load(workdir, name)
+    X, y = data['X_train'][:search_rows], data['y_train'][:search_rows]
+    train, valid = list(KFold(folds, shuffle=True, random_state=seed).split(X))[fold]
+    started = time.perf_counter()
+    model = _regressor(params, seed).fit(X[train], y[train])
+    score = regression_metrics(y[valid], model.predict(X[valid]))['r2']
+    return name, candidate, score, time.perf_counter() - started
+
+
+def fit_final(workdir, name, params, seed, n_jobs, out_path):
+    data = _load(workdir, name)
+    started = time.perf_counter()
+    model = _regressor(params, seed, n_jobs).fit(data['X_train'], data['y_train'])
+    fitted = time.perf_counter()
+    holdout = regression_metrics(data['y_test'], model.predict(data['X_test']))
+    # Serving decides its own parallelism
+    model.set_params(n_jobs=None)
+    joblib.dump(model, out_path)
+    return name, holdout, fitted - started, os.path.getsize(out_path)
+
+
+def _version_dir(out_dir):
+    version = datetime.now().strftime('%Y%m%d-%H%M%S')
+    path = os.path.join(out_dir, version)
+    suffix = 1
+    while os.path.exists(path):
+        suffix += 1
+        path = os.path.join(out_dir, f'{version}-{suffix}')
+    return os.path.basename(path), path
+
+
+def train(names, strategy='random', n_iter=8, folds=3, search_rows=50000, test_size=0.2,
+          workers=None, seed=42, out_dir=ARTIFACTS_DIR, paths=DEFAULT_PATHS):
+    import sklearn
+
+    workers = workers or os.cpu_count() or 1
+    started = time.perf_counter()
+    df = load_dataset(paths.csv, paths.columns, paths.fallbacks)
+    schema = dataset_schema(df)
+    version, artifact_dir = _version_dir(out_dir)
+    os.makedirs(artifact_dir)
+    workdir = tempfile.mkdtemp(prefix='nestmetrics-train-')
+    try:
+        splits = {name: build_matrices(df, name, workdir, test_size, seed, schema) for name in names}
+        prepared = time.perf_counter()
+        print(f"✅ Prepared {len(names)} feature matrices in {prepared - started:.2f}s")
+
+        grid = {name: candidates(name, strategy, n_iter, seed) for name in names}
+        scores = {name: [[] for _ in grid[name]] for name in names}
+        fit_seconds = {name: [0.0 for _ in grid[name]] for name in names}
+        pending = {name: len(grid[name]) * folds if strategy != 'none' else 0 for name in names}
+        chosen = {}
+        results = {}
+        final_jobs = max(1, workers // len(names))
+
+        search = f"{sum(len(c) for c in grid.values())} candidates × {folds} folds" if strategy != 'none' else 'no search'
+        print(f"🚀 Training {', '.join(names)} on {workers} processes ({search})")
+        with ProcessPoolExecutor(workers) as pool:
+            def submit_final(name):
+                best = 0
+                if strategy != 'none':
+                    means = [np.mean(s) for s in scores[name]]
+                    best = int(np.argmax(means))
+                chosen[name] = best
+                return pool.submit(fit_final, workdir, name, grid[name][best], seed, final_jobs,
+                                   os.path.join(artifact_dir, f'{name}.pkl'))
+
+            # Biggest forests first so the long fits don't straggle at the end
+            tasks = [
+                (params.get('n_estimators', 100), name, candidate, params, fold)
+                for name in names
+                for candidate, params in enumerate(grid[name])
+                for fold in range(folds if strategy != 'none' else 0)
+            ]
+            tasks.sort(key=lambda task: -task[0])
+            futures = {
+                pool.submit(cv_fold, workdir, name, candidate, params, fold, folds,
+                            search_rows, seed): 'cv'
+                for _, name, candidate, params, fold in tasks
+            }
+            for name in names:
+                if pending[name] == 0:
+                    futures[submit_final(name)] = 'final'
+
+            while futures:
+                for future in as_completed(list(futures)):
+                    kind = futures.pop(future)
+                    if kind == 'cv':
+                        name, candidate, score, seconds = future.result()
+                        scores[name][candidate].append(score)
+                        fit_seconds[name][candidate] += seconds
+                        pending[name] -= 1
+                        if pending[name] == 0:
+                            print(f"✅ {name}: search done, refitting the best of {len(grid[name])} candidates")
+                            futures[submit_final(name)] = 'final'
+                            break
+                    else:
+                        name, holdout, seconds, size = future.result()
+                        results[name] = {'holdout': holdout, 'fit_s': round(seconds, 2), 'size_bytes': size}
+                        print(f"✅ {name}: holdout R² {holdout['r2']:.4f} (fit {seconds:.1f}s)")
+        finished = time.perf_counter()
+    except BaseException:
+        shutil.rmtree(artifact_dir, ignore_errors=True)
+        raise
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    models = {}
+    for name in names:
+        spec = TARGETS[name]
+        cv = [
+            {
+                'params': params,
+                'r2_mean': round(float(np.mean(s)), 4),
+                'r2_std': round(float(np.std(s)), 4),
+                'fit_s': round(fit_seconds[name][candidate], 2)
+            }
+            for candidate, (params, s) in enumerate(zip(grid[name], scores[name])) if s
+        ]
+        models[name] = {
+            'file': f'{name}.pkl',
+            'target': spec['target'],
+            'features': feature_names(name, schema),
+            'params': grid[name][chosen[name]],
+            'cv': cv,
+            **splits[name],
+            **results[name]
+        }
+
+    metadata = {
+        'version': version,
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'dataset_version': dataset_fingerprint(df),
+        'served_model': SERVED_MODEL if SERVED_MODEL in models else None,
+        'schema': schema,
+        'search': {
+            'strategy': strategy,
+            'folds': folds if strategy != 'none' else 0,
+            'rows': search_rows,
+            'test_size': test_size,
+            'seed': seed
+        },
+        'timing': {
+            'prepare_s': round(prepared - started, 2),
+            'train_s': round(finished - prepared, 2),
+            'total_s': round(finished - started, 2),
+            'fit_cpu_s': round(sum(sum(s) for s in fit_seconds.values()) + sum(r['fit_s'] for r in results.values()), 2),
+            'workers': workers
+        },
+        'environment': {
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'sklearn': sklearn.__version__
+        },
+        'models': models
+    }
+    with open(os.path.join(artifact_dir, METADATA), 'w') as f:
+        json.dump(metadata, f, indent=1)
+    print(f"✅ Artifacts written to {artifact_dir} in {finished - started:.1f}s")
+    return metadata, artifact_dir
+
+
+def read_metadata(artifact_dir):
+    with open(os.path.join(artifact_dir, METADATA)) as f:
+        return json.load(f)
+
+
+def publish(artifact_dir, paths=DEFAULT_PATHS, compile=True):
+    from forest import compile_model
+
+    model_path, schema_path = paths.model, paths.schema
+    metadata = read_metadata(artifact_dir)
+    if metadata.get('served_model') != SERVED_MODEL:
+        raise ValueError(f'{artifact_dir} has no {SERVED_MODEL} model to serve')
+    if schema_mismatch(metadata['schema']):
+        raise ValueError(f'{artifact_dir} was trained on a different feature schema')
+    served = metadata['models'][SERVED_MODEL]
+
+    # Schema first: a reload triggered by the new pickle must already see it
+    schema = {
+        **metadata['schema'],
+        'version': metadata['version'],
+        'dataset_version': metadata['dataset_version'],
+        'holdout': served['holdout']
+    }
+    tmp_path = schema_path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(schema, f, indent=1)
+    os.replace(tmp_path, schema_path)
+
+    tmp_path = model_path + '.tmp'
+    shutil.copyfile(os.path.join(artifact_dir, served['file']), tmp_path)
+    os.replace(tmp_path, model_path)
+    print(f"✅ Published {metadata['version']} to {model_path}")
+    if compile:
+        compile_model(model_path, paths.compiled)
+    return metadata
+
+
+def list_artifacts(out_dir=ARTIFACTS_DIR):
+    if not os.path.isdir(out_dir):
+        return []
+    found = []
+    for version in sorted(os.listdir(out_dir)):
+        path = os.path.join(out_dir, version)
+        if os.path.exists(os.path.join(path, METADATA)):
+            found.append(read_metadata(path))
+    return found
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='NestMetrics model training')
+    commands = parser.add_subparsers(dest='command', required=True)
+    train_cmd = commands.add_parser('train', help='Search hyperparameters and fit the models in parallel')
+    train_cmd.add_argument('--models', default=','.join(TARGETS), help=f"comma-separated subset of {', '.join(TARGETS)}")
+    train_cmd.add_argument('--search', choices=['random', 'grid', 'none'], default='random')
+    train_cmd.add_argument('--n-iter', type=int, default=8, help='sampled candidates per model for --search random')
+    train_cmd.add_argument('--folds', type=int, default=3)
+    train_cmd.add_argument('--search-rows', type=int, default=50000, help='training rows used for the CV search')
+    train_cmd.add_argument('--test-size', type=float, default=0.2)
+    train_cmd.add_argument('--workers', type=int, default=None)
+    train_cmd.add_argument('--seed', type=int, default=42)
+    train_cmd.add_argument('--no-publish', action='store_true', help="keep the served model unchanged")
+    publish_cmd = commands.add_parser('publish', help='Serve the price model of an earlier run')
+    publish_cmd.add_argument('version')
+    list_cmd = commands.add_parser('list', help='Show trained artifact versions')
+    for command in (train_cmd, publish_cmd, list_cmd):
+        command.add_argument('--market', default=DEFAULT_MARKET)
+        command.add_argument('--out', default=None, help='artifact directory (default: <market dir>/artifacts)')
+    args = parser.parse_args(argv)
+
+    try:
+        paths = market_paths(args.market)
+    except UnknownMarket as e:
+        print(f"❌ {e}")
+        return 1
+    out_dir = args.out or os.path.join(paths.root, ARTIFACTS)
+
+    if args.command == 'train':
+        names = [name.strip() for name in args.models.split(',') if name.strip()]
+        unknown = [name for name in names if name not in TARGETS]
+        if unknown or not names:
+            print(f"❌ Unknown models: {', '.join(unknown) or '(none)'}")
+            return 1
+        if args.folds < 2 and args.search != 'none':
+            print("❌ --folds must be at least 2")
+            return 1
+        metadata, artifact_dir = train(
+            names, args.search, args.n_iter, args.folds, args.search_rows, args.test_size,
+            args.workers, args.seed, out_dir, paths
+        )
+        if not args.no_publish and metadata['served_model']:
+            publish(artifact_dir, paths)
+    elif args.command == 'publish':
+        artifact_dir = os.path.join(out_dir, args.version)
+        if not os.path.exists(os.path.join(artifact_dir, METADATA)):
+            print(f"❌ Artifact not found: {artifact_dir}")
+            return 1
+        try:
+            publish(artifact_dir, paths)
+        except ValueError as e:
+            print(f"❌ {e}")
+            return 1
+    elif args.command == 'list':
+        current = None
+        if os.path.exists(paths.schema):
+            with open(paths.schema) as f:
+                current = json.load(f).get('version')
+        for metadata in list_artifacts(out_dir):
+            marker = '*' if metadata['version'] == current else ' '
+            scores = ', '.join(f"{name} R² {info['holdout']['r2']:.3f}" for name, info in metadata['models'].items())
+            print(f"{marker} {metadata['version']}  {metadata['timing']['total_s']:>7.1f}s  {scores}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
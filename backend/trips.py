@@ -0,0 +1,188 @@
+import numpy as np
+
+from segments import EMPTY_ROWS, ROOM_TYPE_COL
+
+# Multi-night trip planning over a per-borough (capacity, nightly cost) index.
+#
+#   nightly_cost = price + service fee
+#   nights       = max(trip length, the listing's minimum nights)
+#   total_cost   = nightly_cost * nights
+#
+# A stay fits the budget when nightly_cost * trip length <= budget and
+# nightly_cost * minimum nights <= budget; the second product doesn't depend on
+# the query, so it is stored per listing. Each borough's bookable listings are
+# sorted by guest capacity, then nightly cost, so every capacity level is one
+# contiguous cost-sorted block: "fits N guests under $X/night" is a binary
+# search per level, and only those prefixes are checked against minimum stays.
+# Cheapest stays are ranked from the front of the cost order and best-value
+# ones by walking a reviews-descending order, both stopping once nothing
+# further along can make the top K.
+#
+# The dataset has no guest count, so capacity comes from the room type unless
+# an 'accommodates' column is present.
+
+CAPACITY_COL = 'accommodates'
+SERVICE_FEE_COL = 'service_fee_$'
+MIN_NIGHTS_COL = 'minimum nights'
+ROOM_CAPACITY = {'Entire home/apt': 4, 'Hotel room': 2, 'Private room': 2, 'Shared room': 1}
+TRIP_PICKS = 3
+SCAN_CHUNK = 1024
+# Cost prefixes up to this long are ranked directly instead of walked by reviews
+DIRECT_SCAN = 8 * SCAN_CHUNK
+MAX_TRIP_NIGHTS = 365
+
+
+def _numeric(df, name, default, rows=None):
+    if name not in df.columns:
+        return np.full(len(df) if rows is None else len(rows), default, dtype=float)
+    values = df[name].to_numpy()
+    values = (values if rows is None else values[rows]).astype(float)
+    return np.where(np.isnan(values), default, values)
+
+
+def _min_nights(df, rows=None):
+    return np.maximum(_numeric(df, MIN_NIGHTS_COL, 1.0, rows), 1.0)
+
+
+def guest_capacity(df, room_type_col=ROOM_TYPE_COL):
+    if CAPACITY_COL in df.columns:
+        return df[CAPACITY_COL].to_numpy(dtype=float, na_value=np.nan)
+    if room_type_col not in df.columns:
+        return np.full(len(df), np.nan)
+    return df[room_type_col].map(ROOM_CAPACITY).to_numpy(dtype=float, na_value=np.nan)
+
+
+class TripIndex:
+    def __init__(self, df, segments, deals):
+        self.df = df
+        self.segments = segments
+        self.deals = deals
+        fees = _numeric(df, SERVICE_FEE_COL, 0.0)
+        min_nights = _min_nights(df)
+        costs = segments.prices + fees
+        capacity = guest_capacity(df)
+        bookable = ~np.isnan(costs) & ~np.isnan(capacity)
+
+        # Per borough, in (capacity, cost) order: rows, nightly costs, minimum
+        # stay costs, reviews, each level's reviews-descending order (positions
+        # in the block) and the level bounds
+        self._blocks = {}
+        for neighborhood in segments.neighborhoods():
+            rows = segments.rows(neighborhood=neighborhood)
+            rows = rows[bookable[rows]]
+            rows = rows[np.lexsort((rows, costs[rows], capacity[rows]))]
+            levels, starts = np.unique(capacity[rows], return_index=True)
+            bounds = np.append(starts, len(rows))
+            reviews = deals.reviews[rows]
+            by_reviews = np.concatenate([
+                start + np.argsort(-reviews[start:end], kind='stable') for start, end in zip(bounds[:-1], bounds[1:])
+            ]).astype(rows.dtype) if len(rows) else EMPTY_ROWS
+            self._blocks[neighborhood] = {
+                'rows': rows,
+                'costs': costs[rows],
+                'stays': costs[rows] * min_nights[rows],
+                'reviews': reviews,
+                'by_reviews': by_reviews,
+                'levels': levels,
+                'bounds': bounds
+            }
+
+    def neighborhoods(self):
+        return list(self._blocks)
+
+    def fits(self, neighborhood, guests):
+        block = self._blocks.get(neighborhood)
+        return block is not None and bool(len(block['levels'])) and block['levels'][-1] >= guests
+
+    def _spans(self, block, guests, budget, nights):
+        # (start, stop) of each capacity level's listings with nightly cost <= budget / nights
+        levels, bounds, costs = block['levels'], block['bounds'], block['costs']
+        for level in range(int(np.searchsorted(levels, guests)), len(levels)):
+            start, end = bounds[level], bounds[level + 1]
+            yield start, start + int(np.searchsorted(costs[start:end], budget / nights, side='right'))
+
+    def count(self, neighborhood, guests, budget, nights):
+        block = self._blocks.get(neighborhood)
+        if block is None:
+            return 0
+        stays = block['stays']
+        return sum(int(np.count_nonzero(stays[start:stop] <= budget)) for start, stop in self._spans(block, guests, budget, nights))
+
+    def plan(self, neighborhood, guests, budget, nights, k=TRIP_PICKS):
+        block = self._blocks.get(neighborhood)
+        spans = list(self._spans(block, guests, budget, nights)) if block is not None else []
+        costs, stays = (block['costs'], block['stays']) if block is not None else (None, None)
+        found, cost_sum, trip_sum = 0, 0.0, 0.0
+        cheapest, best_value = [], []
+        for start, stop in spans:
+            within = stays[start:stop] <= budget
+            found += int(np.count_nonzero(within))
+            cost_sum += float(np.sum(costs[start:stop], where=within))
+            trip_sum += float(np.sum(np.maximum(costs[start:stop] * nights, stays[start:stop]), where=within))
+            fitting = start + np.flatnonzero(within)
+            cheapest.append(self._cheapest(block, start, stop, fitting, nights, k))
+            best_value.append(fitting if stop - start <= DIRECT_SCAN else self._best_value(block, start, budget, nights, k))
+        positions = np.concatenate(cheapest) if cheapest else EMPTY_ROWS
+        best_value = np.concatenate(best_value) if best_value else EMPTY_ROWS
+        return {
+            'options_found': found,
+            'avg_nightly_cost': cost_sum / found if found else None,
+            'avg_trip_cost': trip_sum / found if found else None,
+            # Cheapest stay first; most reviewed per month first, then cheapest; then dataset order
+            'budget_picks': self.records(block, nights, positions, _ranked(k, self._totals(block, positions, nights), block['rows'][positions]) if found else []),
+            'best_value': self.records(block, nights, best_value, _ranked(k, -block['reviews'][best_value], self._totals(block, best_value, nights), block['rows'][best_value]) if found else [])
+        }
+
+    def _totals(self, block, positions, nights):
+        return np.maximum(block['costs'][positions] * nights, block['stays'][positions])
+
+    def _cheapest(self, block, start, stop, fitting, nights, k):
+        # A stay costs at least nightly_cost * nights, so once the K-th cheapest
+        # total among the cheapest fitting listings is known, listings whose
+        # nightly cost alone exceeds it can be skipped
+        if len(fitting) <= k:
+            return fitting
+        bound = np.partition(self._totals(block, fitting[:SCAN_CHUNK], nights), k - 1)[k - 1]
+        last = start + int(np.searchsorted(block['costs'][start:stop], bound / nights, side='right'))
+        return fitting[fitting < last]
+
+    def _best_value(self, block, start, budget, nights, k):
+        # Walk the level in reviews-descending order until K fitting listings
+        # are found and the next reviews value is below the K-th's
+        costs, stays, reviews = block['costs'], block['stays'], block['reviews']
+        end = block['bounds'][np.searchsorted(block['bounds'], start, side='right')]
+        order = block['by_reviews'][start:end]
+        hits, count = [], 0
+        for chunk in range(0, len(order), SCAN_CHUNK):
+            if count >= k and reviews[order[chunk]] < kth:
+                break
+            positions = order[chunk:chunk + SCAN_CHUNK]
+            hits.append(positions[(costs[positions] * nights <= budget) & (stays[positions] <= budget)])
+            count += len(hits[-1])
+            if count >= k:
+                kth = reviews[np.concatenate(hits)[k - 1]]
+        return np.concatenate(hits) if hits else EMPTY_ROWS
+
+    def records(self, block, nights, positions, picks):
+        # Fees and minimum stays are only read for the picks, from the frame
+        names = self.deals.names
+        positions = positions[picks]
+        rows = block['rows'][positions]
+        fees, min_nights = _numeric(self.df, SERVICE_FEE_COL, 0.0, rows), _min_nights(self.df, rows)
+        records = []
+        for i, (position, row) in enumerate(zip(positions, rows)):
+            records.append({
+                'name': names.iloc[row] if names is not None else None,
+                'price': float(self.segments.prices[row]),
+                'service_fee': float(fees[i]),
+                'minimum_nights': int(min_nights[i]),
+                'nights': int(max(min_nights[i], nights)),
+                'total_cost': round(float(max(block['costs'][position] * nights, block['stays'][position])), 2),
+                'reviews_per_month': float(block['reviews'][position])
+            })
+        return records
+
+
+def _ranked(k, *keys):
+    # Positions of the k smallest by keys, first key first
+    return np.lexsort(tuple(reversed(keys)))[:k]
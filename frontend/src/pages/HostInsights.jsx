@@ -36,8 +36,8 @@ function HostInsights() {
 
   const fetchTopHosts = async () => {
     try {
-      const response = await api.get('/api/top-hosts')
-      setTopHosts(response.data || [])
+      const response = await api.get('/api/top-hosts?limit=6')
+      setTopHosts(response.data?.hosts || [])
     } catch (error) {
       console.error('Error fetching top hosts:', error)
       // Fallback data if API fails